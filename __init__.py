@@ -1,3 +1,7 @@
+import time
+
+_import_start = time.perf_counter()
+
 import server
 from .config import config
 from .services.workflow_service import WorkflowService
@@ -5,23 +9,38 @@ from .controllers.websocket_controller import WebSocketController
 from .controllers.workflow_controller import WorkflowController
 from .controllers.app_controller import AppController
 from .utils.helpers import connect_print
+from .utils.timing import ExecutionTimer
+from .utils.loop_monitor import loop_monitor
 
 WEB_DIRECTORY = "./js"
 NODE_CLASS_MAPPINGS = {}
 __all__ = ["NODE_CLASS_MAPPINGS"]
 version = "V0.0.1"
 
-connect_print(f"Loading: ComfyUI Connect ({version})")
+# Startup phases are timed, as they add to the ComfyUI startup
+loading_timer = ExecutionTimer("loading")
+loading_timer.phases["imports"] = time.perf_counter() - _import_start
 
-# Initialize services
-manager = WorkflowService()
+# Initialize services (nothing is read from disk before startup)
+with loading_timer.phase("services"):
+    manager = WorkflowService()
 
 # Initialize controllers
-websocket_controller = WebSocketController(manager)
-workflow_controller = WorkflowController(manager)
-app_controller = AppController(manager)
+with loading_timer.phase("routes"):
+    websocket_controller = WebSocketController(manager)
+    workflow_controller = WorkflowController(manager)
+    app_controller = AppController(manager)
+
+connect_print(f"Loading: ComfyUI Connect ({version}) | {loading_timer.format_phases()}")
 
-async def init_socketio(app):
-    await websocket_controller.initialize(app)
+async def on_startup(app):
+    startup_timer = ExecutionTimer("startup")
+    loop_monitor.start()
+    with startup_timer.phase("workflows"):
+        await manager.start()
+    with startup_timer.phase("gateway"):
+        await websocket_controller.initialize(app)
+    startup_timer.set("indexed", len(manager.workflows))
+    connect_print(f"Started: ComfyUI Connect | {startup_timer.format_phases()}")
 
-server.PromptServer.instance.app.on_startup.append(init_socketio)
+server.PromptServer.instance.app.on_startup.append(on_startup)
@@ -0,0 +1,394 @@
+"""
+Fake ComfyUI server, to benchmark ComfyUI-Connect without GPUs.
+
+It implements the endpoints and websocket messages the connector relies on (/prompt, /ws, /history,
+/view, /queue, /interrupt). Prompts are executed one at a time like on a single GPU, each node taking
+its share of a configurable execution time, and output nodes produce outputs of a configurable size
+(PNG images, or MP4 videos for video nodes, also written to --output-dir when given).
+Failures (execution_error) and websocket drops can be injected at a given rate. Given a fake GPU
+(benchmarks/fake_nvml.py), nodes allocate GPU memory while their prompt runs. Sampler nodes can send
+binary preview frames, like ComfyUI with previews enabled.
+
+Standalone usage:
+    python benchmarks/fake_comfyui.py --port 8189 --exec-time 0.5 --output-size 524288
+"""
+import os
+import json
+import uuid
+import struct
+import random
+import asyncio
+import argparse
+from collections import OrderedDict, deque
+from aiohttp import web, WSMsgType
+
+OUTPUT_CLASSES = ("SaveImage", "PreviewImage")
+VIDEO_CLASSES = ("VHS_VideoCombine", "SaveVideo")
+SAMPLER_CLASSES = ("KSampler", "KSamplerAdvanced", "SamplerCustom", "SamplerCustomAdvanced")
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class FakeComfyUI:
+    """
+    In-memory ComfyUI stand-in.
+
+    :param exec_time: Seconds a prompt takes to execute.
+    :param exec_jitter: Relative random variation of the execution time (0.2 => +/-20%).
+    :param output_size: Size in bytes of each output file.
+    :param outputs_per_node: Number of outputs produced by each output node (batch size).
+    :param failure_rate: Probability for a prompt to fail with an execution_error.
+    :param drop_rate: Probability for the websocket connections to be dropped while a prompt executes.
+    :param seed: Optional random seed, for reproducible runs.
+    :param exec_time_source: Optional callable returning the execution time of each queued prompt
+                             (e.g. replayed from a traffic trace), instead of `exec_time`.
+    :param output_dir: Optional directory the video outputs are written to, like ComfyUI's output
+                       directory (for a connector sharing it to serve them from disk).
+    :param gpu: Optional fake GPU (fake_nvml.FakeGpu) the prompts allocate memory on.
+    :param vram: MB allocated on `gpu` by the nodes of each class, from their execution to the end
+                 of their prompt (e.g. {"CheckpointLoaderSimple": 6000}).
+    :param preview_frames: Preview frames sent while each sampler node runs.
+    :param preview_size: Size in bytes of each preview frame (a JPEG stand-in).
+    :param preview_metadata: Send the frames with their prompt and node (newer ComfyUI), or without
+                             (the frames then belong to the prompt being executed).
+    """
+
+    MAX_HISTORY = 10000
+
+    def __init__(
+        self,
+        exec_time: float = 0.5,
+        exec_jitter: float = 0.0,
+        output_size: int = 512 * 1024,
+        outputs_per_node: int = 1,
+        failure_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: int = None,
+        exec_time_source=None,
+        output_dir: str = None,
+        gpu=None,
+        vram: dict = None,
+        preview_frames: int = 0,
+        preview_size: int = 16 * 1024,
+        preview_metadata: bool = True,
+    ):
+        self.exec_time = exec_time
+        self.exec_time_source = exec_time_source
+        self.output_dir = output_dir
+        self.gpu = gpu
+        self.vram = vram or {}
+        self.preview_frames = preview_frames
+        self.preview_metadata = preview_metadata
+        self.preview = b"\xff\xd8\xff" + os.urandom(max(preview_size - 5, 0)) + b"\xff\xd9"
+        self.exec_jitter = exec_jitter
+        self.outputs_per_node = outputs_per_node
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.output = PNG_SIGNATURE + os.urandom(max(output_size - len(PNG_SIGNATURE), 0))
+
+        self.stats = {
+            "prompts": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "interrupted": 0,
+            "deleted": 0,
+            "drops": 0,
+            "previews": 0,
+        }
+        self._queue = deque()  # (prompt_id, number, prompt, client_id)
+        self._running = None  # (prompt_id, number, prompt, client_id)
+        self._exec_times = {}  # prompt_id => execution time, when given by exec_time_source
+        self._interrupt = False
+        self._history: "OrderedDict[str, dict]" = OrderedDict()
+        self._sockets = {}  # client_id => set of websockets
+        self._wakeup = asyncio.Event()
+        self._number = 0
+        self._worker_task = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=1024**3)
+        app.add_routes(
+            [
+                web.get("/ws", self.websocket),
+                web.post("/prompt", self.post_prompt),
+                web.get("/history/{prompt_id}", self.get_history),
+                web.get("/view", self.view),
+                web.get("/queue", self.get_queue),
+                web.post("/queue", self.post_queue),
+                web.post("/interrupt", self.interrupt),
+            ]
+        )
+        app.on_startup.append(self._start)
+        app.on_cleanup.append(self._stop)
+        return app
+
+    async def _start(self, app):
+        self._worker_task = asyncio.create_task(self._worker())
+
+    async def _stop(self, app):
+        if self._worker_task:
+            self._worker_task.cancel()
+        for sockets in list(self._sockets.values()):
+            for ws in list(sockets):
+                await ws.close()
+
+    async def _send(self, client_id: str, message_type: str, data: dict) -> None:
+        message = json.dumps({"type": message_type, "data": data})
+        for ws in list(self._sockets.get(client_id, ())):
+            if not ws.closed:
+                try:
+                    await ws.send_str(message)
+                except ConnectionError:
+                    pass
+
+    async def _send_preview(self, client_id: str, prompt_id: str, node_id: str) -> None:
+        if self.preview_metadata:
+            metadata = json.dumps(
+                {"node_id": node_id, "display_node_id": node_id, "prompt_id": prompt_id, "image_type": "image/jpeg"}
+            ).encode("utf-8")
+            message = struct.pack(">II", 4, len(metadata)) + metadata + self.preview
+        else:
+            message = struct.pack(">II", 1, 1) + self.preview
+        self.stats["previews"] += 1
+        for ws in list(self._sockets.get(client_id, ())):
+            if not ws.closed:
+                try:
+                    await ws.send_bytes(message)
+                except ConnectionError:
+                    pass
+
+    async def _drop_connections(self) -> None:
+        self.stats["drops"] += 1
+        for sockets in list(self._sockets.values()):
+            for ws in list(sockets):
+                await ws.close()
+
+    async def _worker(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            self._running = self._queue.popleft()
+            try:
+                await self._execute(*self._running)
+            finally:
+                self._running = None
+
+    async def _execute(self, prompt_id: str, number: int, prompt: dict, client_id: str) -> None:
+        self._interrupt = False
+        await self._send(client_id, "execution_start", {"prompt_id": prompt_id})
+        await self._send(client_id, "execution_cached", {"prompt_id": prompt_id, "nodes": []})
+
+        duration = self._exec_times.pop(prompt_id, self.exec_time)
+        duration *= 1 + self.random.uniform(-self.exec_jitter, self.exec_jitter)
+        node_time = max(duration, 0) / max(len(prompt), 1)
+        fail_at = self.random.randrange(len(prompt)) if self.random.random() < self.failure_rate else None
+        drop_at = self.random.randrange(len(prompt)) if self.random.random() < self.drop_rate else None
+
+        outputs = {}
+        status = "success"
+        allocated = 0.0
+        for index, (node_id, node) in enumerate(prompt.items()):
+            await self._send(client_id, "executing", {"node": node_id, "prompt_id": prompt_id})
+            vram = self.vram.get(node.get("class_type")) if self.gpu is not None else None
+            frames = self.preview_frames if node.get("class_type") in SAMPLER_CLASSES else 0
+            steps = max(frames, 2 if vram else 1)
+            for step in range(steps):
+                await asyncio.sleep(node_time / steps)
+                if vram and step == 0:
+                    # Allocated while the node runs, like a model being loaded
+                    self.gpu.allocate(vram)
+                    allocated += vram
+                if frames:
+                    await self._send_preview(client_id, prompt_id, node_id)
+            if index == drop_at:
+                await self._drop_connections()
+            if self._interrupt:
+                status = "error"
+                self.stats["interrupted"] += 1
+                await self._send(client_id, "execution_interrupted", {"prompt_id": prompt_id, "node_id": node_id})
+                break
+            if index == fail_at:
+                status = "error"
+                self.stats["failed"] += 1
+                await self._send(
+                    client_id,
+                    "execution_error",
+                    {"prompt_id": prompt_id, "node_id": node_id, "exception_message": "Injected failure"},
+                )
+                break
+            if node.get("class_type") in OUTPUT_CLASSES:
+                images = [
+                    {"filename": f"{prompt_id}_{node_id}_{i}.png", "subfolder": "", "type": "output"}
+                    for i in range(self.outputs_per_node)
+                ]
+                outputs[node_id] = {"images": images}
+            elif node.get("class_type") in VIDEO_CLASSES:
+                videos = [
+                    {
+                        "filename": f"{prompt_id}_{node_id}_{i}.mp4",
+                        "subfolder": "",
+                        "type": "output",
+                        "format": "video/h264-mp4",
+                    }
+                    for i in range(self.outputs_per_node)
+                ]
+                if self.output_dir:
+                    for video in videos:
+                        with open(os.path.join(self.output_dir, video["filename"]), "wb") as file:
+                            file.write(self.output)
+                outputs[node_id] = {"gifs": videos}
+            if node_id in outputs:
+                await self._send(
+                    client_id, "executed", {"node": node_id, "prompt_id": prompt_id, "output": outputs[node_id]}
+                )
+
+        if allocated:
+            self.gpu.free(allocated)
+        if status == "success":
+            self.stats["succeeded"] += 1
+        self._history[prompt_id] = {
+            "prompt": [number, prompt_id, prompt, {"client_id": client_id}, list(outputs)],
+            "outputs": outputs,
+            "status": {"status_str": status, "completed": status == "success", "messages": []},
+        }
+        while len(self._history) > self.MAX_HISTORY:
+            self._history.popitem(last=False)
+        # Like ComfyUI, the end of a prompt is always notified, even after an error
+        await self._send(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        client_id = request.query.get("clientId") or uuid.uuid4().hex
+        self._sockets.setdefault(client_id, set()).add(ws)
+        await ws.send_str(json.dumps({"type": "status", "data": {"sid": client_id}}))
+        try:
+            async for message in ws:
+                if message.type == WSMsgType.ERROR:
+                    break
+        finally:
+            self._sockets.get(client_id, set()).discard(ws)
+        return ws
+
+    async def post_prompt(self, request):
+        data = await request.json()
+        prompt = data.get("prompt")
+        if not isinstance(prompt, dict) or not prompt:
+            return web.json_response({"error": {"type": "prompt_no_outputs"}, "node_errors": {}}, status=400)
+
+        prompt_id = data.get("prompt_id") or str(uuid.uuid4())
+        self._number += 1
+        self._queue.append((prompt_id, self._number, prompt, data.get("client_id")))
+        if self.exec_time_source is not None:
+            exec_time = self.exec_time_source(prompt)
+            if exec_time is not None:
+                self._exec_times[prompt_id] = exec_time
+        self.stats["prompts"] += 1
+        self._wakeup.set()
+        return web.json_response({"prompt_id": prompt_id, "number": self._number, "node_errors": {}})
+
+    async def get_history(self, request):
+        prompt_id = request.match_info["prompt_id"]
+        entry = self._history.get(prompt_id)
+        return web.json_response({prompt_id: entry} if entry else {})
+
+    async def view(self, request):
+        # Streamed like ComfyUI's FileResponse, a single write of a large body would block the shared loop
+        response = web.StreamResponse()
+        response.content_type = "video/mp4" if request.query.get("filename", "").endswith(".mp4") else "image/png"
+        response.content_length = len(self.output)
+        await response.prepare(request)
+        view = memoryview(self.output)
+        for offset in range(0, len(view), 256 * 1024):
+            await response.write(view[offset:offset + 256 * 1024])
+        await response.write_eof()
+        return response
+
+    def _queue_item(self, item) -> list:
+        prompt_id, number, prompt, client_id = item
+        return [number, prompt_id, prompt, {"client_id": client_id}, []]
+
+    async def get_queue(self, request):
+        return web.json_response(
+            {
+                "queue_running": [self._queue_item(self._running)] if self._running else [],
+                "queue_pending": [self._queue_item(item) for item in self._queue],
+            }
+        )
+
+    async def post_queue(self, request):
+        data = await request.json()
+        if data.get("clear"):
+            self.stats["deleted"] += len(self._queue)
+            self._queue.clear()
+        delete = set(data.get("delete", []))
+        if delete:
+            kept = [item for item in self._queue if item[0] not in delete]
+            self.stats["deleted"] += len(self._queue) - len(kept)
+            self._queue = deque(kept)
+        return web.Response(status=200)
+
+    async def interrupt(self, request):
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            data = {}
+        if self._running and data.get("prompt_id") in (None, self._running[0]):
+            self._interrupt = True
+        return web.Response(status=200)
+
+
+async def start_fake_comfyui(fake: FakeComfyUI, host: str = "127.0.0.1", port: int = 8189) -> web.AppRunner:
+    """Starts the fake server in the running event loop, returns its runner (call `cleanup()` to stop it)"""
+    runner = web.AppRunner(fake.make_app(), shutdown_timeout=0.5)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def add_fake_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("fake ComfyUI")
+    group.add_argument("--exec-time", type=float, default=0.5, help="seconds per prompt (default: 0.5)")
+    group.add_argument("--exec-jitter", type=float, default=0.0, help="relative execution time variation")
+    group.add_argument("--output-size", type=int, default=512 * 1024, help="bytes per output (default: 512KiB)")
+    group.add_argument("--outputs-per-node", type=int, default=1, help="outputs per output node (default: 1)")
+    group.add_argument("--failure-rate", type=float, default=0.0, help="probability of execution_error")
+    group.add_argument("--drop-rate", type=float, default=0.0, help="probability of websocket drop per prompt")
+    group.add_argument("--seed", type=int, default=None, help="random seed")
+    group.add_argument("--output-dir", help="directory the video outputs are written to")
+    group.add_argument("--preview-frames", type=int, default=0, help="preview frames per sampler node")
+    group.add_argument("--preview-size", type=int, default=16 * 1024, help="bytes per preview frame")
+    group.add_argument("--preview-no-metadata", action="store_true", help="send frames without prompt and node")
+
+
+def fake_from_arguments(args) -> FakeComfyUI:
+    return FakeComfyUI(
+        exec_time=args.exec_time,
+        exec_jitter=args.exec_jitter,
+        output_size=args.output_size,
+        outputs_per_node=args.outputs_per_node,
+        failure_rate=args.failure_rate,
+        drop_rate=args.drop_rate,
+        seed=args.seed,
+        output_dir=args.output_dir,
+        preview_frames=args.preview_frames,
+        preview_size=args.preview_size,
+        preview_metadata=not args.preview_no_metadata,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8189)
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    fake = fake_from_arguments(args)
+    print(f"Fake ComfyUI listening on http://{args.host}:{args.port}")
+    web.run_app(fake.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
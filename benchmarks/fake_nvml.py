@@ -0,0 +1,123 @@
+"""
+Fake pynvml module, to try the GPU telemetry, the VRAM profiles and the VRAM admission without GPUs.
+
+`install()` registers this module as `pynvml` in the current process, with simulated GPUs whose used
+memory is set by the caller, or by a fake ComfyUI given the same GPU (see `FakeComfyUI(gpu=...)`):
+
+    gpu = fake_nvml.FakeGpu(total_mb=24576)
+    fake_nvml.install([gpu])
+    fake = FakeComfyUI(gpu=gpu, vram={"CheckpointLoaderSimple": 6000, "KSampler": 2000})
+
+Only the memory, name, utilization and temperature are simulated, the other queries raise NVMLError
+like on GPUs not supporting them.
+"""
+import sys
+import types
+
+NVML_TEMPERATURE_GPU = 0
+NVML_CLOCK_GRAPHICS = 0
+NVML_CLOCK_SM = 1
+NVML_CLOCK_MEM = 2
+NVML_PCIE_UTIL_TX_BYTES = 0
+NVML_PCIE_UTIL_RX_BYTES = 1
+NVML_MEMORY_ERROR_TYPE_UNCORRECTED = 1
+NVML_VOLATILE_ECC = 0
+NVML_AGGREGATE_ECC = 1
+
+
+class NVMLError(Exception):
+    pass
+
+
+class FakeGpu:
+    """
+    A simulated GPU.
+
+    :param total_mb: Memory of the GPU, in MB.
+    :param used_mb: Memory used when idle (driver, other processes), in MB.
+    """
+
+    def __init__(self, total_mb: float = 24576, used_mb: float = 512, name: str = "Fake GPU"):
+        self.name = name
+        self.total = int(total_mb * 1024**2)
+        self.idle = int(used_mb * 1024**2)
+        self.used = self.idle
+        self.stats = {"queries": 0, "peak_mb": used_mb}
+
+    def allocate(self, mb: float) -> None:
+        self.used = min(self.used + int(mb * 1024**2), self.total)
+        self.stats["peak_mb"] = max(self.stats["peak_mb"], self.used / 1024**2)
+
+    def free(self, mb: float) -> None:
+        self.used = max(self.used - int(mb * 1024**2), self.idle)
+
+
+gpus = [FakeGpu()]
+_initialized = 0
+
+
+def install(fake_gpus: list = None) -> types.ModuleType:
+    """Registers this module as `pynvml`, with the given GPUs (one default GPU otherwise)"""
+    global gpus
+    if fake_gpus is not None:
+        gpus = list(fake_gpus)
+    module = sys.modules[__name__]
+    sys.modules["pynvml"] = module
+    return module
+
+
+def _check() -> None:
+    if not _initialized:
+        raise NVMLError("NVML not initialized")
+
+
+def nvmlInit() -> None:
+    global _initialized
+    _initialized += 1
+
+
+def nvmlShutdown() -> None:
+    global _initialized
+    _check()
+    _initialized -= 1
+
+
+def nvmlDeviceGetCount() -> int:
+    _check()
+    return len(gpus)
+
+
+def nvmlDeviceGetHandleByIndex(index: int) -> FakeGpu:
+    _check()
+    if not 0 <= index < len(gpus):
+        raise NVMLError("Invalid Argument")
+    return gpus[index]
+
+
+def nvmlDeviceGetName(handle: FakeGpu) -> str:
+    return handle.name
+
+
+def nvmlDeviceGetMemoryInfo(handle: FakeGpu):
+    _check()
+    handle.stats["queries"] += 1
+    return types.SimpleNamespace(total=handle.total, used=handle.used, free=handle.total - handle.used)
+
+
+def nvmlDeviceGetUtilizationRates(handle: FakeGpu):
+    busy = handle.used > handle.idle
+    return types.SimpleNamespace(gpu=100 if busy else 0, memory=100 if busy else 0)
+
+
+def nvmlDeviceGetTemperature(handle: FakeGpu, sensor: int) -> int:
+    return 70 if handle.used > handle.idle else 40
+
+
+def __getattr__(name: str):
+    # Queries not simulated are not supported, like some of them on real GPUs
+    if name.startswith("nvmlDevice"):
+        def unsupported(*args, **kwargs):
+            raise NVMLError("Not Supported")
+
+        return unsupported
+    raise AttributeError(name)
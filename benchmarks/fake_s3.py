@@ -0,0 +1,127 @@
+"""
+Fake S3-compatible object store, to benchmark and try the S3 result sink without MinIO or AWS.
+
+It implements, in memory and with path-style URLs, what the sink uses: PutObject, HeadObject, GetObject
+and the multipart uploads (create, upload part, complete, abort). Requests are not authenticated,
+any credentials are accepted. An optional latency is added to each request, like a remote store.
+
+Standalone usage:
+    python benchmarks/fake_s3.py --port 9000
+
+Then, in comfy.settings.json:
+    "Connect.ResultSinks": {"s3": {"type": "s3", "bucket": "outputs", "endpoint_url": "http://127.0.0.1:9000",
+                                   "access_key": "fake", "secret_key": "fake", "region": "us-east-1"}}
+"""
+import uuid
+import asyncio
+import hashlib
+import argparse
+from xml.sax.saxutils import escape
+from aiohttp import web
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>'
+
+
+def _xml(body: str, status: int = 200) -> web.Response:
+    return web.Response(text=XML_HEADER + body, status=status, content_type="application/xml")
+
+
+def _error(code: str, status: int) -> web.Response:
+    return _xml(f"<Error><Code>{code}</Code><Message>{code}</Message></Error>", status)
+
+
+class FakeS3:
+    """
+    In-memory S3 stand-in.
+
+    :param latency: Seconds added to each request.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.objects = {}  # (bucket, key) => (content type, bytes)
+        self.uploads = {}  # upload id => (bucket, key, content type, {part number: bytes})
+        self.stats = {"requests": 0, "puts": 0, "multipart": 0, "parts": 0, "aborted": 0, "bytes": 0}
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=1024**3)
+        app.add_routes([web.route("*", "/{bucket}/{key:.+}", self.handle)])
+        return app
+
+    async def handle(self, request):
+        self.stats["requests"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        bucket, key = request.match_info["bucket"], request.match_info["key"]
+        query = request.query
+
+        if request.method == "POST" and "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self.uploads[upload_id] = (bucket, key, request.content_type, {})
+            self.stats["multipart"] += 1
+            return _xml(
+                f"<InitiateMultipartUploadResult><Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            )
+        if "uploadId" in query:
+            upload = self.uploads.get(query["uploadId"])
+            if upload is None:
+                return _error("NoSuchUpload", 404)
+            if request.method == "PUT":
+                data = await request.read()
+                upload[3][int(query["partNumber"])] = data
+                self.stats["parts"] += 1
+                self.stats["bytes"] += len(data)
+                return web.Response(headers={"ETag": f'"{hashlib.md5(data).hexdigest()}"'})
+            if request.method == "DELETE":
+                del self.uploads[query["uploadId"]]
+                self.stats["aborted"] += 1
+                return web.Response(status=204)
+            if request.method == "POST":
+                await request.read()
+                del self.uploads[query["uploadId"]]
+                content = b"".join(data for _, data in sorted(upload[3].items()))
+                self.objects[(bucket, key)] = (upload[2], content)
+                return _xml(
+                    f"<CompleteMultipartUploadResult><Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                    f'<ETag>"{hashlib.md5(content).hexdigest()}"</ETag></CompleteMultipartUploadResult>'
+                )
+
+        if request.method == "PUT":
+            data = await request.read()
+            self.objects[(bucket, key)] = (request.content_type, data)
+            self.stats["puts"] += 1
+            self.stats["bytes"] += len(data)
+            return web.Response(headers={"ETag": f'"{hashlib.md5(data).hexdigest()}"'})
+        if request.method in ("GET", "HEAD"):
+            stored = self.objects.get((bucket, key))
+            if stored is None:
+                return web.Response(status=404) if request.method == "HEAD" else _error("NoSuchKey", 404)
+            content_type, data = stored
+            if request.method == "HEAD":
+                return web.Response(headers={"Content-Type": content_type, "Content-Length": str(len(data))})
+            return web.Response(body=data, content_type=content_type)
+        return _error("NotImplemented", 501)
+
+
+async def start_fake_s3(fake: FakeS3, host: str = "127.0.0.1", port: int = 9000) -> web.AppRunner:
+    """Starts the fake store in the running event loop, returns its runner (call `cleanup()` to stop it)"""
+    runner = web.AppRunner(fake.make_app(), shutdown_timeout=0.5)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to each request")
+    args = parser.parse_args()
+
+    print(f"Fake S3 listening on http://{args.host}:{args.port}")
+    web.run_app(FakeS3(args.latency).make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Hosts ComfyUI-Connect outside of ComfyUI, for benchmarks.
+
+The package only needs two ComfyUI modules: `server` (for PromptServer.instance.routes and app)
+and `folder_paths` (for the user, input and output directories). Minimal versions of both are
+registered, pointing at a working directory, then the package is imported and its routes are served
+by aiohttp, with the connector talking to a (fake or real) ComfyUI and optionally to a gateway.
+"""
+import os
+import sys
+import json
+import types
+import importlib.util
+from aiohttp import web
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "comfyui_connect"
+WORKFLOWS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workflows")
+
+
+def load_workflows(path: str = WORKFLOWS_PATH) -> dict:
+    """Returns the benchmark workflows, keyed by name"""
+    workflows = {}
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith(".json"):
+            with open(os.path.join(path, filename), "r", encoding="utf-8") as file:
+                workflows[filename[: -len(".json")]] = json.load(file)
+    return workflows
+
+
+def _install_comfy_modules(base_dir: str) -> None:
+    if "server" in sys.modules or "folder_paths" in sys.modules:
+        raise RuntimeError("ComfyUI modules are already loaded, the connector can't be hosted in this process.")
+
+    directories = {name: os.path.join(base_dir, name) for name in ("user", "input", "output", "temp")}
+    for directory in directories.values():
+        os.makedirs(directory, exist_ok=True)
+
+    folder_paths = types.ModuleType("folder_paths")
+    folder_paths.folder_names_and_paths = {}
+    folder_paths.get_user_directory = lambda: directories["user"]
+    folder_paths.get_input_directory = lambda: directories["input"]
+    folder_paths.get_output_directory = lambda: directories["output"]
+    folder_paths.get_temp_directory = lambda: directories["temp"]
+    folder_paths.get_full_path = lambda folder_name, filename: None
+    sys.modules["folder_paths"] = folder_paths
+
+    server = types.ModuleType("server")
+
+    class PromptServer:
+        instance = None
+
+        def __init__(self):
+            self.app = web.Application(client_max_size=1024**3)
+            self.routes = web.RouteTableDef()
+
+    PromptServer.instance = PromptServer()
+    server.PromptServer = PromptServer
+    sys.modules["server"] = server
+
+
+def _write_user_files(base_dir: str, settings: dict, workflows: dict) -> None:
+    default_dir = os.path.join(base_dir, "user", "default")
+    workflows_dir = os.path.join(default_dir, "ComfyUI-Connect", "workflows")
+    os.makedirs(workflows_dir, exist_ok=True)
+
+    with open(os.path.join(default_dir, "comfy.settings.json"), "w", encoding="utf-8") as file:
+        json.dump(settings, file)
+    for name, workflow in workflows.items():
+        with open(os.path.join(workflows_dir, f"{name}.json"), "w", encoding="utf-8") as file:
+            json.dump(workflow, file)
+
+
+def import_connector(base_dir: str, settings: dict = None, workflows: dict = None):
+    """
+    Imports ComfyUI-Connect, without serving it.
+
+    :param base_dir: Working directory holding the user, input and output directories.
+    :param settings: ComfyUI settings (Connect.*).
+    :param workflows: Workflows to install, the benchmark workflows by default.
+    :return: The imported package.
+    """
+    _install_comfy_modules(base_dir)
+    _write_user_files(base_dir, settings or {}, load_workflows() if workflows is None else workflows)
+    return import_package()
+
+
+def import_package():
+    """Imports the package itself, once the ComfyUI modules and the user files are installed"""
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE_NAME, os.path.join(REPO_PATH, "__init__.py"), submodule_search_locations=[REPO_PATH]
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+async def start_connector(
+    base_dir: str,
+    comfy_port: int,
+    port: int = 8400,
+    gateway_url: str = None,
+    workflows: dict = None,
+    settings: dict = None,
+):
+    """
+    Imports ComfyUI-Connect and serves it in the running event loop.
+
+    :param base_dir: Working directory holding the user, input and output directories.
+    :param comfy_port: Port of the ComfyUI server the connector sends prompts to (on 127.0.0.1).
+    :param port: Port the connector routes are served on.
+    :param gateway_url: Optional Socket.IO gateway the connector connects to.
+    :param workflows: Workflows to install, the benchmark workflows by default.
+    :param settings: Additional ComfyUI settings (Connect.*).
+    :return: The aiohttp runner (call `cleanup()` to stop it) and the imported package.
+    """
+    package = import_connector(
+        base_dir,
+        {
+            "Connect.ComfyUIHost": "127.0.0.1",
+            "Connect.ComfyUIPort": comfy_port,
+            **({"Connect.GatewayEndpoint": gateway_url} if gateway_url else {}),
+            **(settings or {}),
+        },
+        workflows,
+    )
+
+    prompt_server = sys.modules["server"].PromptServer.instance
+    prompt_server.app.add_routes(prompt_server.routes)
+    runner = web.AppRunner(prompt_server.app, shutdown_timeout=0.5)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, package
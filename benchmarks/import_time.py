@@ -0,0 +1,163 @@
+"""
+Import time benchmark of ComfyUI-Connect, i.e. what the package adds to the ComfyUI startup.
+
+Each sample imports the package in a fresh interpreter (see host.py), with a number of synthetic workflows
+installed, and measures the import wall time, the modules it pulled in and, with `-X importtime`,
+the slowest of them. The startup hook (`on_startup`, run once the server starts) is timed separately.
+Modules ComfyUI has already imported when custom nodes load (aiohttp) are imported beforehand.
+
+Examples:
+    python benchmarks/import_time.py --workflows 0,100,1000 --output import_time.json
+    python benchmarks/import_time.py --baseline import_time.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load import git_revision  # noqa: E402
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in the child interpreter, prints a JSON report as its last line
+CHILD = """
+import gc, sys, json, time, asyncio, tempfile
+sys.path.insert(0, {benchmarks_path!r})
+import aiohttp, aiohttp.web
+from synthetic_graph import generate_workflow
+import host
+
+base_dir = tempfile.mkdtemp(prefix="connect-import-")
+host._install_comfy_modules(base_dir)
+host._write_user_files(base_dir, {{}}, {{f"workflow-{{index}}": generate_workflow(50, seed=index) for index in range({workflows})}})
+gc.collect()
+before = set(sys.modules)
+start = time.perf_counter()
+package = host.import_package()
+imported = time.perf_counter() - start
+
+async def startup():
+    app = sys.modules["server"].PromptServer.instance.app
+    start = time.perf_counter()
+    for hook in app.on_startup:
+        await hook(app)
+    return time.perf_counter() - start
+
+startup_time = asyncio.run(startup())
+print(json.dumps({{
+    "import_ms": imported * 1000,
+    "startup_ms": startup_time * 1000,
+    "modules": sorted(name for name in set(sys.modules) - before if "." not in name),
+}}))
+"""
+
+
+def parse_importtime(stderr: str, top: int, modules_filter: set) -> list:
+    """Returns the slowest of the given top-level modules from a `-X importtime` output (cumulative time)"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        try:
+            cumulative = int(cumulative)
+        except ValueError:
+            continue  # header
+        stripped = name.strip()
+        # Top-level packages only, their submodules are included in them
+        if stripped in modules_filter:
+            modules[stripped] = max(modules.get(stripped, 0), cumulative)
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"module": name, "cumulative_ms": round(us / 1000, 3)} for name, us in slowest]
+
+
+def sample(workflows: int, top: int) -> dict:
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(benchmarks_path=BENCHMARKS_PATH, workflows=workflows)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result["slowest"] = parse_importtime(process.stderr, top, set(result["modules"]))
+    return result
+
+
+def run_size(workflows: int, repeat: int, top: int) -> dict:
+    samples = [sample(workflows, top) for _ in range(repeat)]
+    return {
+        "import_ms": round(statistics.median(s["import_ms"] for s in samples), 3),
+        "import_min_ms": round(min(s["import_ms"] for s in samples), 3),
+        "startup_ms": round(statistics.median(s["startup_ms"] for s in samples), 3),
+        "modules": samples[-1]["modules"],
+        "slowest": samples[-1]["slowest"],
+    }
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> bool:
+    """Prints the differences with a baseline report, returns False if a timing regressed too much"""
+    passed = True
+    print(f"\nComparison with baseline {baseline.get('revision')} ({baseline.get('date')}):")
+    for size, result in report["results"].items():
+        base = baseline.get("results", {}).get(size)
+        if not base:
+            continue
+        for metric in ("import_ms", "startup_ms"):
+            if not base.get(metric):
+                continue
+            change = (result[metric] - base[metric]) / base[metric] * 100
+            regressed = change > max_regression
+            passed &= not regressed
+            print(
+                f"  {size:>6} workflows {metric:<11} {base[metric]:>10.3f} -> {result[metric]:>10.3f}"
+                f" ({change:+.1f}%){'  REGRESSION' if regressed else ''}"
+            )
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workflows", default="0,100,1000", help="comma separated workflow counts")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per workflow count")
+    parser.add_argument("--top", type=int, default=10, help="slowest modules listed")
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="tolerated regression in %%")
+    args = parser.parse_args()
+
+    report = {
+        "revision": git_revision(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": {},
+    }
+    for workflows in (int(count) for count in args.workflows.split(",")):
+        result = run_size(workflows, args.repeat, args.top)
+        report["results"][str(workflows)] = result
+        print(
+            f"{workflows} workflows: import {result['import_ms']:.1f}ms (min {result['import_min_ms']:.1f}ms)"
+            f", startup {result['startup_ms']:.1f}ms, modules: {', '.join(result['modules'])}"
+        )
+        for module in result["slowest"]:
+            print(f"  {module['module']:<32} {module['cumulative_ms']:>10.3f}ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        if not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""
+End-to-end load benchmark of ComfyUI-Connect against a fake ComfyUI.
+
+By default everything runs in this process: the fake ComfyUI, the connector (see host.py) and,
+for the Socket.IO path, a fake gateway the connector connects to. Requests are sent either at a fixed
+concurrency (closed loop) or at a fixed arrival rate (open loop), then the latency percentiles,
+throughput, RSS and event-loop lag are printed and saved as JSON, optionally compared to a baseline.
+
+Examples:
+    python benchmarks/load.py --mode http --concurrency 8 --requests 200 --exec-time 0.2
+    python benchmarks/load.py --mode socketio --rate 5 --duration 60 --output results.json
+    python benchmarks/load.py --mode http --concurrency 4 --baseline results.json
+    python benchmarks/load.py --target http://127.0.0.1:8188/api --concurrency 2   # running ComfyUI
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_comfyui import add_fake_arguments, fake_from_arguments, start_fake_comfyui  # noqa: E402
+
+DEFAULT_PARAMS = {"positive": {"text": "a photo of a cat"}, "sampler": {"steps": 20}}
+
+
+def percentile(values: list, percent: float):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(int(round(percent / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def read_rss() -> int:
+    """Current resident memory of this process in bytes (peak RSS where /proc is not available)"""
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Monitor:
+    """Samples the event loop lag and the RSS while the benchmark runs"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags = []
+        self.rss = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(loop.time() - start - self.interval, 0.0))
+            self.rss.append(read_rss())
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def report(self) -> dict:
+        return {
+            "loop_lag_ms": {
+                "p50": round(percentile(self.lags, 50) * 1000, 3) if self.lags else None,
+                "p99": round(percentile(self.lags, 99) * 1000, 3) if self.lags else None,
+                "max": round(max(self.lags) * 1000, 3) if self.lags else None,
+            },
+            "rss_mb": {
+                "start": round(self.rss[0] / 1024**2, 1) if self.rss else None,
+                "peak": round(max(self.rss) / 1024**2, 1) if self.rss else None,
+                "end": round(self.rss[-1] / 1024**2, 1) if self.rss else None,
+            },
+        }
+
+
+class HttpClient:
+    """Runs workflows through POST /connect/workflows/{name}"""
+
+    def __init__(self, base_url: str, workflow: str, params: dict):
+        self.base_url = base_url
+        self.workflow = workflow
+        self.params = params
+        self.session = None
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=None), connector=aiohttp.TCPConnector(limit=0)
+        )
+
+    async def run(self, workflow: str = None, params: dict = None) -> str:
+        url = f"{self.base_url}/connect/workflows/{workflow or self.workflow}"
+        async with self.session.post(url, json=self.params if params is None else params) as response:
+            await response.read()
+            return str(response.status)
+
+    async def stop(self):
+        await self.session.close()
+
+
+class GatewayClient:
+    """
+    Fake Socket.IO gateway: the connector connects to it, `run` events are sent to the connector
+    and a request completes when its `return` event is received (binary chunks being acknowledged).
+    """
+
+    def __init__(self, port: int, workflow: str, params: dict):
+        import socketio
+
+        self.port = port
+        self.workflow = workflow
+        self.params = params
+        self.sio = socketio.AsyncServer(async_mode="aiohttp", max_http_buffer_size=1024**3)
+        self.app = aiohttp.web.Application()
+        self.sio.attach(self.app)
+        self.runner = None
+        self.sid = None
+        self.connected = asyncio.Event()
+        self.pending = {}  # taskId => future
+        self.received_bytes = 0
+
+        @self.sio.event
+        async def connect(sid, environ):
+            self.sid = sid
+            self.connected.set()
+
+        @self.sio.event
+        async def disconnect(sid):
+            if sid == self.sid:
+                self.connected.clear()
+
+        @self.sio.on("return_manifest")
+        async def on_manifest(sid, data):
+            return True
+
+        @self.sio.on("return_chunk")
+        async def on_chunk(sid, data):
+            self.received_bytes += len(data.get("data") or b"")
+            return True
+
+        @self.sio.on("return")
+        async def on_return(sid, data):
+            self._resolve(data.get("taskId"), "error" if data.get("error") else "ok")
+            return True
+
+        @self.sio.on("reject")
+        async def on_reject(sid, data):
+            self._resolve(data.get("taskId"), f"rejected:{data.get('reason')}")
+
+    def _resolve(self, task_id, status: str):
+        future = self.pending.pop(task_id, None)
+        if future is not None and not future.done():
+            future.set_result(status)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self.runner = aiohttp.web.AppRunner(self.app, shutdown_timeout=0.5)
+        await self.runner.setup()
+        await aiohttp.web.TCPSite(self.runner, "127.0.0.1", self.port).start()
+
+    async def wait_connected(self, timeout: float):
+        await asyncio.wait_for(self.connected.wait(), timeout)
+
+    async def run(self, workflow: str = None, params: dict = None) -> str:
+        task_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.pending[task_id] = future
+        await self.sio.emit(
+            "run",
+            {
+                "taskId": task_id,
+                "name": workflow or self.workflow,
+                "params": self.params if params is None else params,
+            },
+            to=self.sid,
+        )
+        return await future
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def run_closed_loop(client, concurrency: int, requests: int, duration: float, results: list):
+    end = time.monotonic() + duration if duration else None
+    counter = iter(range(requests)) if requests else None
+
+    async def worker():
+        while True:
+            if counter is not None and next(counter, None) is None:
+                return
+            if end is not None and time.monotonic() >= end:
+                return
+            await timed(client, results)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def run_open_loop(client, rate: float, requests: int, duration: float, poisson: bool, results: list):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    tasks = []
+    at = 0.0
+    sent = 0
+    while (not requests or sent < requests) and (not duration or at < duration):
+        delay = start + at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(timed(client, results)))
+        sent += 1
+        at += random.expovariate(rate) if poisson else 1 / rate
+    await asyncio.gather(*tasks)
+
+
+async def timed(client, results: list, *run_args):
+    start = time.perf_counter()
+    try:
+        status = await client.run(*run_args)
+    except Exception as e:
+        status = f"exception:{type(e).__name__}"
+    results.append((time.perf_counter() - start, status))
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    statuses = {}
+    for _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    ok = [latency for latency, status in results if status in ("200", "ok")]
+    return {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else None,
+        "latency_ms": {
+            name: round(percentile(ok, percent) * 1000, 3) if ok else None
+            for name, percent in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))
+        },
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> bool:
+    """Prints the differences with a baseline report, returns False if a metric regressed too much"""
+    checks = [
+        ("latency p50", report["latency_ms"]["p50"], baseline["latency_ms"]["p50"], False),
+        ("latency p95", report["latency_ms"]["p95"], baseline["latency_ms"]["p95"], False),
+        ("latency p99", report["latency_ms"]["p99"], baseline["latency_ms"]["p99"], False),
+        ("throughput", report["throughput_rps"], baseline["throughput_rps"], True),
+        ("peak rss", report["rss_mb"]["peak"], baseline["rss_mb"]["peak"], False),
+        ("loop lag p99", report["loop_lag_ms"]["p99"], baseline["loop_lag_ms"]["p99"], False),
+    ]
+    passed = True
+    print(f"\nComparison with baseline {baseline.get('revision')} ({baseline.get('date')}):")
+    different = {
+        key: (baseline.get("config", {}).get(key), value)
+        for key, value in report.get("config", {}).items()
+        if baseline.get("config", {}).get(key) != value
+    }
+    if different:
+        print(f"  Warning, the runs have different settings: {different}")
+    for name, value, base, higher_is_better in checks:
+        if value is None or not base:
+            continue
+        change = (value - base) / base * 100
+        regressed = -change > max_regression if higher_is_better else change > max_regression
+        passed &= not regressed
+        print(f"  {name:<14} {base:>10} -> {value:>10} ({change:+.1f}%){'  REGRESSION' if regressed else ''}")
+    return passed
+
+
+async def benchmark(args) -> dict:
+    workflow = args.workflow
+    params = json.loads(args.params) if args.params else DEFAULT_PARAMS
+    runners = []
+    gateway = None
+
+    if args.mode == "socketio":
+        gateway = GatewayClient(args.gateway_port, workflow, params)
+        await gateway.start()
+
+    fake = None
+    base_url = args.target
+    if base_url is None:
+        from host import start_connector
+
+        fake = fake_from_arguments(args)
+        runners.append(await start_fake_comfyui(fake, port=args.comfy_port))
+        runner, package = await start_connector(
+            tempfile.mkdtemp(prefix="connect-bench-"),
+            args.comfy_port,
+            port=args.connector_port,
+            gateway_url=gateway.url if gateway else None,
+            settings=json.loads(args.settings) if args.settings else None,
+        )
+        runners.append(runner)
+        base_url = f"http://127.0.0.1:{args.connector_port}"
+
+    if gateway:
+        print(f"Waiting for the connector to connect to the fake gateway on {gateway.url} ...")
+        await gateway.wait_connected(30)
+        client = gateway
+    else:
+        client = HttpClient(base_url, workflow, params)
+        await client.start()
+
+    # Warm up: first prompts pay the connections and lazy loading
+    for _ in range(args.warmup):
+        await client.run()
+
+    monitor = Monitor()
+    monitor.start()
+    results = []
+    start = time.perf_counter()
+    if args.rate:
+        await run_open_loop(client, args.rate, args.requests, args.duration, args.poisson, results)
+    else:
+        await run_closed_loop(client, args.concurrency, args.requests, args.duration, results)
+    elapsed = time.perf_counter() - start
+    monitor.stop()
+
+    report = {
+        "revision": git_revision(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "baseline", "max_regression")
+        },
+        **summarize(results, elapsed),
+        **monitor.report(),
+    }
+    if fake is not None:
+        report["fake_comfyui"] = fake.stats
+
+    await client.stop()
+    if fake is not None:
+        await sys.modules[f"{package.__name__}.services.comfyui_service"].comfyui_service.close()
+    for runner in reversed(runners):
+        await runner.cleanup()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("http", "socketio"), default="http")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, default=4, help="requests in flight (closed loop, default: 4)")
+    load.add_argument("--rate", type=float, help="requests per second (open loop)")
+    parser.add_argument("--poisson", action="store_true", help="poisson arrivals with --rate")
+    parser.add_argument("--requests", type=int, default=100, help="number of requests (0 for --duration only)")
+    parser.add_argument("--duration", type=float, default=0, help="maximum duration in seconds")
+    parser.add_argument("--warmup", type=int, default=2, help="requests sent before measuring")
+    parser.add_argument("--workflow", default="txt2img", help="workflow name (see benchmarks/workflows)")
+    parser.add_argument("--params", help="JSON payload of each request")
+    parser.add_argument("--target", help="base URL of a running connector instead of the in-process one")
+    parser.add_argument("--settings", help="JSON settings of the in-process connector (e.g. '{\"Connect.CpuExecutor\": \"inline\"}')")
+    parser.add_argument("--comfy-port", type=int, default=8189)
+    parser.add_argument("--connector-port", type=int, default=8400)
+    parser.add_argument("--gateway-port", type=int, default=8401)
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="tolerated regression in %%")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(benchmark(args))
+    print(json.dumps({key: value for key, value in report.items() if key != "config"}, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        if not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Replays recorded production traffic against ComfyUI-Connect, for capacity planning.
+
+Traces are written by the connector when the Connect.TrafficRecording setting is enabled
+(user/default/ComfyUI-Connect/traffic/traffic*.jsonl, see services/traffic_recorder.py). Each request
+is sent at its recorded arrival offset divided by --speed, with its recorded workflow and parameters:
+files and strings, recorded as shapes, are regenerated with the same sizes.
+
+By default the requests are replayed in this process against the fake ComfyUI, each prompt taking
+the execution time recorded for it (in arrival order), so the connector is measured under the recorded
+arrival pattern and mix. --workflows must then point at the workflows of the recorded instance.
+--target replays against a running connector instead (e.g. a staging ComfyUI with real GPUs).
+
+Examples:
+    python benchmarks/replay.py traffic/ --workflows user/default/ComfyUI-Connect/workflows
+    python benchmarks/replay.py traffic/traffic.jsonl --workflows wf/ --speed 4 --output replay.json
+    python benchmarks/replay.py traffic/ --target http://staging:8188/api --speed 2
+"""
+import os
+import sys
+import glob
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_comfyui import add_fake_arguments, fake_from_arguments, start_fake_comfyui  # noqa: E402
+from load import GatewayClient, HttpClient, Monitor, compare, git_revision, percentile, summarize, timed  # noqa: E402
+
+
+def trace_files(path: str) -> list:
+    """Returns the trace files of a path (a file, or a traffic directory with its rotated files)"""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "traffic*.jsonl")))
+    return [path]
+
+
+def load_trace(paths: list, sources: tuple = None, workflows: tuple = None) -> list:
+    """Returns the recorded requests of the trace files, sorted by arrival time"""
+    entries = []
+    for path in paths:
+        for file_path in trace_files(path):
+            with open(file_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # line truncated by a crash or a rotation
+                    if sources and entry.get("src") not in sources:
+                        continue
+                    if workflows and entry.get("wf") not in workflows:
+                        continue
+                    entries.append(entry)
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+
+def materialize(shape, files: dict):
+    """
+    Rebuilds parameters from their recorded shape: files get random content of the recorded size
+    (identical hashes give identical files, so the connector upload cache behaves the same),
+    strings get a string of the recorded length.
+    """
+    if isinstance(shape, dict):
+        if shape.get("type") == "file":
+            key = shape.get("sha1") or shape.get("url_sha1") or "file"
+            if key not in files:
+                content = random.Random(key).randbytes(shape.get("size") or 1024)
+                files[key] = base64.b64encode(content).decode("ascii")
+            return {"type": "file", "name": f"{key}{shape.get('extension') or '.bin'}", "content": files[key]}
+        if shape.get("type") == "str" and "length" in shape:
+            return "x" * shape["length"]
+        if shape.get("type") == "bytes" and "size" in shape:
+            return base64.b64encode(bytes(shape["size"])).decode("ascii")
+        return {key: materialize(item, files) for key, item in shape.items()}
+    if isinstance(shape, list):
+        return [materialize(item, files) for item in shape]
+    return shape
+
+
+async def replay(client, entries: list, speed: float, results: list, per_workflow: dict):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    t0 = entries[0]["t"]
+    files = {}
+    tasks = []
+
+    async def send(entry, params):
+        workflow_results = per_workflow.setdefault(entry["wf"], [])
+        await timed(client, workflow_results, entry["wf"], params)
+        results.append(workflow_results[-1])
+
+    for entry in entries:
+        params = materialize(entry.get("params") or {}, files)
+        delay = start + (entry["t"] - t0) / speed - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(entry, params)))
+    await asyncio.gather(*tasks)
+    return loop.time() - start
+
+
+def recorded_summary(entries: list) -> dict:
+    """Latencies of the recorded requests, per workflow, to compare with the replayed ones"""
+    by_workflow = {}
+    for entry in entries:
+        by_workflow.setdefault(entry["wf"], []).append(entry)
+    summary = {}
+    for name, workflow_entries in by_workflow.items():
+        ok = [entry["dur"] for entry in workflow_entries if entry.get("status") in ("200", "ok")]
+        summary[name] = {
+            "requests": len(workflow_entries),
+            "succeeded": len(ok),
+            "latency_ms": {
+                key: round(percentile(ok, percent) * 1000, 3) if ok else None
+                for key, percent in (("p50", 50), ("p95", 95), ("p99", 99))
+            },
+        }
+    return summary
+
+
+def execution_times(entries: list) -> deque:
+    """Recorded execution phase durations (seconds), in arrival order, for the fake ComfyUI"""
+    return deque(
+        entry["phases"]["execution"] / 1000
+        for entry in entries
+        if (entry.get("phases") or {}).get("execution") is not None
+    )
+
+
+async def run(args) -> dict:
+    entries = load_trace(args.traces, tuple(args.source or ()), tuple(args.workflow or ()))
+    if args.limit:
+        entries = entries[: args.limit]
+    if not entries:
+        raise SystemExit("No request to replay in the given traces.")
+    span = entries[-1]["t"] - entries[0]["t"]
+    print(f"Replaying {len(entries)} requests recorded over {span:.1f}s at x{args.speed} ({span / args.speed:.1f}s)")
+
+    runners = []
+    gateway = None
+    if args.mode == "socketio":
+        gateway = GatewayClient(args.gateway_port, None, {})
+        await gateway.start()
+
+    fake = None
+    package = None
+    base_url = args.target
+    if base_url is None:
+        from host import load_workflows, start_connector
+
+        if not args.workflows:
+            raise SystemExit("--workflows is required to replay in process (or use --target).")
+        fake = fake_from_arguments(args)
+        if not args.fixed_exec_time:
+            recorded = execution_times(entries)
+            fake.exec_time_source = lambda prompt: recorded.popleft() if recorded else None
+        runners.append(await start_fake_comfyui(fake, port=args.comfy_port))
+        runner, package = await start_connector(
+            tempfile.mkdtemp(prefix="connect-replay-"),
+            args.comfy_port,
+            port=args.connector_port,
+            gateway_url=gateway.url if gateway else None,
+            workflows=load_workflows(args.workflows),
+        )
+        runners.append(runner)
+        base_url = f"http://127.0.0.1:{args.connector_port}"
+
+    if gateway:
+        print(f"Waiting for the connector to connect to the fake gateway on {gateway.url} ...")
+        await gateway.wait_connected(30)
+        client = gateway
+    else:
+        client = HttpClient(base_url, None, {})
+        await client.start()
+
+    monitor = Monitor()
+    monitor.start()
+    results = []
+    per_workflow = {}
+    elapsed = await replay(client, entries, args.speed, results, per_workflow)
+    monitor.stop()
+
+    recorded = recorded_summary(entries)
+    report = {
+        "revision": git_revision(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "baseline", "max_regression")
+        },
+        **summarize(results, elapsed),
+        **monitor.report(),
+        "workflows": {
+            name: {"recorded": recorded.get(name), "replayed": summarize(workflow_results, elapsed)}
+            for name, workflow_results in per_workflow.items()
+        },
+    }
+    if fake is not None:
+        report["fake_comfyui"] = fake.stats
+
+    await client.stop()
+    if package is not None:
+        await sys.modules[f"{package.__name__}.services.comfyui_service"].comfyui_service.close()
+    for runner in reversed(runners):
+        await runner.cleanup()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("traces", nargs="+", help="trace files or traffic directories")
+    parser.add_argument("--speed", type=float, default=1.0, help="arrival acceleration factor (default: 1)")
+    parser.add_argument("--mode", choices=("http", "socketio"), default="http")
+    parser.add_argument("--source", action="append", choices=("http", "gateway"), help="only replay these sources")
+    parser.add_argument("--workflow", action="append", help="only replay these workflows")
+    parser.add_argument("--limit", type=int, default=0, help="replay the first N requests only")
+    parser.add_argument("--workflows", help="directory of the workflows of the recorded instance")
+    parser.add_argument(
+        "--fixed-exec-time", action="store_true", help="use --exec-time instead of the recorded execution times"
+    )
+    parser.add_argument("--target", help="base URL of a running connector instead of the in-process one")
+    parser.add_argument("--comfy-port", type=int, default=8189)
+    parser.add_argument("--connector-port", type=int, default=8400)
+    parser.add_argument("--gateway-port", type=int, default=8401)
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--baseline", help="JSON results of a previous replay to compare with")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="tolerated regression in %%")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    report = asyncio.run(run(args))
+    print(json.dumps({key: value for key, value in report.items() if key != "config"}, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        if not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Generator of synthetic API-format workflows, shaped like real ones: independent txt2img-like
+pipelines (checkpoint loader, text encoders, latent, sampler, decoder, save), optionally with chains
+of LoRA loaders tagged `!bypass` between the loader and the sampler, `!cache` loaders and `$`/`#` tags.
+"""
+import random
+
+
+def generate_workflow(
+    nodes: int,
+    tag_density: float = 0.3,
+    bypass_chain: int = 0,
+    cache_ratio: float = 0.2,
+    seed: int = 0,
+) -> dict:
+    """
+    Generates a workflow of about `nodes` nodes.
+
+    :param nodes: Number of nodes to generate (the last pipeline is truncated to match it).
+    :param tag_density: Fraction of the encoders, latents and samplers tagged as inputs (`$tag`).
+    :param bypass_chain: Number of `!bypass` LoRA loaders inserted in each pipeline.
+    :param cache_ratio: Fraction of the checkpoint loaders tagged `!cache`.
+    :param seed: Random seed, the same arguments always give the same workflow.
+    :return: The workflow, keyed by node id.
+    """
+    rng = random.Random(seed)
+    workflow = {}
+    pipeline = 0
+
+    def add(class_type: str, inputs: dict, title: str = "") -> str:
+        node_id = str(len(workflow) + 1)
+        workflow[node_id] = {"class_type": class_type, "inputs": inputs, "_meta": {"title": title or class_type}}
+        return node_id
+
+    def tagged(title: str, tag: str) -> str:
+        if rng.random() >= tag_density:
+            return title
+        # Some tags expose only a few inputs, like `$sampler(seed, steps)`
+        if rng.random() < 0.5:
+            return f"{title} ${tag}"
+        return f"{title} ${tag}({', '.join(rng.sample(['seed', 'steps', 'cfg', 'text', 'width'], 2))})"
+
+    while len(workflow) < nodes:
+        pipeline += 1
+        cache = " !cache" if rng.random() < cache_ratio else ""
+        loader = add(
+            "CheckpointLoaderSimple",
+            {"ckpt_name": f"model_{rng.randrange(8)}.safetensors"},
+            f"Checkpoint {pipeline}{cache}",
+        )
+
+        model = [loader, 0]
+        clip = [loader, 1]
+        for index in range(bypass_chain):
+            lora = add(
+                "LoraLoader",
+                {"lora_name": f"lora_{index}.safetensors", "strength_model": 1.0, "strength_clip": 1.0,
+                 "model": model, "clip": clip},
+                f"LoRA {pipeline}.{index} !bypass",
+            )
+            model, clip = [lora, 0], [lora, 1]
+
+        positive = add(
+            "CLIPTextEncode",
+            {"text": f"prompt {pipeline} " * 8, "clip": clip},
+            tagged(f"Positive {pipeline}", f"positive{pipeline}"),
+        )
+        negative = add("CLIPTextEncode", {"text": "blurry, lowres", "clip": clip}, f"Negative {pipeline}")
+        latent = add(
+            "EmptyLatentImage",
+            {"width": 1024, "height": 1024, "batch_size": 1},
+            tagged(f"Latent {pipeline}", f"latent{pipeline}"),
+        )
+        sampler = add(
+            "KSampler",
+            {"seed": rng.randrange(2**32), "steps": 20, "cfg": 7.0, "sampler_name": "euler",
+             "scheduler": "normal", "denoise": 1.0, "model": model, "positive": [positive, 0],
+             "negative": [negative, 0], "latent_image": [latent, 0]},
+            tagged(f"Sampler {pipeline}", f"sampler{pipeline}"),
+        )
+        decode = add("VAEDecode", {"samples": [sampler, 0], "vae": [loader, 2]}, f"Decode {pipeline}")
+        add("SaveImage", {"filename_prefix": f"out{pipeline}", "images": [decode, 0]}, f"Save #out{pipeline}")
+
+    # Truncated to the requested size, dangling links are kept like in a partially edited workflow
+    return {node_id: workflow[node_id] for node_id in list(workflow)[:nodes]}
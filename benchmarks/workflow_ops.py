@@ -0,0 +1,206 @@
+"""
+Micro-benchmarks of the Workflow entity operations and of the execution preparation, on synthetic
+workflows from 50 to 10k nodes (see synthetic_graph.py).
+
+Each operation is timed over several samples (median and min are reported) and its allocations are
+measured once with tracemalloc. The preparation benchmark runs `WorkflowService.execute_workflow`
+with `run_workflow` stubbed out, so it covers validation, deepcopy, bypasses, parameters, cached nodes
+injection and pruning.
+
+Examples:
+    python benchmarks/workflow_ops.py --output workflow_ops.json
+    python benchmarks/workflow_ops.py --sizes 50,1000 --bypass-chain 2 --baseline workflow_ops.json
+"""
+import os
+import sys
+import copy
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_graph import generate_workflow  # noqa: E402
+from load import git_revision  # noqa: E402
+
+DEFAULT_SIZES = (50, 200, 1000, 5000, 10000)
+
+
+def measure(function, setup=None, repeat: int = 5, min_time: float = 0.05) -> dict:
+    """
+    Times a function. Without setup, each sample loops the function enough times to last `min_time`.
+    With a setup (for operations modifying their input), each sample calls it once on a fresh input.
+
+    :return: The median and min time of one call in milliseconds, and the tracemalloc peak in KiB.
+    """
+    samples = []
+    if setup is None:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time or number >= 1000:
+                break
+            number *= 10
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            samples.append((time.perf_counter() - start) / number)
+    else:
+        for _ in range(repeat):
+            value = setup()
+            start = time.perf_counter()
+            function(value)
+            samples.append(time.perf_counter() - start)
+
+    value = setup() if setup else None
+    tracemalloc.start()
+    try:
+        function(value) if setup else function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "min_ms": round(min(samples) * 1000, 4),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def pick_update(workflow) -> tuple:
+    """Returns a (tag, input, value) of the workflow to benchmark updates with"""
+    for tag, inputs in workflow.get_tagged_inputs().items():
+        for input_name, input_type in inputs.items():
+            if input_type in ("int", "float", "str"):
+                return tag, input_name, {"int": 1, "float": 1.0, "str": "x"}[input_type]
+    return None
+
+
+def run_size(connector, Workflow, size: int, args) -> dict:
+    data = generate_workflow(size, args.tag_density, args.bypass_chain, args.cache_ratio, args.seed)
+    workflow = Workflow(copy.deepcopy(data))
+    results = {"nodes": len(data)}
+
+    results["get_tagged_nodes"] = measure(workflow.get_tagged_nodes, repeat=args.repeat)
+    results["get_tagged_inputs"] = measure(workflow.get_tagged_inputs, repeat=args.repeat)
+    update = pick_update(workflow)
+    if update:
+        results["update_tagged_nodes_input"] = measure(
+            lambda: workflow.update_tagged_nodes_input(*update), repeat=args.repeat
+        )
+    results["bypass_nodes"] = measure(
+        lambda value: value.bypass_nodes("!bypass"),
+        setup=lambda: Workflow(copy.deepcopy(data)),
+        repeat=args.repeat,
+    )
+    results["deepcopy"] = measure(lambda: copy.deepcopy(data), repeat=args.repeat)
+
+    # Full preparation of an execution, two workflows being installed so cached nodes get injected
+    service = connector.manager
+    asyncio.run(service.workflows.save("bench", data))
+    asyncio.run(service.workflows.save(
+        "other", generate_workflow(size, args.tag_density, args.bypass_chain, args.cache_ratio, args.seed + 1)
+    ))
+    service.cache_policy.mark_used(service.cached_nodes.get_injection("bench"))
+    params = {update[0]: {update[1]: update[2]}} if update else {}
+    results["prepare"] = measure(
+        lambda: asyncio.run(service.execute_workflow("bench", params)), repeat=args.repeat
+    )
+    return results
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> bool:
+    """Prints the time changes with a baseline report, returns False if an operation regressed too much"""
+    passed = True
+    print(f"\nComparison with baseline {baseline.get('revision')} ({baseline.get('date')}):")
+    for size, operations in report["results"].items():
+        base_operations = baseline.get("results", {}).get(size, {})
+        for name, result in operations.items():
+            base = base_operations.get(name)
+            if not isinstance(result, dict) or not base:
+                continue
+            change = (result["median_ms"] - base["median_ms"]) / base["median_ms"] * 100
+            regressed = change > max_regression
+            passed &= not regressed
+            print(
+                f"  {size:>6} nodes {name:<26} {base['median_ms']:>10.3f}ms -> {result['median_ms']:>10.3f}ms "
+                f"({change:+.1f}%){'  REGRESSION' if regressed else ''}"
+            )
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma separated node counts")
+    parser.add_argument("--tag-density", type=float, default=0.3)
+    parser.add_argument("--bypass-chain", type=int, default=1)
+    parser.add_argument("--cache-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="samples per operation")
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="tolerated regression in %%")
+    args = parser.parse_args()
+
+    from host import import_connector
+
+    connector = import_connector(tempfile.mkdtemp(prefix="connect-bench-"), workflows={})
+    Workflow = sys.modules[f"{connector.__name__}.entities.workflow"].Workflow
+
+    async def run_workflow(
+        workflow,
+        timer=None,
+        name=None,
+        deadline=None,
+        on_output=None,
+        fetch_images=True,
+        reservation=None,
+        on_preview=None,
+    ):
+        return {}
+
+    sys.modules[f"{connector.__name__}.services.comfyui_service"].comfyui_service.run_workflow = run_workflow
+
+    report = {
+        "revision": git_revision(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": {},
+    }
+    for size in (int(size) for size in args.sizes.split(",")):
+        # The operations log every change, the output is discarded so the terminal doesn't skew timings
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = run_size(connector, Workflow, size, args)
+        report["results"][str(size)] = results
+        print(f"{size} nodes")
+        for name, result in results.items():
+            if isinstance(result, dict):
+                print(
+                    f"  {name:<26} median {result['median_ms']:>10.3f}ms  min {result['min_ms']:>10.3f}ms"
+                    f"  peak {result['peak_kb']:>10.1f}KiB"
+                )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        if not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,16 +13,99 @@ class Config:
     )
     INPUT_PATH: str = os.path.abspath(folder_paths.get_input_directory())
     OUTPUT_PATH: str = os.path.abspath(folder_paths.get_output_directory())
+    TEMP_PATH: str = os.path.abspath(folder_paths.get_temp_directory())
     
     # Workflow configuration
     CACHED_NODE_KEY_START: int = 1000
+    WORKFLOWS_POLL_INTERVAL: float = 2.0  # seconds between checks for external workflow changes
+    WORKFLOWS_WATCH_DEBOUNCE: float = 0.2  # seconds to wait after a filesystem event before reloading
+
+    # Node classes always kept as outputs when pruning unreachable nodes (in addition to ComfyUI's OUTPUT_NODE classes)
+    OUTPUT_NODE_CLASSES: tuple = ("SaveImage", "PreviewImage", "SaveAnimatedWEBP", "SaveAnimatedPNG", "SaveAudio")
+
+    # Cached nodes injection configuration
+    CACHE_INJECTION_RECENT_WINDOW: float = 1800.0  # seconds a cached node is considered resident after its last run
+    CACHE_INJECTION_VRAM_BUDGET_MB: float = 0  # 0 means no budget
     
+    # Execution configuration
+    DISCONNECT_CHECK_INTERVAL: float = 0.5  # seconds between checks of HTTP client disconnection
+    DEFAULT_TIMEOUT: float = None  # seconds, no deadline by default
+    HISTORY_CHECK_INTERVAL: float = 5.0  # seconds without websocket news before checking /history for a prompt
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # bytes read at once from multipart file parts
+    IDEMPOTENCY_TTL: float = 600.0  # seconds a result is replayed to retries of the same request
+    IDEMPOTENCY_MAX_ENTRIES: int = 256  # oldest finished results are dropped beyond this count
+    IDEMPOTENCY_MAX_BYTES: int = 256 * 1024 * 1024  # ... and beyond this total size of their outputs
+
+    # Output transcoding configuration
+    OUTPUT_CACHE_MAX_BYTES: int = 256 * 1024**2  # encoded outputs kept for identical requests
+    OUTPUT_DEFAULT_QUALITY: int = 85
+
+    # Media outputs configuration (videos, audio and other non-image files)
+    MEDIA_INLINE_MAX_BYTES: int = 8 * 1024**2  # larger files on this machine are served by download links
+    DOWNLOAD_TOKEN_TTL: float = 900.0  # seconds a download link is valid
+    DOWNLOAD_TOKEN_MAX_ENTRIES: int = 4096  # oldest links are dropped beyond this count
+
+    # Preview frames configuration (sampling previews relayed to the clients asking for them)
+    PREVIEW_MAX_FPS: float = 4.0  # frames sent per second to each client at most, the latest one wins
+
+    # CPU-bound work configuration (base64, JSON serialization, deep copies and output encoding run off the event loop)
+    CPU_EXECUTOR: str = "thread"  # "thread", "process" or "inline"
+    CPU_EXECUTOR_WORKERS: int = 4
+    CPU_OFFLOAD_MIN_BYTES: int = 256 * 1024  # smaller payloads are encoded inline
+    CPU_OFFLOAD_MIN_NODES: int = 200  # smaller workflows are copied and serialized inline
+    RESPONSE_CHUNK_SIZE: int = 1024 * 1024  # larger responses are written in chunks of this size
+    LOOP_LAG_INTERVAL: float = 0.1  # seconds between event loop lag samples
+    LOOP_LAG_WINDOW: float = 300.0  # seconds of samples reported
+
+    # ComfyUI connection configuration
+    COMFY_CONNECT_TIMEOUT: float = 10.0  # seconds to wait for the ComfyUI websocket before failing a call
+    COMFY_WS_HEARTBEAT: float = 15.0  # seconds between websocket pings, detects half-open connections
+    COMFY_RECONNECT_BASE_DELAY: float = 0.5  # seconds
+    COMFY_RECONNECT_MAX_DELAY: float = 10.0  # seconds
+
+    # Analytics configuration
+    ANALYTICS_RETENTION: float = 3600.0  # seconds finished executions are kept for analytics
+    ANALYTICS_DEFAULT_WINDOW: float = 300.0  # seconds
+    ANALYTICS_BUCKET: float = 10.0  # seconds of executions aggregated together (the window granularity)
+
     # WebSocket configuration
     GPU_INFO_INTERVAL: float = 0.5  # seconds
+    GATEWAY_WORKERS: int = 2  # tasks executed concurrently (the next prompt is queued while outputs are fetched)
+    GATEWAY_QUEUE_SIZE: int = 8  # accepted tasks waiting for a worker, further tasks are rejected
+    GATEWAY_HEARTBEAT_INTERVAL: float = 2.0  # seconds
+    GATEWAY_RECONNECT_BASE_DELAY: float = 1.0  # seconds
+    GATEWAY_RECONNECT_MAX_DELAY: float = 30.0  # seconds
+    GATEWAY_ACK_TIMEOUT: float = 30.0  # seconds to wait for the gateway to acknowledge a result
+    GATEWAY_BINARY_TRANSFER: bool = True  # send outputs as chunked binary attachments instead of base64
+    GATEWAY_CHUNK_SIZE: int = 1024 * 1024  # bytes
+    GATEWAY_CHUNK_WINDOW: int = 4  # chunks sent without acknowledgement yet
+    OUTBOX_PATH: str = os.path.abspath(
+        os.path.join(
+            folder_paths.get_user_directory(), "default", "ComfyUI-Connect", "outbox"
+        )
+    )
+    OUTBOX_MAX_BYTES: int = 1024**3  # oldest results are dropped beyond this size
+    OUTBOX_INLINE_MAX_BYTES: int = 64 * 1024  # larger result values are stored as separate files
     SETTINGS_FILENAME: str = "comfy.settings.json"
+
+    # Traffic recording configuration (opt-in with the Connect.TrafficRecording setting)
+    TRAFFIC_PATH: str = os.path.abspath(
+        os.path.join(
+            folder_paths.get_user_directory(), "default", "ComfyUI-Connect", "traffic"
+        )
+    )
+    TRAFFIC_SAMPLE_RATE: float = 1.0  # fraction of the requests recorded
+    TRAFFIC_MAX_BYTES: int = 64 * 1024**2  # the trace file is rotated beyond this size
+    TRAFFIC_BACKUPS: int = 5  # rotated trace files kept
     
     # GPU monitoring configuration
     POWER_CONVERSION_FACTOR: float = 1000.0  # mW to W conversion
+
+    # VRAM admission configuration (opt-in with the Connect.VramAdmission setting)
+    VRAM_DEVICE_INDEX: int = 0  # NVML index of the GPU ComfyUI runs on
+    VRAM_SAMPLE_INTERVAL: float = 0.25  # seconds between memory samples while executions are running
+    VRAM_PROFILE_RUNS: int = 10  # recent runs of a workflow its expected VRAM is learned from
+    VRAM_HEADROOM_PERCENT: float = 10.0  # memory kept free, executions are held beyond the rest
     
     # OpenAPI configuration
     OPENAPI_VERSION: str = "3.0.0"
@@ -89,6 +172,113 @@ class Config:
         # Check temporary override first, then environment variable, then user settings
         return self._override_token or os.environ.get("COMFYUI_TOKEN") or self.user_settings.get("Connect.ComfyUIToken", "")
     
+    @property
+    def comfy_is_local(self) -> bool:
+        """Whether ComfyUI runs on this machine, its output files can then be read from disk"""
+        return self.user_settings.get("Connect.ComfyUIHost") in (None, "", "127.0.0.1", "localhost", "::1")
+
+    @property
+    def media_inline_max_bytes(self) -> int:
+        """Get the size (in bytes) above which media outputs are returned as download links from settings"""
+        try:
+            value = self.user_settings.get("Connect.MediaInlineMaxMB")
+            if value in (None, ""):
+                return self.MEDIA_INLINE_MAX_BYTES
+            return int(float(value) * 1024**2)
+        except (TypeError, ValueError):
+            return self.MEDIA_INLINE_MAX_BYTES
+
+    @property
+    def preview_interval(self) -> float:
+        """Get the minimum seconds between two preview frames sent to a client, from the Connect.PreviewMaxFps setting"""
+        try:
+            value = self.user_settings.get("Connect.PreviewMaxFps")
+            fps = float(self.PREVIEW_MAX_FPS if value in (None, "") else value)
+            return 1 / fps if fps > 0 else 1 / self.PREVIEW_MAX_FPS
+        except (TypeError, ValueError):
+            return 1 / self.PREVIEW_MAX_FPS
+
+    @property
+    def result_sinks(self) -> dict:
+        """Get the result sinks settings ({"name": {"type": "s3" or "local", ...}}) from settings"""
+        sinks = self.user_settings.get("Connect.ResultSinks")
+        return sinks if isinstance(sinks, dict) else {}
+
+    @property
+    def default_result_sink(self):
+        """Get the name of the result sink used when requests don't choose one, None to return outputs inline"""
+        return self.user_settings.get("Connect.DefaultResultSink") or None
+
+    @property
+    def cache_injection_vram_budget(self) -> float:
+        """Get the VRAM budget (in MB) for injected cached nodes from settings, 0 meaning unlimited"""
+        try:
+            return float(
+                self.user_settings.get("Connect.CacheVramBudgetMB") or self.CACHE_INJECTION_VRAM_BUDGET_MB
+            )
+        except (TypeError, ValueError):
+            return self.CACHE_INJECTION_VRAM_BUDGET_MB
+
+    @property
+    def vram_admission(self) -> bool:
+        """Whether executions are held while the GPU memory they are expected to use is not free (off by default)"""
+        return self.user_settings.get("Connect.VramAdmission") in (True, "true", "True", "1", 1)
+
+    @property
+    def vram_headroom_percent(self) -> float:
+        """Get the percentage of the GPU memory kept free by the VRAM admission from settings"""
+        try:
+            value = self.user_settings.get("Connect.VramHeadroomPercent")
+            return min(max(float(self.VRAM_HEADROOM_PERCENT if value in (None, "") else value), 0.0), 100.0)
+        except (TypeError, ValueError):
+            return self.VRAM_HEADROOM_PERCENT
+
+    @property
+    def gateway_workers(self) -> int:
+        """Get the number of gateway tasks executed concurrently from settings"""
+        try:
+            return max(int(self.user_settings.get("Connect.GatewayWorkers") or self.GATEWAY_WORKERS), 1)
+        except (TypeError, ValueError):
+            return self.GATEWAY_WORKERS
+
+    @property
+    def gateway_binary_transfer(self) -> bool:
+        """Whether gateway results are sent as binary chunks (settings can disable it for older gateways)"""
+        value = self.user_settings.get("Connect.GatewayBinaryTransfer")
+        if value is None or value == "":
+            return self.GATEWAY_BINARY_TRANSFER
+        return value not in (False, "false", "False", "0", 0)
+
+    @property
+    def cpu_executor(self) -> str:
+        """Get the executor of the CPU-bound work from settings ("thread", "process" or "inline")"""
+        value = self.user_settings.get("Connect.CpuExecutor")
+        return value if value in ("thread", "process", "inline") else self.CPU_EXECUTOR
+
+    @property
+    def traffic_recording(self) -> bool:
+        """Whether the execution requests are recorded for replay (off by default)"""
+        return self.user_settings.get("Connect.TrafficRecording") in (True, "true", "True", "1", 1)
+
+    @property
+    def traffic_sample_rate(self) -> float:
+        """Get the fraction of the execution requests recorded from settings"""
+        try:
+            value = self.user_settings.get("Connect.TrafficSampleRate")
+            return min(max(float(self.TRAFFIC_SAMPLE_RATE if value in (None, "") else value), 0.0), 1.0)
+        except (TypeError, ValueError):
+            return self.TRAFFIC_SAMPLE_RATE
+
+    def get_workflow_timeout(self, name: str):
+        """
+        Get the default timeout (in seconds) of a workflow from settings:
+        Connect.WorkflowTimeouts ({"workflow-name": seconds}), then Connect.DefaultTimeout.
+        """
+        timeouts = self.user_settings.get("Connect.WorkflowTimeouts")
+        if isinstance(timeouts, dict) and timeouts.get(name):
+            return timeouts[name]
+        return self.user_settings.get("Connect.DefaultTimeout") or self.DEFAULT_TIMEOUT
+
     def set_temp_token(self, token: str):
         """Temporarily override the ComfyUI token"""
         self._override_token = token
@@ -1,7 +1,13 @@
 import server
 from aiohttp import web
 from ..services.workflow_service import WorkflowService
+from ..services.analytics_service import execution_analytics
+from ..services.cpu_executor import cpu_executor
+from ..services.result_sinks import result_sinks
+from ..services.vram_admission import vram_admission
+from ..utils.loop_monitor import loop_monitor
 from ..utils.openapi_utils import OpenAPISpecGenerator
+from ..config import config
 
 
 class AppController:
@@ -45,4 +51,33 @@ class AppController:
                 workflows.append(workflow)
 
             generator = OpenAPISpecGenerator(workflows)
-            return web.json_response(generator.generate()) 
\ No newline at end of file
+            return web.json_response(generator.generate()) 
+
+        @server.PromptServer.instance.routes.get("/connect/analytics")
+        async def get_analytics(request):
+            try:
+                window = float(request.query.get("window", config.ANALYTICS_DEFAULT_WINDOW))
+            except ValueError:
+                return web.json_response(
+                    {"status": "error", "message": "window must be a number of seconds."}, status=400
+                )
+            window = min(window, config.ANALYTICS_RETENTION)
+            workflows = execution_analytics.report(window, request.query.get("workflow"))
+            return web.json_response({"status": "success", "window": window, "workflows": workflows})
+
+        @server.PromptServer.instance.routes.get("/connect/idempotency")
+        async def get_idempotency_stats(request):
+            return web.json_response({"status": "success", **self.manager.idempotency.stats()})
+
+        @server.PromptServer.instance.routes.get("/connect/runtime")
+        async def get_runtime_stats(request):
+            return web.json_response({
+                "status": "success",
+                "loop_lag_ms": loop_monitor.stats(),
+                "cpu_executor": cpu_executor.stats(),
+                "result_sinks": result_sinks.stats(),
+            })
+
+        @server.PromptServer.instance.routes.get("/connect/vram")
+        async def get_vram_profiles(request):
+            return web.json_response({"status": "success", **vram_admission.stats(request.query.get("workflow"))})
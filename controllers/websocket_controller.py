@@ -1,13 +1,23 @@
-import socketio
 import asyncio
 import json
 import os
 import folder_paths
 import time
+import random
+import math
 
 from ..utils.helpers import connect_print
 from ..utils.gpu_utils import get_gpu_info, log_gpu_info
 from ..config import config
+from ..services.result_outbox import ResultOutbox
+from ..services.traffic_recorder import traffic_recorder
+from ..services.vram_admission import vram_admission
+from ..services.preview_relay import PreviewRelay
+from ..services.cpu_executor import cpu_executor
+from ..entities.preview_frame import PreviewFrame
+from ..services.errors import ExecutionCancelled, ValidationError
+from ..utils.deadline import Deadline
+from ..utils.timing import ExecutionTimer
 
 
 class WebSocketController:
@@ -17,9 +27,31 @@ class WebSocketController:
     """
 
     def __init__(self, workflow_service):
-        self.sio = socketio.AsyncClient()
+        # Created on startup, only when a gateway is configured
+        self.sio = None
+        self._outbox = None
         self.workflow_service = workflow_service
-        self.setup_event_handlers()
+        self._tasks = asyncio.Queue(maxsize=config.GATEWAY_QUEUE_SIZE)
+        self._workers = []
+        self._running = 0
+        self._queued_ids = set()
+        self._cancelled_ids = set()
+        self._outbox_lock = asyncio.Lock()
+        # Replay of the outbox started on reconnection, referenced until it is done
+        self._flush_task = None
+
+    @property
+    def capacity(self) -> dict:
+        """Current load of this node, advertised to the gateway"""
+        workers = len(self._workers)
+        return {
+            "workers": workers,
+            "running": self._running,
+            "free_slots": max(workers - self._running - self._tasks.qsize(), 0),
+            "queue_depth": self._tasks.qsize(),
+            "queue_size": self._tasks.maxsize,
+            "vram_waiting": vram_admission.waiting,
+        }
 
     def setup_event_handlers(self):
         """Configure WebSocket event handlers (like HTTP routes)"""
@@ -27,6 +59,7 @@ class WebSocketController:
         @self.sio.event
         async def connect():
             connect_print("Client SocketIO connecté")
+            await self.send_heartbeat()
 
         @self.sio.event
         async def disconnect():
@@ -37,12 +70,293 @@ class WebSocketController:
             connect_print(f"Événement 'run' reçu avec les données: {data}")
             taskId = data.get("taskId")
             name = data.get("name")
-            params = data.get("params")
-            result = await self.workflow_service.execute_workflow(name, params)
+            arrival = time.time()
+            recorded = traffic_recorder.sample()
+
+            # The deadline starts when the task is received, time spent in the local queue included
+            try:
+                deadline = Deadline.from_value(data.get("timeout"))
+            except ValueError as e:
+                ack = {"taskId": taskId, "name": name, "accepted": False, "reason": str(e), **self.capacity}
+                await self.sio.emit("reject", ack)
+                return ack
+
+            # A retried task still queued or running is not queued again, its result will be sent once
+            if taskId is not None and (
+                taskId in self._queued_ids
+                or self.workflow_service.idempotency.is_running(f"gateway:{taskId}")
+            ):
+                connect_print(f"Tâche {taskId} déjà en cours, doublon ignoré")
+                ack = {"taskId": taskId, "name": name, "accepted": True, "duplicate": True, **self.capacity}
+                await self.sio.emit("accept", ack)
+                return ack
+
+            # Invalid parameters are rejected right away, without taking a queue slot
+            try:
+                self.workflow_service.validate_params(name, data.get("params"))
+            except (FileNotFoundError, ValidationError) as e:
+                ack = {"taskId": taskId, "name": name, "accepted": False, "reason": str(e), **self.capacity}
+                if isinstance(e, ValidationError):
+                    ack["errors"] = e.errors
+                if recorded:
+                    self._record(arrival, data, "invalid")
+                await self.sio.emit("reject", ack)
+                return ack
+
+            try:
+                self._tasks.put_nowait((data, deadline, arrival, recorded))
+            except asyncio.QueueFull:
+                connect_print(f"Tâche {taskId} refusée, file d'attente pleine")
+                if recorded:
+                    self._record(arrival, data, "busy")
+                ack = {"taskId": taskId, "name": name, "accepted": False, "reason": "busy", **self.capacity}
+                await self.sio.emit("reject", ack)
+                return ack
+
+            self._queued_ids.add(taskId)
+            ack = {"taskId": taskId, "name": name, "accepted": True, **self.capacity}
+            await self.sio.emit("accept", ack)
+            return ack
+
+        @self.sio.on("cancel")
+        async def on_cancel(data):
+            taskId = data.get("taskId")
+            connect_print(f"Événement 'cancel' reçu pour la tâche {taskId}")
+
+            if taskId in self._queued_ids:
+                # Not started yet, the worker will skip it
+                self._cancelled_ids.add(taskId)
+                cancelled = True
+            else:
+                cancelled = self.workflow_service.cancel_execution(str(taskId))
+            return {"taskId": taskId, "cancelled": cancelled}
+
+    async def _worker(self):
+        """Runs the gateway tasks one at a time, several workers sharing the task queue"""
+        while True:
+            data, deadline, arrival, recorded = await self._tasks.get()
+            taskId = data.get("taskId")
+            name = data.get("name")
+            self._queued_ids.discard(taskId)
+            if taskId in self._cancelled_ids:
+                self._cancelled_ids.discard(taskId)
+                self._tasks.task_done()
+                continue
+
+            self._running += 1
+            timer = ExecutionTimer(name)
+            status = "ok"
+            previews = None
+            if data.get("previews"):
+                previews = PreviewRelay(self._preview_sender(taskId, name), config.preview_interval)
+            try:
+                try:
+                    result = await self.workflow_service.execute_workflow(
+                        name,
+                        data.get("params"),
+                        binary=config.gateway_binary_transfer,
+                        execution_id=str(taskId) if taskId is not None else None,
+                        deadline=deadline,
+                        # A task retried after it finished gets its result back without running again
+                        idempotency_key=f"gateway:{taskId}" if taskId is not None else None,
+                        timer=timer,
+                        on_output=self._partial_sender(taskId, name) if data.get("partial") else None,
+                        on_preview=previews.push if previews else None,
+                    )
+                    message = {"taskId": taskId, "name": name, "result": result}
+                except ExecutionCancelled:
+                    # Cancelled by the gateway, which doesn't expect a result anymore
+                    connect_print(f"Tâche {taskId} annulée")
+                    status = "cancelled"
+                    continue
+                except Exception as e:
+                    connect_print(f"Erreur lors de l'exécution de la tâche {taskId}: {e}")
+                    message = {"taskId": taskId, "name": name, "error": str(e)}
+                    status = "error"
+                finally:
+                    # No preview after the result
+                    if previews is not None:
+                        await previews.close()
+
+                # Persisted first, so the result survives a disconnection or a restart
+                entry_id = await self._outbox.put(message)
+                async with self._outbox_lock:
+                    # Not while a flush is sending the entries the cap could drop
+                    await self._outbox.enforce_cap(keep=entry_id)
+                await self.flush_outbox()
+            except Exception as e:
+                connect_print(f"Impossible de renvoyer le résultat de la tâche {taskId}: {e}")
+            finally:
+                self._running -= 1
+                self._tasks.task_done()
+                if recorded:
+                    self._record(arrival, data, status, timer)
+                await self.send_heartbeat()
+
+    def _partial_sender(self, taskId, name: str):
+        """
+        Returns the coroutine sending the outputs of a task to the gateway as soon as they are ready,
+        as `return_partial` events (binary outputs as attachments), for the tasks run with `"partial": true`.
+        They are best effort: not persisted nor acknowledged, the `return` event still has every output.
+        """
+        async def send_partial(tag: str, value, thumbnail=None, media_type=None):
+            partial = {"taskId": taskId, "name": name, "tag": tag, "result": value, "media_type": media_type}
+            if thumbnail:
+                partial["thumbnail"] = thumbnail
+            await self.sio.emit("return_partial", partial)
+
+        return send_partial
+
+    def _preview_sender(self, taskId, name: str):
+        """
+        Returns the coroutine sending the preview frames of a task to the gateway as `preview` events
+        (images as attachments, or base64 without binary transfer), for the tasks run with `"previews": true`.
+        """
+        async def send_preview(frame: PreviewFrame):
+            data = frame.data if config.gateway_binary_transfer else await cpu_executor.b64encode(frame.data)
             await self.sio.emit(
-                "return", {"taskId": taskId, "name": name, "result": result}
+                "preview",
+                {"taskId": taskId, "name": name, "node": frame.node_id, "media_type": frame.media_type, "data": data},
             )
 
+        return send_preview
+
+    def _record(self, arrival: float, data: dict, status: str, timer: ExecutionTimer = None):
+        """Appends a gateway task to the traffic trace, in the background"""
+        name = data.get("name")
+        traffic_recorder.record_in_background(
+            "gateway",
+            arrival,
+            name,
+            data.get("params"),
+            status,
+            timer.as_dict() if timer else None,
+            schema=self.workflow_service.param_schema(name),
+        )
+
+    async def send_result(self, message: dict):
+        """
+        Sends a task result to the gateway, waiting for its acknowledgement.
+
+        Binary outputs are not embedded in the `return` event: a `return_manifest` event describing them
+        (sizes and chunk counts) is sent first, then each output as `return_chunk` binary attachments,
+        with at most GATEWAY_CHUNK_WINDOW chunks waiting for their acknowledgement at the same time.
+        The `return` event comes last, with the remaining (non binary) outputs and `"chunked": true`.
+        """
+        result = message.get("result") or {}
+        binary_outputs = {
+            tag: value if isinstance(value, list) else [value]
+            for tag, value in result.items()
+            if isinstance(value, bytes)
+            or (isinstance(value, list) and value and all(isinstance(item, bytes) for item in value))
+        }
+        if not binary_outputs:
+            await self.sio.call("return", message, timeout=config.GATEWAY_ACK_TIMEOUT)
+            return
+
+        taskId = message.get("taskId")
+        chunk_size = config.GATEWAY_CHUNK_SIZE
+        await self.sio.call(
+            "return_manifest",
+            {
+                "taskId": taskId,
+                "name": message.get("name"),
+                "chunk_size": chunk_size,
+                "outputs": {
+                    tag: {
+                        "multiple": isinstance(result[tag], list),
+                        "items": [
+                            {"index": index, "size": len(item), "chunks": max(math.ceil(len(item) / chunk_size), 1)}
+                            for index, item in enumerate(items)
+                        ],
+                    }
+                    for tag, items in binary_outputs.items()
+                },
+            },
+            timeout=config.GATEWAY_ACK_TIMEOUT,
+        )
+
+        window = asyncio.Semaphore(config.GATEWAY_CHUNK_WINDOW)
+
+        async def send_chunk(chunk: dict):
+            try:
+                await self.sio.call("return_chunk", chunk, timeout=config.GATEWAY_ACK_TIMEOUT)
+            finally:
+                window.release()
+
+        pending = []
+        try:
+            for tag, items in binary_outputs.items():
+                for index, item in enumerate(items):
+                    view = memoryview(item)
+                    chunks = max(math.ceil(len(item) / chunk_size), 1)
+                    for seq in range(chunks):
+                        await window.acquire()
+                        # Fail fast if a previous chunk was not acknowledged
+                        for task in pending:
+                            if task.done() and task.exception():
+                                raise task.exception()
+                        chunk = {
+                            "taskId": taskId,
+                            "tag": tag,
+                            "index": index,
+                            "seq": seq,
+                            "last": seq == chunks - 1,
+                            "data": bytes(view[seq * chunk_size:(seq + 1) * chunk_size]),
+                        }
+                        pending.append(asyncio.create_task(send_chunk(chunk)))
+            await asyncio.gather(*pending)
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+
+        remaining = {tag: value for tag, value in result.items() if tag not in binary_outputs}
+        await self.sio.call(
+            "return", {**message, "result": remaining, "chunked": True}, timeout=config.GATEWAY_ACK_TIMEOUT
+        )
+
+    async def flush_outbox(self):
+        """
+        Delivers the pending results in order, each one being removed once acknowledged by the gateway.
+        Stops at the first failure, the remaining results are replayed on the next reconnection.
+        """
+        async with self._outbox_lock:
+            for entry_id in self._outbox.entries():
+                if not self.sio.connected:
+                    return
+                try:
+                    message = await self._outbox.load(entry_id)
+                    await self.send_result(message)
+                except Exception as e:
+                    connect_print(f"Résultat {entry_id} non acquitté, il sera renvoyé à la reconnexion: {e!r}")
+                    return
+                await self._outbox.remove(entry_id)
+
+    def _flush_in_background(self):
+        """Starts replaying the outbox, unless a replay is still running (it goes on with the new connection)"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.flush_outbox())
+            self._flush_task.add_done_callback(self._on_flushed)
+
+    def _on_flushed(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            connect_print(f"Erreur lors du renvoi des résultats en attente: {task.exception()!r}")
+
+    async def send_heartbeat(self):
+        """Advertises the free slots and the queue depth of this node to the gateway"""
+        if self.sio.connected:
+            try:
+                await self.sio.emit("heartbeat", {**self.capacity, "timestamp": time.time()})
+            except Exception as e:
+                connect_print(f"Erreur lors de l'envoi du heartbeat: {e}")
+
+    async def send_heartbeats(self):
+        """Background task to send periodic heartbeats"""
+        while True:
+            await self.send_heartbeat()
+            await asyncio.sleep(config.GATEWAY_HEARTBEAT_INTERVAL)
+
     async def send_gpu_info(self):
         """Background task to send periodic GPU information"""
         while True:
@@ -52,8 +366,29 @@ class WebSocketController:
                 await self.sio.emit("gpu_info", gpu_info)
             await asyncio.sleep(config.GPU_INFO_INTERVAL)
 
-    async def start_socket_connection(self):
-        """Initialize WebSocket connection to gateway server"""
+    async def start_socket_connection(self, socket_server_url: str):
+        """Maintains the WebSocket connection to the gateway server, reconnecting with jittered backoff"""
+        attempt = 0
+        while True:
+            try:
+                await self.sio.connect(socket_server_url)
+                connect_print(f"Connecté au serveur SocketIO à {socket_server_url}")
+                attempt = 0
+                # Replay the results finished while disconnected
+                self._flush_in_background()
+                await self.sio.wait()
+            except Exception as e:
+                connect_print(f"Connexion au serveur SocketIO impossible: {e}")
+
+            # Full jitter, so a restarted gateway is not hit by every node at once
+            delay = min(config.GATEWAY_RECONNECT_MAX_DELAY, config.GATEWAY_RECONNECT_BASE_DELAY * 2**attempt)
+            delay = random.uniform(0, delay)
+            attempt += 1
+            connect_print(f"Reconnexion au serveur SocketIO dans {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def initialize(self, app):
+        """Initialize WebSocket tasks when application starts"""
         socket_server_url = config.user_settings.get("Connect.GatewayEndpoint")
         if not socket_server_url:
             connect_print(
@@ -61,11 +396,17 @@ class WebSocketController:
             )
             return
 
-        await self.sio.connect(socket_server_url)
-        connect_print(f"Connecté au serveur SocketIO à {socket_server_url}")
-        await self.sio.wait()
+        # Imported here, so ComfyUI doesn't pay for it at startup when no gateway is used
+        import socketio
 
-    async def initialize(self, app):
-        """Initialize WebSocket tasks when application starts"""
-        asyncio.create_task(self.start_socket_connection())
+        # Reconnection is handled by start_socket_connection, with jittered backoff
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self._outbox = await asyncio.to_thread(
+            ResultOutbox, config.OUTBOX_PATH, config.OUTBOX_MAX_BYTES, config.OUTBOX_INLINE_MAX_BYTES
+        )
+        self.setup_event_handlers()
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(config.gateway_workers)]
+        asyncio.create_task(self.start_socket_connection(socket_server_url))
         asyncio.create_task(self.send_gpu_info())
+        asyncio.create_task(self.send_heartbeats())
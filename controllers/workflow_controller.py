@@ -1,7 +1,109 @@
+import os
 import server
+import time
+import uuid
+import asyncio
 from aiohttp import web
 from ..services.workflow_service import WorkflowService
-from ..utils.helpers import connect_print
+from ..services.errors import (
+    ExecutionCancelled,
+    ValidationError,
+    IdempotencyConflict,
+    ExecutionConflict,
+    VramExceeded,
+)
+from ..services.traffic_recorder import traffic_recorder
+from ..services.cpu_executor import cpu_executor
+from ..services.download_links import download_links
+from ..services.preview_relay import PreviewRelay
+from ..entities.preview_frame import PreviewFrame
+from ..utils.helpers import connect_print, content_disposition
+from ..utils.timing import ExecutionTimer
+from ..utils.deadline import Deadline, DeadlineExceeded
+from ..config import config
+
+
+class OutputStream:
+    """
+    Streams the outputs of an execution as each tagged node finishes, then its final response,
+    as server-sent events ("output", then "result" or "error") or as NDJSON lines (one object per
+    output, then the final response). The response is only started by the first event: until then,
+    failures are answered with their usual status code.
+    With previews enabled, the sampling previews are sent as "preview" events in between.
+    """
+
+    CONTENT_TYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+    def __init__(self, request, stream_format: str, headers: dict):
+        self.request = request
+        self.format = stream_format
+        self.headers = headers
+        self.response = None
+        self.status = None
+        self.previews = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_request(cls, request, headers: dict):
+        """Returns a stream if the client accepts one of the streamed formats, None otherwise"""
+        accept = request.headers.get("Accept", "")
+        for stream_format, content_type in cls.CONTENT_TYPES.items():
+            if content_type in accept:
+                return cls(request, stream_format, headers)
+        return None
+
+    @property
+    def started(self) -> bool:
+        return self.response is not None
+
+    async def send(self, event: str, data: dict) -> None:
+        async with self._lock:
+            if self.response is None:
+                self.response = web.StreamResponse(headers={**self.headers, "Cache-Control": "no-cache"})
+                self.response.content_type = self.CONTENT_TYPES[self.format]
+                await self.response.prepare(self.request)
+            body = await cpu_executor.dumps(data)
+            if self.format == "sse":
+                await self.response.write(b"event: " + event.encode("utf-8") + b"\ndata: ")
+            # Written in chunks, like large JSON responses
+            view = memoryview(body)
+            for offset in range(0, len(body), config.RESPONSE_CHUNK_SIZE):
+                await self.response.write(view[offset:offset + config.RESPONSE_CHUNK_SIZE])
+            await self.response.write(b"\n\n" if self.format == "sse" else b"\n")
+
+    async def output(self, tag: str, value, thumbnail=None, media_type=None) -> None:
+        """Sends the result of a tag, as soon as its node is executed"""
+        data = {"event": "output", "tag": tag, "value": value, "media_type": media_type}
+        if thumbnail:
+            data["thumbnail"] = thumbnail
+        await self.send("output", data)
+
+    def enable_previews(self, interval: float):
+        """Returns the function relaying the preview frames of the execution to the stream"""
+        self.previews = PreviewRelay(self.preview, interval)
+        return self.previews.push
+
+    async def preview(self, frame: PreviewFrame) -> None:
+        """Sends a preview frame, its image in base64"""
+        data = await cpu_executor.b64encode(frame.data)
+        await self.send(
+            "preview", {"event": "preview", "node": frame.node_id, "media_type": frame.media_type, "data": data}
+        )
+
+    async def close_previews(self) -> None:
+        """Stops sending previews, the frame being sent is finished"""
+        if self.previews is not None:
+            await self.previews.close()
+
+    async def finish(self, body: dict, status: int = 200) -> web.StreamResponse:
+        """Sends the final response, the aggregated result or the error, and ends the stream"""
+        self.status = status
+        # No preview after the final event
+        await self.close_previews()
+        event = "result" if status == 200 else "error"
+        await self.send(event, {"event": event, "code": status, **body})
+        await self.response.write_eof()
+        return self.response
 
 
 class WorkflowController:
@@ -9,6 +111,227 @@ class WorkflowController:
         self.service = service
         self.setup_routes()
 
+    async def _wait_unless_disconnected(
+        self, request, execution: asyncio.Task, execution_id: str, idempotent: bool = False
+    ):
+        """
+        Waits for an execution, cancelling it if the HTTP client disconnects meanwhile,
+        so an abandoned request doesn't keep the GPU busy.
+        Executions with an idempotency key keep running instead, for the client to retry.
+        """
+        try:
+            while True:
+                done, _ = await asyncio.wait({execution}, timeout=config.DISCONNECT_CHECK_INTERVAL)
+                if done:
+                    return execution.result()
+                if request.transport is None or request.transport.is_closing():
+                    if idempotent:
+                        connect_print(f"Client disconnected, execution '{execution_id}' kept for a retry")
+                        # Only stops waiting, the execution itself is shielded
+                        execution.cancel()
+                        return None
+                    connect_print(f"Client disconnected, cancelling execution '{execution_id}'")
+                    self.service.cancel_execution(execution_id)
+                    return await execution
+        except asyncio.CancelledError:
+            # The handler itself has been cancelled by the server
+            execution.cancel()
+            raise
+
+    async def _json_body_response(self, request, body: bytes, headers: dict) -> web.StreamResponse:
+        """
+        Returns a serialized JSON body. Large bodies are written in chunks, as writing them at once
+        blocks the event loop while the whole body is copied into the transport.
+        """
+        if len(body) <= config.RESPONSE_CHUNK_SIZE:
+            return web.Response(body=body, content_type="application/json", headers=headers)
+
+        response = web.StreamResponse(headers=headers)
+        response.content_type = "application/json"
+        response.content_length = len(body)
+        await response.prepare(request)
+        view = memoryview(body)
+        for offset in range(0, len(body), config.RESPONSE_CHUNK_SIZE):
+            await response.write(view[offset:offset + config.RESPONSE_CHUNK_SIZE])
+        await response.write_eof()
+        return response
+
+    async def _read_multipart(self, request, name: str, deadline: Deadline) -> dict:
+        """
+        Reads a multipart execution request: a JSON "params" part, and file parts named after
+        the input they are meant for ("$tag.input" or "tag.input").
+        Files are streamed to the ComfyUI input directory as they arrive, without being buffered.
+
+        :return: The execution parameters, the uploaded file names being set into their inputs.
+        :raises ValueError: If a part is malformed.
+        :raises ValidationError: If a file is sent to an input that doesn't accept one.
+        """
+        params = {}
+        uploads = []
+        reader = await request.multipart()
+        while True:
+            part = await reader.next()
+            if part is None:
+                break
+
+            if part.filename is None:
+                if part.name != "params":
+                    raise ValueError(f"Unexpected form field '{part.name}', only 'params' and files are accepted.")
+                params = await part.json() or {}
+                if not isinstance(params, dict):
+                    raise ValueError("The 'params' field must be a JSON object.")
+                continue
+
+            tag, _, input_name = (part.name or "").lstrip("$").partition(".")
+            if not tag or not input_name:
+                raise ValueError(f"File field '{part.name}' must be named '$tag.input'.")
+            # Rejected before receiving the file
+            self.service.validate_upload(name, tag, input_name)
+
+            async def chunks(part=part):
+                while True:
+                    chunk = await part.read_chunk(config.UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+
+            filename = await self.service.ingest_upload(tag, input_name, part.filename, chunks(), deadline)
+            uploads.append((tag, input_name, filename))
+
+        # The params part may come before or after the files, uploads are merged once everything is read
+        for tag, input_name, filename in uploads:
+            if params.get(tag) is False:
+                # Bypassed nodes
+                continue
+            if not isinstance(params.get(tag), dict):
+                params[tag] = {}
+            params[tag][input_name] = filename
+        return params
+
+    async def _error_response(self, stream: OutputStream, body: dict, status: int, headers: dict):
+        # Once outputs are streamed, the error can only be the last event of the stream
+        if stream is not None:
+            # A preview being sent may start the stream
+            await stream.close_previews()
+            if stream.started:
+                return await stream.finish(body, status)
+        return web.json_response(body, status=status, headers=headers)
+
+    async def _execute_workflow_request(self, request, name: str, timer: ExecutionTimer, trace: dict):
+        """
+        Runs a workflow execution request and returns its response, streamed if the client accepts it.
+        The parsed parameters and the output stream are set into `trace` for the traffic recorder.
+        """
+        # Deadline of the whole execution, from the header, the payload or the workflow default
+        deadline = None
+        try:
+            if request.content_type.startswith("multipart/"):
+                # Files are uploaded before the payload is complete, within the header or default deadline
+                deadline = Deadline.from_value(
+                    request.headers.get("X-Timeout") or config.get_workflow_timeout(name)
+                )
+                params = await self._read_multipart(request, name, deadline)
+            else:
+                params = await cpu_executor.loads(await request.read())
+                if not isinstance(params, dict):
+                    raise ValueError("The payload must be a JSON object.")
+
+            payload_timeout = params.pop("_timeout", None)
+            if deadline is None or (payload_timeout and not request.headers.get("X-Timeout")):
+                timeout = request.headers.get("X-Timeout") or payload_timeout
+                deadline = Deadline.from_value(timeout or config.get_workflow_timeout(name))
+        except DeadlineExceeded as e:
+            return web.json_response({"status": "timeout", "workflow": name, "message": str(e)}, status=504)
+        except FileNotFoundError as e:
+            return web.json_response({"status": "error", "message": str(e)}, status=404)
+        except ValidationError as e:
+            return web.json_response(
+                {"status": "error", "message": "Invalid parameters.", "errors": e.errors}, status=400
+            )
+        except ValueError as e:
+            return web.json_response({"status": "error", "message": str(e)}, status=400)
+
+        # Extract token from payload if provided
+        override_token = params.pop("_token", None)  # Remove _token from params
+        previews = params.pop("_previews", False)
+        trace["params"] = params
+        
+        # Clients can pass their own id to cancel the execution later
+        execution_id = request.headers.get("X-Request-Id") or str(uuid.uuid4())
+
+        # Retries with the same key share one execution
+        idempotency_key = request.headers.get("Idempotency-Key")
+
+        # Clients accepting a stream get each output as soon as its node is executed
+        headers = {"X-Request-Id": execution_id}
+        stream = OutputStream.from_request(request, headers)
+        trace["stream"] = stream
+        # Streams can also get the sampling previews, with `"_previews": true`
+        on_preview = stream.enable_previews(config.preview_interval) if stream and previews is True else None
+
+        connect_print(f"POST /connect/workflows/{name} - Running workflow ...")
+        execution = asyncio.create_task(
+            self.service.execute_workflow(
+                name,
+                params,
+                override_token,
+                execution_id=execution_id,
+                deadline=deadline,
+                idempotency_key=f"http:{idempotency_key}" if idempotency_key else None,
+                timer=timer,
+                on_output=stream.output if stream else None,
+                media_links=True,
+                on_preview=on_preview,
+            )
+        )
+        try:
+            result = await self._wait_unless_disconnected(
+                request, execution, execution_id, idempotent=bool(idempotency_key)
+            )
+        except (IdempotencyConflict, ExecutionConflict) as e:
+            return await self._error_response(
+                stream, {"status": "error", "workflow": name, "message": str(e)}, 409, headers
+            )
+        except ExecutionCancelled as e:
+            return await self._error_response(
+                stream, {"status": "cancelled", "workflow": name, "message": str(e)}, 499, headers
+            )
+        except DeadlineExceeded as e:
+            return await self._error_response(
+                stream, {"status": "timeout", "workflow": name, "message": str(e)}, 504, headers
+            )
+        except FileNotFoundError as e:
+            return await self._error_response(
+                stream, {"status": "error", "workflow": name, "message": str(e)}, 404, headers
+            )
+        except ValidationError as e:
+            return await self._error_response(
+                stream,
+                {"status": "error", "workflow": name, "message": "Invalid parameters.", "errors": e.errors},
+                400,
+                headers,
+            )
+        except VramExceeded as e:
+            return await self._error_response(
+                stream, {"status": "error", "workflow": name, "message": str(e)}, 503, headers
+            )
+        except ConnectionError as e:
+            return await self._error_response(
+                stream, {"status": "error", "workflow": name, "message": str(e)}, 502, headers
+            )
+        except Exception as e:
+            if stream is not None:
+                await stream.close_previews()
+            if stream is None or not stream.started:
+                raise
+            connect_print(f"Error while streaming workflow {name}: {e}")
+            return await stream.finish({"status": "error", "workflow": name, "message": str(e)}, 500)
+        if stream is not None:
+            return await stream.finish({"status": "success", "workflow": name, "result": result})
+        # Serialized off the event loop when the outputs are large
+        body = await cpu_executor.dumps({"status": "success", "workflow": name, "result": result})
+        return await self._json_body_response(request, body, headers)
+
     def setup_routes(self):
         """Setup workflow-related routes"""
         
@@ -36,15 +359,58 @@ class WorkflowController:
 
         @server.PromptServer.instance.routes.post("/connect/workflows/{name}")
         async def execute_workflow(request):
-            params = await request.json()
             name = request.match_info["name"]
+            arrival = time.time()
+            recorded = traffic_recorder.sample()
+
+            timer = ExecutionTimer(name)
+            trace = {}
+            response = await self._execute_workflow_request(request, name, timer, trace)
+            if recorded:
+                # A streamed response has started with a 200, its final status is in its last event
+                stream = trace.get("stream")
+                status = stream.status if stream is not None and stream.started else response.status
+                traffic_recorder.record_in_background(
+                    "http",
+                    arrival,
+                    name,
+                    trace.get("params"),
+                    str(status),
+                    timer.as_dict(),
+                    schema=self.service.param_schema(name),
+                )
+            return response
 
-            # Extract token from payload if provided
-            override_token = params.pop("_token", None)  # Remove _token from params
-            
-            connect_print(f"POST /connect/workflows/{name} - Running workflow ...")
-            result = await self.service.execute_workflow(name, params, override_token)
-            return web.json_response({"status": "success", "workflow": name, "result": result})
+        @server.PromptServer.instance.routes.post("/connect/executions/{id}/cancel")
+        async def cancel_execution(request):
+            execution_id = request.match_info["id"]
+
+            connect_print(f"POST /connect/executions/{execution_id}/cancel - Cancelling execution ...")
+            if not self.service.cancel_execution(execution_id):
+                return web.json_response(
+                    {"status": "error", "message": f"No running execution '{execution_id}'."}, status=404
+                )
+            return web.json_response(
+                {"status": "success", "message": f"Execution '{execution_id}' cancelled."}
+            )
+
+        @server.PromptServer.instance.routes.get("/connect/downloads/{token}")
+        async def download_output(request):
+            link = download_links.resolve(request.match_info["token"])
+            if link is None or not os.path.isfile(link.path):
+                return web.json_response(
+                    {"status": "error", "message": "Unknown or expired download link."}, status=404
+                )
+            # Range requests are supported, the file is sent with sendfile when available
+            return web.FileResponse(
+                link.path,
+                chunk_size=config.RESPONSE_CHUNK_SIZE,
+                headers={
+                    "Content-Type": link.media_type,
+                    "Content-Disposition": content_disposition("inline", link.filename),
+                    "Cache-Control": "private, max-age=0",
+                },
+            )
 
         @server.PromptServer.instance.routes.get("/connect/workflow/cache_nodes")
         async def get_cached_nodes(request):
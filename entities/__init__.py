@@ -1,4 +1,6 @@
 # Entities package for ComfyUI-Connect
 # Contains domain models and business entities
  
-from .workflow import Workflow 
\ No newline at end of file
+from .workflow import Workflow 
+from .output_file import OutputFile
+from .preview_frame import PreviewFrame
\ No newline at end of file
@@ -0,0 +1,75 @@
+import mimetypes
+
+
+class OutputFile:
+    """
+    An output of an executed node, as listed in the ComfyUI history: a file (image, video, audio...)
+    or a text. Files are either retrieved (`data`) or, for large media on this machine, only located
+    (`path`), to be served from disk.
+    """
+
+    __slots__ = ("kind", "filename", "subfolder", "type", "media_type", "data", "path", "size")
+
+    def __init__(
+        self,
+        kind: str,
+        filename: str = None,
+        subfolder: str = "",
+        type: str = "output",
+        media_type: str = None,
+        data=None,
+        path: str = None,
+        size: int = None,
+    ):
+        self.kind = kind  # The history key listing the output ("images", "gifs", "audio", "text"...)
+        self.filename = filename
+        self.subfolder = subfolder
+        self.type = type  # ComfyUI folder type ("output", "temp" or "input")
+        self.media_type = media_type or guess_media_type(filename)
+        self.data = data  # bytes, a str for texts, None if only located
+        self.path = path
+        self.size = size
+
+    @property
+    def is_image(self) -> bool:
+        """Whether the output is a still image, the only outputs transcoded and thumbnailed"""
+        return self.kind == "images" and self.media_type.startswith("image/")
+
+    @property
+    def is_text(self) -> bool:
+        return self.filename is None
+
+    @classmethod
+    def text(cls, kind: str, value: str) -> "OutputFile":
+        return cls(kind, media_type="text/plain", data=value)
+
+    @classmethod
+    def from_history(cls, node_output: dict) -> list:
+        """
+        Lists the outputs of a node from its history entry (or `executed` message): every list
+        of files (`{"filename", "subfolder", "type"}`) whatever its key, and every list of texts.
+        """
+        outputs = []
+        for kind, items in node_output.items():
+            if not isinstance(items, list):
+                continue
+            for item in items:
+                if isinstance(item, dict) and item.get("filename"):
+                    media_type = guess_media_type(item["filename"])
+                    # Video nodes also give a format ("video/h264-mp4"), only used for unknown extensions
+                    if media_type == "application/octet-stream" and "/" in str(item.get("format") or ""):
+                        media_type = item["format"]
+                    outputs.append(
+                        cls(kind, item["filename"], item.get("subfolder", ""), item.get("type", "output"), media_type)
+                    )
+                elif isinstance(item, str):
+                    outputs.append(cls.text(kind, item))
+        return outputs
+
+
+def guess_media_type(filename: str) -> str:
+    """Returns the media type of a file name, "application/octet-stream" if unknown"""
+    if not filename:
+        return "application/octet-stream"
+    media_type, _ = mimetypes.guess_type(filename)
+    return media_type or "application/octet-stream"
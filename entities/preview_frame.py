@@ -0,0 +1,49 @@
+import json
+import struct
+from typing import Optional
+
+# Binary websocket events of ComfyUI: a 4-byte big-endian event type, then the event payload
+PREVIEW_IMAGE = 1  # 4-byte image type, then the image
+PREVIEW_IMAGE_WITH_METADATA = 4  # 4-byte metadata length, the metadata JSON, then the image
+
+IMAGE_TYPES = {1: "image/jpeg", 2: "image/png", 3: "image/webp"}
+
+
+class PreviewFrame:
+    """
+    A preview image sent by ComfyUI while a node runs (e.g. the latent being sampled). Frames without
+    metadata don't tell their prompt and node, they belong to the prompt being executed.
+    """
+
+    __slots__ = ("media_type", "data", "prompt_id", "node_id")
+
+    def __init__(self, media_type: str, data: bytes, prompt_id: str = None, node_id: str = None):
+        self.media_type = media_type
+        self.data = data
+        self.prompt_id = prompt_id
+        self.node_id = node_id
+
+    @classmethod
+    def decode(cls, message: bytes) -> Optional["PreviewFrame"]:
+        """
+        Decodes a binary websocket message of ComfyUI.
+
+        :return: The preview frame, None if the message is another binary event.
+        :raises ValueError: If the message is truncated or its metadata is not JSON.
+        """
+        if len(message) < 8:
+            raise ValueError(f"Binary message of {len(message)} bytes is too short.")
+        event, header = struct.unpack_from(">II", message)
+        if event == PREVIEW_IMAGE:
+            return cls(IMAGE_TYPES.get(header, "application/octet-stream"), message[8:])
+        if event == PREVIEW_IMAGE_WITH_METADATA:
+            if len(message) < 8 + header:
+                raise ValueError("Preview metadata is truncated.")
+            metadata = json.loads(message[8:8 + header])
+            return cls(
+                metadata.get("image_type") or "image/jpeg",
+                message[8 + header:],
+                metadata.get("prompt_id"),
+                metadata.get("node_id"),
+            )
+        return None
@@ -1,4 +1,9 @@
 import re
+from ..utils.helpers import connect_print
+
+
+# Regex to detect tags and capture the base tag name only (without parentheses and content)
+TAG_PATTERN = re.compile(r"(\$[a-zA-Z0-9_-]+|#[a-zA-Z0-9_-]+|![a-zA-Z0-9_-]+)(?:\([^)]*\))?")
 
 
 def lowerSingular(string):
@@ -30,15 +35,13 @@ class Workflow(dict):
         If a specific tag is provided, only nodes containing that tag are returned.
         """
         tagged_nodes = []
-        # Regex to detect tags and capture the base tag name only (without parentheses and content)
-        pattern = r"(\$[a-zA-Z0-9_-]+|#[a-zA-Z0-9_-]+|![a-zA-Z0-9_-]+)(?:\([^)]*\))?"
 
         for node_id, node_data in self.items():
             title = node_data.get("_meta", {}).get("title", "")
             if not title:
                 continue
 
-            found_tags = re.findall(pattern, title)
+            found_tags = TAG_PATTERN.findall(title)
             if found_tags:
                 tagged_nodes.append(
                     {"id": node_id, "node": node_data, "tags": found_tags}
@@ -214,6 +217,58 @@ class Workflow(dict):
                                     f"⚡ Could not find wire for {input_name} in {ref_node['class_type']} (id {ref_node_id})"
                                 )
 
+    def get_output_node_ids(self, output_classes=()) -> list:
+        """
+        Returns the ids of the nodes producing results: nodes with an output tag (#tag)
+        and nodes whose class_type is one of the given output classes.
+        """
+        output_ids = []
+        for node_id, node_data in self.items():
+            if node_data.get("class_type") in output_classes:
+                output_ids.append(node_id)
+                continue
+
+            title = node_data.get("_meta", {}).get("title", "")
+            if "#" not in title:
+                continue
+            for tag_type, _, _, _ in map(self._parse_tag, TAG_PATTERN.findall(title)):
+                if tag_type == "output":
+                    output_ids.append(node_id)
+                    break
+
+        return output_ids
+
+    def remove_unreachable_nodes(self, root_ids) -> int:
+        """
+        Removes every node that does not feed, directly or through other nodes, one of the root nodes
+        (e.g. loaders and encoders left orphaned once their consumers have been bypassed).
+        Nothing is removed if no root node exists in the workflow.
+
+        :return: The number of removed nodes.
+        """
+        pending = [node_id for node_id in root_ids if node_id in self]
+        if not pending:
+            return 0
+
+        reachable = set(pending)
+        while pending:
+            node = self[pending.pop()]
+            for input_value in node.get("inputs", {}).values():
+                if isinstance(input_value, list) and input_value:
+                    source_id = str(input_value[0])
+                    if source_id in self and source_id not in reachable:
+                        reachable.add(source_id)
+                        pending.append(source_id)
+
+        removed = [node_id for node_id in self if node_id not in reachable]
+        for node_id in removed:
+            del self[node_id]
+        if removed:
+            # One line, listing thousands of nodes would flood the logs
+            connect_print(f"Removed {len(removed)} unreachable nodes")
+
+        return len(removed)
+
     @staticmethod
     def _parse_tag(tag_str: str):
         """
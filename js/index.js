@@ -25,6 +25,66 @@ app.registerExtension({
       name: "ComfyUI Gateway Endpoint",
       type: "text",
     },
+    {
+      id: "Connect.GatewayBinaryTransfer",
+      name: "Gateway Binary Results (disable for gateways expecting base64)",
+      type: "boolean",
+      defaultValue: true,
+    },
+    {
+      id: "Connect.GatewayWorkers",
+      name: "Gateway Concurrent Tasks",
+      type: "text",
+    },
+    {
+      id: "Connect.CacheVramBudgetMB",
+      name: "Cached Nodes VRAM Budget (MB, 0 for unlimited)",
+      type: "text",
+    },
+    {
+      id: "Connect.TrafficRecording",
+      name: "Record Traffic (for capacity planning replays)",
+      type: "boolean",
+      defaultValue: false,
+    },
+    {
+      id: "Connect.TrafficSampleRate",
+      name: "Recorded Traffic Sample Rate (0 to 1)",
+      type: "text",
+    },
+    {
+      id: "Connect.CpuExecutor",
+      name: "CPU-bound Work Executor (base64, JSON, encoding; process forks ComfyUI, test before use)",
+      type: "combo",
+      options: ["thread", "process", "inline"],
+      defaultValue: "thread",
+    },
+    {
+      id: "Connect.MediaInlineMaxMB",
+      name: "Media Outputs Returned Inline up to (MB, larger ones as download links)",
+      type: "text",
+    },
+    {
+      id: "Connect.DefaultResultSink",
+      name: "Default Result Sink (name from Connect.ResultSinks, empty to return outputs inline)",
+      type: "text",
+    },
+    {
+      id: "Connect.PreviewMaxFps",
+      name: "Preview Frames Sent per Second at Most",
+      type: "text",
+    },
+    {
+      id: "Connect.VramAdmission",
+      name: "Hold Executions Until Their Expected VRAM Is Free",
+      type: "boolean",
+      defaultValue: false,
+    },
+    {
+      id: "Connect.VramHeadroomPercent",
+      name: "VRAM Kept Free by the Admission (%)",
+      type: "text",
+    },
   ],
 
   commands: [
@@ -0,0 +1,193 @@
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+from ..config import config
+from ..entities.workflow import TAG_PATTERN
+
+
+class PromptTrace:
+    """Execution trace of a single prompt, built from the ComfyUI websocket messages"""
+
+    def __init__(self):
+        self.name = None
+        self.nodes = {}  # node_id => {"title", "class_type", "tags"}
+        self.cached = []
+        self.durations = {}  # node_id => seconds
+        self.current_node = None
+        self.current_start = None
+        self.failed = False
+
+    def enter_node(self, node_id: Optional[str], now: float) -> None:
+        if self.current_node is not None:
+            self.durations[self.current_node] = (
+                self.durations.get(self.current_node, 0.0) + now - self.current_start
+            )
+        self.current_node = node_id
+        self.current_start = now
+
+
+def _new_workflow_stats() -> dict:
+    return {"executions": 0, "failures": 0, "cache_hits": 0, "cache_misses": 0, "nodes": {}}
+
+
+def _new_node_stats(info: dict) -> dict:
+    return {
+        "title": info.get("title", ""),
+        "class_type": info.get("class_type"),
+        "tags": info.get("tags", []),
+        "cache_hits": 0,
+        "executions": 0,
+        "total_time": 0.0,
+        "max_time": 0.0,
+    }
+
+
+class ExecutionAnalytics:
+    """
+    Collects, per workflow and per node, the ComfyUI cache hits (nodes listed by `execution_cached`)
+    and execution durations (time between `executing` transitions).
+    Finished prompts are aggregated per ANALYTICS_BUCKET seconds, kept for ANALYTICS_RETENTION seconds
+    and summed over rolling windows.
+    """
+
+    MAX_PENDING_TRACES = 1000
+
+    def __init__(self):
+        self._traces: "OrderedDict[str, PromptTrace]" = OrderedDict()
+        # Executions aggregated per ANALYTICS_BUCKET seconds, so memory doesn't grow with the request rate:
+        # (bucket start, {name: workflow stats})
+        self._buckets = deque()
+
+    def _trace(self, prompt_id: str) -> PromptTrace:
+        trace = self._traces.get(prompt_id)
+        if trace is None:
+            # Messages may arrive before the prompt is registered, the trace is created on first sight
+            trace = self._traces[prompt_id] = PromptTrace()
+            while len(self._traces) > self.MAX_PENDING_TRACES:
+                self._traces.popitem(last=False)
+        return trace
+
+    def start_prompt(self, prompt_id: str, name: str, workflow: dict) -> None:
+        """
+        Registers a prompt queued for a workflow, so its nodes can be mapped back to titles and tags.
+
+        :param prompt_id: The ComfyUI prompt id.
+        :param name: Name of the executed workflow.
+        :param workflow: The workflow sent to ComfyUI.
+        """
+        trace = self._trace(prompt_id)
+        trace.name = name
+        for node_id, node in workflow.items():
+            title = node.get("_meta", {}).get("title", "")
+            trace.nodes[str(node_id)] = {
+                "title": title,
+                "class_type": node.get("class_type"),
+                "tags": TAG_PATTERN.findall(title),
+            }
+
+    def on_message(self, message: dict) -> None:
+        """Handles a ComfyUI websocket message"""
+        data = message.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if not prompt_id:
+            return
+
+        message_type = message.get("type")
+        if message_type == "execution_cached":
+            self._trace(prompt_id).cached.extend(str(node_id) for node_id in data.get("nodes", []))
+        elif message_type in ("execution_error", "execution_interrupted"):
+            self._trace(prompt_id).failed = True
+        elif message_type == "executing":
+            trace = self._trace(prompt_id)
+            trace.enter_node(data.get("node"), time.monotonic())
+            if data.get("node") is None:
+                self._finish(prompt_id)
+
+    def _finish(self, prompt_id: str) -> None:
+        trace = self._traces.pop(prompt_id, None)
+        if trace is None or trace.name is None:
+            # Not one of our executions
+            return
+
+        now = time.time()
+        start = now - now % config.ANALYTICS_BUCKET
+        if not self._buckets or self._buckets[-1][0] != start:
+            self._buckets.append((start, {}))
+        stats = self._buckets[-1][1].setdefault(trace.name, _new_workflow_stats())
+        stats["executions"] += 1
+        stats["failures"] += int(trace.failed)
+        stats["cache_hits"] += len(trace.cached)
+        stats["cache_misses"] += len(trace.durations)
+        for node_id in set(trace.cached) | trace.durations.keys():
+            node_stats = stats["nodes"].get(node_id)
+            if node_stats is None:
+                info = trace.nodes.get(node_id, {})
+                node_stats = stats["nodes"][node_id] = _new_node_stats(info)
+            if node_id in trace.durations:
+                duration = trace.durations[node_id]
+                node_stats["executions"] += 1
+                node_stats["total_time"] += duration
+                node_stats["max_time"] = max(node_stats["max_time"], duration)
+            else:
+                node_stats["cache_hits"] += 1
+        self._expire()
+
+    def _expire(self) -> None:
+        expire_before = time.time() - config.ANALYTICS_RETENTION
+        while self._buckets and self._buckets[0][0] + config.ANALYTICS_BUCKET < expire_before:
+            self._buckets.popleft()
+
+    def report(self, window: float, name: str = None) -> Dict[str, dict]:
+        """
+        Aggregates the executions of the last `window` seconds (to the ANALYTICS_BUCKET granularity).
+
+        :param window: Size of the rolling window in seconds.
+        :param name: Optional workflow name to restrict the report to.
+        :return: A dictionary keyed by workflow name with cache ratios and per node statistics,
+                 nodes being sorted by total execution time (the ones dominating runtime first).
+        """
+        self._expire()
+        since = time.time() - window
+        workflows = {}
+
+        for start, bucket in self._buckets:
+            if start + config.ANALYTICS_BUCKET <= since:
+                continue
+            for workflow_name, bucket_stats in bucket.items():
+                if name and workflow_name != name:
+                    continue
+                stats = workflows.setdefault(workflow_name, _new_workflow_stats())
+                for key in ("executions", "failures", "cache_hits", "cache_misses"):
+                    stats[key] += bucket_stats[key]
+                for node_id, bucket_node in bucket_stats["nodes"].items():
+                    node_stats = stats["nodes"].get(node_id)
+                    if node_stats is None:
+                        node_stats = stats["nodes"][node_id] = _new_node_stats(bucket_node)
+                    node_stats["cache_hits"] += bucket_node["cache_hits"]
+                    node_stats["executions"] += bucket_node["executions"]
+                    node_stats["total_time"] += bucket_node["total_time"]
+                    node_stats["max_time"] = max(node_stats["max_time"], bucket_node["max_time"])
+
+        for stats in workflows.values():
+            lookups = stats["cache_hits"] + stats["cache_misses"]
+            stats["hit_ratio"] = round(stats["cache_hits"] / lookups, 4) if lookups else None
+
+            nodes = []
+            for node_id, node_stats in stats["nodes"].items():
+                lookups = node_stats["cache_hits"] + node_stats["executions"]
+                node_stats["id"] = node_id
+                node_stats["hit_ratio"] = round(node_stats["cache_hits"] / lookups, 4)
+                node_stats["avg_time"] = (
+                    round(node_stats["total_time"] / node_stats["executions"], 4)
+                    if node_stats["executions"] else None
+                )
+                node_stats["total_time"] = round(node_stats["total_time"], 4)
+                node_stats["max_time"] = round(node_stats["max_time"], 4)
+                nodes.append(node_stats)
+            stats["nodes"] = sorted(nodes, key=lambda n: n["total_time"], reverse=True)
+
+        return workflows
+
+
+# Global analytics instance
+execution_analytics = ExecutionAnalytics()
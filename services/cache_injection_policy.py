@@ -0,0 +1,92 @@
+import os
+import time
+from typing import Dict, Iterable
+from ..config import config
+from .cached_node_index import CachedNodeIndex
+
+
+class CacheInjectionPolicy:
+    """
+    Decides which cached nodes of other workflows are worth injecting into an execution.
+
+    A cached node is injected only if:
+    - the executed workflow doesn't already contain an identical node,
+    - it has been executed recently (so its models are most likely still resident in memory),
+    - it fits, most recently used first, into the configured VRAM budget (estimated from model file sizes).
+    """
+
+    def __init__(self, index: CachedNodeIndex):
+        self.index = index
+        self._last_used: Dict[str, float] = {}  # node content hash => last execution timestamp
+        self._vram_estimates: Dict[str, int] = {}  # node content hash => estimated bytes
+
+    def mark_used(self, node_hashes: Iterable[str]) -> None:
+        """
+        Records that nodes have just been executed by ComfyUI.
+
+        :param node_hashes: Content hashes of the executed nodes.
+        """
+        now = time.time()
+        for node_hash in node_hashes:
+            self._last_used[node_hash] = now
+
+    def estimate_vram(self, node_hash: str, node: dict) -> int:
+        """
+        Estimates the memory held by a loader node as the size of the model files it references.
+        Nodes referencing no known model file are estimated to 0.
+        """
+        if node_hash in self._vram_estimates:
+            return self._vram_estimates[node_hash]
+
+        estimate = 0
+        try:
+            import folder_paths
+
+            for value in node.get("inputs", {}).values():
+                if not isinstance(value, str):
+                    continue
+                for folder_name in folder_paths.folder_names_and_paths:
+                    path = folder_paths.get_full_path(folder_name, value)
+                    if path and os.path.isfile(path):
+                        estimate += os.path.getsize(path)
+                        break
+        except Exception:
+            estimate = 0
+
+        self._vram_estimates[node_hash] = estimate
+        return estimate
+
+    def select(self, name: str) -> Dict[str, dict]:
+        """
+        Returns the cached nodes to inject into an execution of a workflow.
+
+        :param name: Name of the workflow being executed.
+        :return: A dictionary of content hash => node data (do not mutate).
+        """
+        candidates = self.index.get_injection(name)
+        if not candidates:
+            return {}
+
+        covered = self.index.get_workflow_hashes(name)
+        recent_after = time.time() - config.CACHE_INJECTION_RECENT_WINDOW
+        budget = config.cache_injection_vram_budget * 1024**2
+
+        recent = [
+            node_hash
+            for node_hash in candidates
+            if node_hash not in covered and self._last_used.get(node_hash, 0) >= recent_after
+        ]
+        recent.sort(key=lambda node_hash: self._last_used[node_hash], reverse=True)
+
+        selected = {}
+        used = 0
+        for node_hash in recent:
+            node = candidates[node_hash]
+            if budget > 0:
+                estimate = self.estimate_vram(node_hash, node)
+                if used + estimate > budget:
+                    continue
+                used += estimate
+            selected[node_hash] = node
+
+        return selected
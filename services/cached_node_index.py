@@ -0,0 +1,144 @@
+import json
+import hashlib
+from collections.abc import Mapping
+from typing import Dict, FrozenSet, List, Optional
+from ..entities.workflow import Workflow
+
+
+def node_content_hash(node: dict) -> str:
+    """
+    Returns a hash of what ComfyUI actually executes for a node (class and inputs),
+    so identical nodes titled differently in two workflows share the same hash.
+    """
+    content = {"class_type": node.get("class_type"), "inputs": node.get("inputs", {})}
+    return hashlib.sha1(
+        json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class CachedNodeIndex:
+    """
+    Index of the nodes tagged as "!cache" in each workflow.
+
+    The index is updated one workflow at a time when it changes, identical nodes are deduplicated
+    by content hash, and the set of nodes to inject into each workflow is computed once and reused
+    by every execution until a workflow change affects it.
+    """
+
+    def __init__(self, workflows: Mapping):
+        self.workflows = workflows
+        self._nodes_by_workflow: Optional[Dict[str, Dict[str, dict]]] = None  # name => {hash: node}
+        self._injections: Dict[str, Dict[str, dict]] = {}  # name => {hash: node}
+        self._workflow_hashes: Dict[str, FrozenSet[str]] = {}  # name => hashes of all its nodes
+
+    @property
+    def built(self) -> bool:
+        """Whether the index has been built, reading every workflow"""
+        return self._nodes_by_workflow is not None
+
+    def _index_workflow(self, name: str) -> Dict[str, dict]:
+        nodes = {}
+        for tagged_node in Workflow(self.workflows[name]).get_tagged_nodes("!cache"):
+            nodes.setdefault(node_content_hash(tagged_node["node"]), tagged_node["node"])
+        return nodes
+
+    def _ensure_built(self) -> Dict[str, Dict[str, dict]]:
+        if self._nodes_by_workflow is None:
+            nodes_by_workflow = {}
+            for name in self.workflows:
+                try:
+                    nodes_by_workflow[name] = self._index_workflow(name)
+                except KeyError:
+                    # Unreadable file, ignored until it changes
+                    continue
+            self._nodes_by_workflow = nodes_by_workflow
+            self._injections = {}
+        return self._nodes_by_workflow
+
+    def update(self, name: str) -> None:
+        """
+        Re-indexes a single workflow after it has been added, changed or removed.
+        Injection sets are only invalidated if the cached nodes of the workflow actually changed.
+
+        :param name: Name of the workflow that changed.
+        """
+        self._workflow_hashes.pop(name, None)
+
+        if self._nodes_by_workflow is None:
+            # Not built yet, it will be built from the current workflows on first use
+            return
+
+        nodes = None
+        if name in self.workflows:
+            try:
+                nodes = self._index_workflow(name)
+            except KeyError:
+                nodes = None
+
+        previous = self._nodes_by_workflow.get(name)
+        if (previous or {}).keys() == (nodes or {}).keys():
+            if nodes is None:
+                self._nodes_by_workflow.pop(name, None)
+            return
+
+        nodes_by_workflow = dict(self._nodes_by_workflow)
+        if nodes is None:
+            nodes_by_workflow.pop(name, None)
+        else:
+            nodes_by_workflow[name] = nodes
+        self._nodes_by_workflow = nodes_by_workflow
+        self._injections = {}
+
+    def get_injection(self, name: str) -> Dict[str, dict]:
+        """
+        Returns the cached nodes of every other workflow to inject into the given one, keyed by content hash.
+        Nodes identical to one of the workflow's own cached nodes, or to another workflow's, appear once.
+
+        :param name: Name of the workflow being executed.
+        :return: A dictionary of content hash => node data, shared between executions (do not mutate).
+        """
+        injection = self._injections.get(name)
+        if injection is not None:
+            return injection
+
+        nodes_by_workflow = self._ensure_built()
+        own_hashes = nodes_by_workflow.get(name, {}).keys()
+        injection = {}
+        for workflow_name, nodes in nodes_by_workflow.items():
+            if workflow_name == name:
+                continue
+            for node_hash, node in nodes.items():
+                if node_hash not in own_hashes:
+                    injection.setdefault(node_hash, node)
+
+        self._injections[name] = injection
+        return injection
+
+    def get_workflow_hashes(self, name: str) -> FrozenSet[str]:
+        """
+        Returns the content hashes of every node of a workflow, cached until the workflow changes.
+
+        :param name: Name of the workflow.
+        :return: A set of node content hashes.
+        """
+        hashes = self._workflow_hashes.get(name)
+        if hashes is None:
+            hashes = frozenset(
+                node_content_hash(node)
+                for node in self.workflows[name].values()
+                if isinstance(node, dict)
+            )
+            self._workflow_hashes[name] = hashes
+        return hashes
+
+    def list_nodes(self) -> List[dict]:
+        """
+        Returns every cached node with the name of the workflow it comes from.
+
+        :return: A list of {"workflow_name", "node"} dictionaries.
+        """
+        return [
+            {"workflow_name": workflow_name, "node": node}
+            for workflow_name, nodes in self._ensure_built().items()
+            for node in nodes.values()
+        ]
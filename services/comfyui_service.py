@@ -1,13 +1,23 @@
+import os
+import time
 import uuid
 import json
 import urllib.request
 import urllib.parse
 import aiohttp
-import base64
 import asyncio
-from typing import Dict, List
+import random
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
 from ..config import config
+from ..entities.output_file import OutputFile
+from ..entities.preview_frame import PreviewFrame
 from ..utils.helpers import connect_print
+from ..utils.timing import ExecutionTimer
+from ..utils.deadline import Deadline, DeadlineExceeded
+from .analytics_service import execution_analytics
+from .vram_admission import VramReservation
+from .cpu_executor import cpu_executor
 
 
 class ComfyUIService:
@@ -33,53 +43,198 @@ class ComfyUIService:
         self.CLIENT_ID = str(uuid.uuid4())
         self.ws = None
         self.session = None
-        self._message_queue = asyncio.Queue()
         self._prompt_events: Dict[str, asyncio.Event] = {}
+        self._prompt_started: Dict[str, asyncio.Event] = {}
+        # Prompts seen starting or finishing before their events were registered
+        self._early_prompts: "OrderedDict[str, str]" = OrderedDict()
+        # Prompts ComfyUI lost while we were disconnected (e.g. restarted), with the reason
+        self._prompt_errors: Dict[str, str] = {}
+        # Handlers of the outputs of the prompts being waited for, called as each output node finishes
+        self._prompt_outputs: Dict[str, Callable[[str, dict], None]] = {}
+        # Handlers of the preview frames of the prompts being waited for
+        self._prompt_previews: Dict[str, Callable[[PreviewFrame], None]] = {}
+        # Prompt and node ComfyUI is executing, the frames without metadata belong to them
+        self._executing: Optional[tuple] = None
+        # When the last websocket message was received (monotonic), /history is only polled after a silence
+        self._last_message_at = 0.0
         self._listener_task = None
+        # Reconciliations running after reconnections, referenced until they are done
+        self._reconcile_tasks: Set[asyncio.Task] = set()
         self._connected = False
+        self._ready = asyncio.Event()
 
-    async def connect(self):
-        """Establish connection to ComfyUI"""
-        if self._connected:
-            return
-
-        self.session = aiohttp.ClientSession()
-        
-        # Build WebSocket URL with token if available
+    def _ws_url(self) -> str:
+        # Build WebSocket URL with token if available, always with the same client id so ComfyUI
+        # keeps sending the messages of our prompts to the new connection
         ws_url = f"ws://{config.comfy_endpoint}/ws?clientId={self.CLIENT_ID}"
         if config.comfy_token:
             ws_url += f"&token={config.comfy_token}"
             connect_print("WebSocket connection using token authentication")
         else:
             connect_print("WebSocket connection using direct access (no token)")
-            
-        self.ws = await self.session.ws_connect(ws_url)
-        # Start the global websocket listener
-        self._listener_task = asyncio.create_task(self._listen_websocket())
-        self._connected = True
+        return ws_url
+
+    async def connect(self):
+        """Establish connection to ComfyUI, kept alive by a supervisor task"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+
+        # Start the global websocket supervisor
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._supervise_websocket())
 
-    async def _listen_websocket(self):
-        """Listen for WebSocket messages from ComfyUI"""
         try:
-            while True:
-                message = await self.ws.receive()
-                if message.type == aiohttp.WSMsgType.TEXT:
+            await asyncio.wait_for(self._ready.wait(), config.COMFY_CONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ConnectionError(
+                f"Could not connect to ComfyUI at {config.comfy_endpoint}"
+            ) from None
+
+    async def _supervise_websocket(self):
+        """
+        Keeps the websocket connected to ComfyUI: reconnects with jittered backoff when it drops,
+        then reconciles the prompts being waited for, whose messages may have been missed meanwhile.
+        """
+        attempt = 0
+        connected_once = False
+        while True:
+            try:
+                self.ws = await self.session.ws_connect(
+                    self._ws_url(), heartbeat=config.COMFY_WS_HEARTBEAT
+                )
+                attempt = 0
+                self._connected = True
+                self._ready.set()
+                if connected_once:
+                    connect_print("Reconnected to ComfyUI websocket")
+                    task = asyncio.create_task(self._reconcile_prompts())
+                    self._reconcile_tasks.add(task)
+                    task.add_done_callback(self._on_reconciled)
+                connected_once = True
+
+                await self._listen_websocket()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                connect_print(f"WebSocket connection error: {e}")
+            finally:
+                self._connected = False
+                self._executing = None
+                self._ready.clear()
+                if self.ws is not None and not self.ws.closed:
+                    await self.ws.close()
+
+            delay = min(config.COMFY_RECONNECT_MAX_DELAY, config.COMFY_RECONNECT_BASE_DELAY * 2**attempt)
+            delay = random.uniform(delay / 2, delay)
+            attempt += 1
+            connect_print(f"ComfyUI websocket disconnected, reconnecting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def _listen_websocket(self):
+        """Listen for WebSocket messages from ComfyUI, until the connection is closed"""
+        while True:
+            message = await self.ws.receive()
+            self._last_message_at = time.monotonic()
+            if message.type == aiohttp.WSMsgType.TEXT:
+                try:
                     data = json.loads(message.data)
-                    # Put the message in the queue
-                    await self._message_queue.put(data)
-                    # If it's an executing message with no node, it means the prompt is done
-                    if (
-                        data["type"] == "executing"
-                        and data["data"]["node"] is None
-                        and "prompt_id" in data["data"]
-                    ):
-                        prompt_id = data["data"]["prompt_id"]
-                        if prompt_id in self._prompt_events:
-                            self._prompt_events[prompt_id].set()
+                    execution_analytics.on_message(data)
+                    self._dispatch_message(data)
+                except Exception as e:
+                    print(f"WebSocket listener error: {e}")
+            elif message.type == aiohttp.WSMsgType.BINARY:
+                # Decoded only when someone waits for previews, otherwise dropped as they come
+                if self._prompt_previews:
+                    try:
+                        self._dispatch_preview(message.data)
+                    except Exception as e:
+                        connect_print(f"Invalid preview frame: {e}")
+            elif message.type in (
+                aiohttp.WSMsgType.CLOSE,
+                aiohttp.WSMsgType.CLOSING,
+                aiohttp.WSMsgType.CLOSED,
+                aiohttp.WSMsgType.ERROR,
+            ):
+                return
+
+    def _on_reconciled(self, task: asyncio.Task) -> None:
+        self._reconcile_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            connect_print(f"Could not reconcile prompts after reconnection: {task.exception()!r}")
+
+    async def _reconcile_prompts(self):
+        """
+        After a reconnection, checks every prompt being waited for against /history and /queue:
+        finished prompts are delivered right away, prompts ComfyUI doesn't know anymore are failed.
+        """
+        prompt_ids = list(self._prompt_events)
+        if not prompt_ids:
+            return
+
+        try:
+            queue = await self.get_queue()
+            queued = {
+                item[1]: state
+                for state in ("queue_running", "queue_pending")
+                for item in queue.get(state, [])
+            }
+            for prompt_id in prompt_ids:
+                if prompt_id not in self._prompt_events:
+                    continue
+                if await self._is_prompt_done(prompt_id):
+                    connect_print(f"Prompt {prompt_id} finished during the disconnection")
+                    self._prompt_started[prompt_id].set()
+                    self._prompt_events[prompt_id].set()
+                elif queued.get(prompt_id) == "queue_running":
+                    self._prompt_started[prompt_id].set()
+                elif prompt_id not in queued:
+                    connect_print(f"Prompt {prompt_id} is no longer known by ComfyUI")
+                    self._prompt_errors[prompt_id] = "The prompt has been lost by ComfyUI (restarted?)."
+                    self._prompt_started[prompt_id].set()
+                    self._prompt_events[prompt_id].set()
         except Exception as e:
-            print(f"WebSocket listener error: {e}")
-            # Restart the listener if it fails
-            self._listener_task = asyncio.create_task(self._listen_websocket())
+            connect_print(f"Could not reconcile prompts after reconnection: {e}")
+
+    def _dispatch_message(self, data: dict) -> None:
+        """
+        Sets the start and completion events of the prompts from ComfyUI messages,
+        and hands the outputs of their nodes over as soon as they are executed
+        """
+        message_data = data.get("data") or {}
+        prompt_id = message_data.get("prompt_id") if isinstance(message_data, dict) else None
+        if data.get("type") == "executed" and prompt_id in self._prompt_outputs:
+            self._prompt_outputs[prompt_id](message_data.get("node"), message_data.get("output") or {})
+            return
+        if not prompt_id or data.get("type") not in ("execution_start", "execution_cached", "executing"):
+            return
+
+        # If it's an executing message with no node, it means the prompt is done
+        done = data["type"] == "executing" and message_data.get("node") is None
+        if done:
+            self._executing = None
+        elif data["type"] != "execution_cached":
+            self._executing = (prompt_id, message_data.get("node"))
+        if prompt_id in self._prompt_events:
+            self._prompt_started[prompt_id].set()
+            if done:
+                self._prompt_events[prompt_id].set()
+        else:
+            # The prompt may be ours, with its events not registered yet
+            if done or prompt_id not in self._early_prompts:
+                self._early_prompts[prompt_id] = "done" if done else "started"
+            while len(self._early_prompts) > 256:
+                self._early_prompts.popitem(last=False)
+
+    def _dispatch_preview(self, message: bytes) -> None:
+        """Hands a preview frame over to the prompt it belongs to, if it is waited for"""
+        frame = PreviewFrame.decode(message)
+        if frame is None:
+            return
+        if frame.prompt_id is None and self._executing is not None:
+            frame.prompt_id, frame.node_id = self._executing
+        handler = self._prompt_previews.get(frame.prompt_id)
+        if handler is not None:
+            handler(frame)
 
     async def close(self):
         """Close the ComfyUI connection"""
@@ -90,17 +245,20 @@ class ComfyUIService:
         if self.session:
             await self.session.close()
         self._connected = False
+        self._ready.clear()
 
     async def _ensure_connected(self):
         """Ensure we have an active connection to ComfyUI"""
         if not self._connected:
             await self.connect()
 
-    async def queue_prompt(self, prompt):
+    async def queue_prompt(self, prompt, timer: ExecutionTimer = None):
         """Queue a prompt for execution in ComfyUI"""
+        timer = timer or ExecutionTimer("")
         await self._ensure_connected()
         payload = {"prompt": prompt, "client_id": self.CLIENT_ID}
-        data = json.dumps(payload).encode("utf-8")
+        data = await cpu_executor.dumps(payload, len(prompt))
+        timer.set("prompt_bytes", len(data))
         
         # Build URL with token if available
         url = f"http://{config.comfy_endpoint}/prompt"
@@ -110,11 +268,17 @@ class ComfyUIService:
         else:
             connect_print("Prompt execution using direct access (no token)")
             
-        async with self.session.post(url, data=data) as response:
-            return await response.json()
+        # ComfyUI validates the whole prompt before answering, so this measures the validation latency
+        with timer.phase("queue_prompt"):
+            async with self.session.post(url, data=data) as response:
+                result = await response.json()
 
-    async def get_image(self, filename, subfolder, folder_type):
-        """Retrieve an image from ComfyUI"""
+        if "prompt_id" not in result:
+            raise ValueError(f"ComfyUI rejected the prompt: {result.get('error', result)}")
+        return result
+
+    async def get_image_bytes(self, filename, subfolder, folder_type) -> bytes:
+        """Retrieve the raw content of an output file (image, video, audio...) from ComfyUI"""
         await self._ensure_connected()
         params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
         if config.comfy_token:
@@ -126,9 +290,12 @@ class ComfyUIService:
         async with self.session.get(
             f"http://{config.comfy_endpoint}/view?{url_values}"
         ) as response:
-            image_binary = await response.read()
-            image_base64 = base64.b64encode(image_binary).decode("utf-8")
-            return image_base64
+            return await response.read()
+
+    async def get_image(self, filename, subfolder, folder_type):
+        """Retrieve an image from ComfyUI, encoded in base64"""
+        image_binary = await self.get_image_bytes(filename, subfolder, folder_type)
+        return await cpu_executor.b64encode(image_binary)
 
     async def get_history(self, prompt_id):
         """Get execution history for a prompt"""
@@ -145,39 +312,231 @@ class ComfyUIService:
         async with self.session.get(url) as response:
             return await response.json()
 
-    async def run_workflow(self, workflow: dict) -> dict:
+    async def get_queue(self):
+        """Get the running and pending prompts of ComfyUI"""
+        await self._ensure_connected()
+
+        url = f"http://{config.comfy_endpoint}/queue"
+        if config.comfy_token:
+            url += f"?token={config.comfy_token}"
+
+        async with self.session.get(url) as response:
+            return await response.json()
+
+    async def cancel_prompt(self, prompt_id: str) -> None:
+        """
+        Frees ComfyUI from a prompt nobody waits for anymore:
+        deletes it from the queue if it is still pending, interrupts it if it is running.
+        """
+        await self._ensure_connected()
+        token_query = f"?token={config.comfy_token}" if config.comfy_token else ""
+
+        queue = await self.get_queue()
+        running = any(item[1] == prompt_id for item in queue.get("queue_running", []))
+        pending = any(item[1] == prompt_id for item in queue.get("queue_pending", []))
+
+        if pending:
+            connect_print(f"Deleting cancelled prompt {prompt_id} from the ComfyUI queue")
+            async with self.session.post(
+                f"http://{config.comfy_endpoint}/queue{token_query}", json={"delete": [prompt_id]}
+            ) as response:
+                await response.read()
+        elif running:
+            # Recent ComfyUI versions only interrupt the given prompt, older ones the running one (this one)
+            connect_print(f"Interrupting cancelled prompt {prompt_id}")
+            async with self.session.post(
+                f"http://{config.comfy_endpoint}/interrupt{token_query}", json={"prompt_id": prompt_id}
+            ) as response:
+                await response.read()
+
+    async def _is_prompt_done(self, prompt_id: str) -> bool:
+        """Checks /history for a prompt, in case its completion message was missed"""
+        try:
+            return prompt_id in await self.get_history(prompt_id)
+        except Exception as e:
+            connect_print(f"Could not check the history of prompt {prompt_id}: {e}")
+            return False
+
+    async def _wait_prompt_event(self, prompt_id: str, event: asyncio.Event, deadline: Deadline, phase: str):
+        """
+        Waits for a prompt event until the deadline. Without news from the websocket for
+        HISTORY_CHECK_INTERVAL seconds, /history is checked in case the completion message was lost.
         """
-        Execute a workflow and return the generated images.
+        checked_at = time.monotonic()
+        while not event.is_set():
+            deadline.check(phase)
+            # While messages arrive (progress, other prompts...) the websocket works, no need to poll
+            timeout = max(self._last_message_at, checked_at) + config.HISTORY_CHECK_INTERVAL - time.monotonic()
+            if timeout <= 0:
+                checked_at = time.monotonic()
+                if await self._is_prompt_done(prompt_id):
+                    connect_print(f"Prompt {prompt_id} found finished in history")
+                    self._prompt_started[prompt_id].set()
+                    self._prompt_events[prompt_id].set()
+                continue
+
+            remaining = deadline.remaining()
+            if remaining is not None:
+                timeout = min(timeout, remaining)
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _locate_file(self, output: OutputFile) -> Optional[str]:
+        """Returns the path of an output file on this machine, None if ComfyUI runs elsewhere or it is not found"""
+        directories = {"output": config.OUTPUT_PATH, "temp": config.TEMP_PATH, "input": config.INPUT_PATH}
+        directory = directories.get(output.type)
+        if directory is None or not config.comfy_is_local:
+            return None
+        path = os.path.abspath(os.path.join(directory, output.subfolder or "", output.filename))
+        if os.path.commonpath([directory, path]) != directory or not os.path.isfile(path):
+            return None
+        return path
+
+    async def _fetch_node_output(
+        self,
+        node_id: str,
+        outputs: List[OutputFile],
+        on_output: Callable[[str, List[OutputFile]], Awaitable] = None,
+        fetch_images: bool = True,
+    ) -> List[OutputFile]:
+        """
+        Retrieves the files of an executed node concurrently, then hands them to `on_output`.
+        Large media files on this machine are only located, to be served from disk,
+        as well as its images unless `fetch_images` is set.
+        """
+        async def fetch(output: OutputFile) -> None:
+            output.path = self._locate_file(output)
+            if output.path is not None:
+                output.size = os.path.getsize(output.path)
+                # Read from disk later: large media files, and images not needed in memory
+                if output.is_image and not fetch_images:
+                    return
+                if not output.is_image and output.size > config.media_inline_max_bytes:
+                    return
+            output.data = await self.get_image_bytes(output.filename, output.subfolder, output.type)
+            output.size = len(output.data)
+
+        await asyncio.gather(*(fetch(output) for output in outputs if not output.is_text))
+        if on_output is not None:
+            await on_output(node_id, outputs)
+        return outputs
+
+    async def run_workflow(
+        self,
+        workflow: dict,
+        timer: ExecutionTimer = None,
+        name: str = None,
+        deadline: Deadline = None,
+        on_output: Callable[[str, List[OutputFile]], Awaitable] = None,
+        fetch_images: bool = True,
+        reservation: VramReservation = None,
+        on_preview: Callable[[PreviewFrame], None] = None,
+    ) -> dict:
+        """
+        Execute a workflow and return its outputs: images, other files (videos, audio...) and texts.
+        The files of each output node are retrieved as soon as ComfyUI reports the node executed,
+        while the rest of the workflow runs.
 
         :param workflow: The workflow to execute
-        :return: Dictionary of generated images by node ID
+        :param timer: Optional timer collecting the durations of the execution phases
+        :param name: Optional workflow name, used to report execution analytics
+        :param deadline: Optional deadline, the prompt is removed from the queue or interrupted when it expires
+        :param on_output: Optional coroutine called with the node ID and outputs of each output node,
+                          as soon as they are retrieved (and before this method returns)
+        :param fetch_images: Whether the images are retrieved even when they can be read from disk
+                             (e.g. to be transcoded), they are only located otherwise.
+        :param reservation: Optional VRAM reservation of the execution, told when the prompt runs on the GPU
+        :param on_preview: Optional function called with each preview frame ComfyUI sends while the prompt runs
+                           (sampling previews, if enabled in ComfyUI)
+        :return: Dictionary of outputs (lists of OutputFile) by node ID
+        :raises DeadlineExceeded: If the deadline expired before the end of the execution
         """
+        timer = timer or ExecutionTimer("")
+        deadline = deadline or Deadline()
         await self._ensure_connected()
 
-        # Create an event for this prompt
-        prompt_id = (await self.queue_prompt(workflow))["prompt_id"]
+        # Create the events for this prompt
+        deadline.check("prompt submission")
+        prompt_id = (await self.queue_prompt(workflow, timer))["prompt_id"]
         self._prompt_events[prompt_id] = asyncio.Event()
+        self._prompt_started[prompt_id] = asyncio.Event()
+        early = self._early_prompts.pop(prompt_id, None)
+        if early:
+            self._prompt_started[prompt_id].set()
+        if early == "done":
+            self._prompt_events[prompt_id].set()
+        if name:
+            execution_analytics.start_prompt(prompt_id, name, workflow)
+
+        # Outputs being retrieved, by node ID, with the files they were retrieved from
+        fetches: Dict[str, tuple] = {}
+
+        def fetch_output(node_id: str, node_output: dict) -> asyncio.Task:
+            outputs = OutputFile.from_history(node_output)
+            files = [(output.kind, output.filename, output.subfolder, output.type, output.data) for output in outputs]
+            if node_id in fetches and fetches[node_id][0] == files:
+                return fetches[node_id][1]
+            task = asyncio.create_task(self._fetch_node_output(node_id, outputs, on_output, fetch_images))
+            fetches[node_id] = (files, task)
+            return task
+
+        # The outputs executed before this point are found in the history at the end
+        self._prompt_outputs[prompt_id] = fetch_output
+        if on_preview is not None:
+            self._prompt_previews[prompt_id] = on_preview
 
         try:
+            # Wait for ComfyUI to start the prompt, a prompt expiring here never reaches the GPU
+            with timer.phase("queue_wait"):
+                await self._wait_prompt_event(
+                    prompt_id, self._prompt_started[prompt_id], deadline, "queue wait"
+                )
+
             # Wait for the prompt completion event
-            await self._prompt_events[prompt_id].wait()
-
-            output_images = {}
-            history = (await self.get_history(prompt_id))[prompt_id]
-            for node_id, node_output in history["outputs"].items():
-                images_output = []
-                if "images" in node_output:
-                    for image in node_output["images"]:
-                        image_data = await self.get_image(
-                            image["filename"], image.get("subfolder", ""), image["type"]
-                        )
-                        images_output.append(image_data)
-                output_images[node_id] = images_output
-
-            return output_images
+            with timer.phase("execution"):
+                if reservation:
+                    reservation.start()
+                try:
+                    await self._wait_prompt_event(
+                        prompt_id, self._prompt_events[prompt_id], deadline, "execution"
+                    )
+                finally:
+                    if reservation:
+                        reservation.finish()
+            if prompt_id in self._prompt_errors:
+                raise ConnectionError(self._prompt_errors[prompt_id])
+
+            # The history has the outputs of every node, those already retrieved are not fetched again
+            node_outputs = {}
+            with timer.phase("outputs"):
+                history = (await self.get_history(prompt_id))[prompt_id]
+                timer.set("early_outputs", len(fetches))
+                for node_id, node_output in history["outputs"].items():
+                    node_outputs[node_id] = await fetch_output(node_id, node_output)
+
+            return node_outputs
+        except (asyncio.CancelledError, DeadlineExceeded):
+            # The caller gave up, don't let the prompt hold the GPU (partial outputs are dropped)
+            try:
+                await asyncio.shield(self.cancel_prompt(prompt_id))
+            except Exception as e:
+                connect_print(f"Could not cancel prompt {prompt_id}: {e}")
+            raise
         finally:
-            # Clean up the event
+            # Clean up the events, and the retrievals of outputs nobody waits for anymore
             del self._prompt_events[prompt_id]
+            del self._prompt_started[prompt_id]
+            self._prompt_errors.pop(prompt_id, None)
+            self._prompt_outputs.pop(prompt_id, None)
+            self._prompt_previews.pop(prompt_id, None)
+            for _, task in fetches.values():
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Marks the failures of outputs nobody awaited as retrieved
+                    task.exception()
 
 
 # Global service instance
@@ -0,0 +1,163 @@
+import copy
+import json
+import base64
+import pickle
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Union
+from ..config import config
+from ..utils.helpers import connect_print
+
+MODES = ("thread", "process", "inline")
+
+
+# base64 holds the GIL for a whole call: large payloads are processed in chunks, so the event loop thread
+# gets the GIL back between them instead of stalling until the end (multiples of 3 bytes / 4 characters)
+B64_CHUNK_BYTES = 3 * 256 * 1024
+
+
+def _b64encode(data: bytes) -> str:
+    if len(data) <= B64_CHUNK_BYTES:
+        return base64.b64encode(data).decode("utf-8")
+    view = memoryview(data)
+    return "".join(
+        base64.b64encode(view[offset:offset + B64_CHUNK_BYTES]).decode("utf-8")
+        for offset in range(0, len(view), B64_CHUNK_BYTES)
+    )
+
+
+def _b64decode(data: Union[str, bytes]) -> bytes:
+    chunk = B64_CHUNK_BYTES // 3 * 4
+    newlines = "\r\n" if isinstance(data, str) else b"\r\n"
+    # Line breaks would shift the chunk boundaries
+    if len(data) <= chunk or any(newline in data for newline in newlines):
+        return base64.b64decode(data)
+    return b"".join(base64.b64decode(data[offset:offset + chunk]) for offset in range(0, len(data), chunk))
+
+
+def _dumps(value) -> bytes:
+    return json.dumps(value).encode("utf-8")
+
+
+def payload_size(value) -> int:
+    """Returns the total length of the strings and bytes of a JSON-like value (its keys excluded)"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(payload_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    return 0
+
+
+class CpuExecutor:
+    """
+    Runs the CPU-bound steps of the executions (base64, JSON serialization, deep copies of workflows,
+    encoding of the outputs) off the event loop, which is shared with the ComfyUI server: a large batch
+    must not freeze its UI and websockets.
+
+    Small payloads are processed inline, as offloading them would cost more than the work itself.
+    Larger ones go to a pool of threads (the default) or of processes (Connect.CpuExecutor setting).
+    Only bytes are sent to processes: objects would be pickled on the event loop, at about the cost
+    of the work itself, so they always go to threads.
+
+    Processes are opt-in: they are forked from ComfyUI, as spawned ones couldn't import this custom node
+    package, and forking a process holding CUDA contexts and running threads is not safe everywhere.
+    Where processes can't be used (no fork start method, broken pool), it falls back to threads.
+    """
+
+    def __init__(self, workers: int, min_bytes: int, min_nodes: int):
+        self.workers = workers
+        self.min_bytes = min_bytes
+        self.min_nodes = min_nodes
+        self._threads = None
+        self._processes = None
+        self._counts = {"inline": 0, "thread": 0, "process": 0}
+
+    def _get_threads(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(self.workers, thread_name_prefix="connect-cpu")
+        return self._threads
+
+    def _get_processes(self):
+        if self._processes is None:
+            if "fork" in multiprocessing.get_all_start_methods():
+                self._processes = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("fork")
+                )
+            else:
+                self._processes = self._get_threads()
+        return self._processes
+
+    async def _run(self, function: Callable, *args, offload: bool, processes: bool = False):
+        mode = config.cpu_executor
+        if mode == "inline" or not offload:
+            self._counts["inline"] += 1
+            return function(*args)
+
+        loop = asyncio.get_running_loop()
+        if processes and mode == "process":
+            executor = self._get_processes()
+            try:
+                result = await loop.run_in_executor(executor, function, *args)
+                self._counts["process" if executor is not self._threads else "thread"] += 1
+                return result
+            except (BrokenProcessPool, pickle.PicklingError, AttributeError, ImportError) as e:
+                if executor is self._threads:
+                    raise
+                connect_print(f"CPU executor processes unavailable ({e}), using threads")
+                executor.shutdown(wait=False)
+                self._processes = self._get_threads()
+
+        self._counts["thread"] += 1
+        return await loop.run_in_executor(self._get_threads(), function, *args)
+
+    async def run(self, function: Callable, *args):
+        """
+        Runs a CPU-heavy function (e.g. the encoding of an image) in the pool, in processes with the
+        "process" mode: the function must be defined at module level, its arguments and result be bytes
+        or other cheap to pickle values.
+        """
+        return await self._run(function, *args, offload=True, processes=True)
+
+    async def b64encode(self, data: bytes) -> str:
+        """Encodes bytes (e.g. an output image) in base64"""
+        return await self._run(_b64encode, data, offload=len(data) >= self.min_bytes, processes=True)
+
+    async def b64decode(self, data: Union[str, bytes]) -> bytes:
+        """Decodes base64 content (e.g. an uploaded file)"""
+        return await self._run(_b64decode, data, offload=len(data) >= self.min_bytes, processes=True)
+
+    async def dumps(self, value, nodes: int = 0) -> bytes:
+        """
+        Serializes a value in JSON (UTF-8 encoded).
+
+        :param value: The value to serialize.
+        :param nodes: For a workflow or a prompt, its number of nodes, deciding whether it is offloaded.
+                      Other values are offloaded when their strings are large (e.g. base64 outputs).
+        """
+        offload = nodes >= self.min_nodes if nodes else payload_size(value) >= self.min_bytes
+        return await self._run(_dumps, value, offload=offload)
+
+    async def loads(self, data: bytes):
+        """Parses JSON content (e.g. a request body holding base64 files)"""
+        return await self._run(json.loads, data, offload=len(data) >= self.min_bytes)
+
+    async def deepcopy(self, workflow: dict) -> dict:
+        """Returns a deep copy of a workflow (keyed by node id)"""
+        return await self._run(copy.deepcopy, workflow, offload=len(workflow) >= self.min_nodes)
+
+    def stats(self) -> dict:
+        return {
+            "mode": config.cpu_executor,
+            "workers": self.workers,
+            "min_bytes": self.min_bytes,
+            "min_nodes": self.min_nodes,
+            "calls": dict(self._counts),
+        }
+
+
+# Global executor instance
+cpu_executor = CpuExecutor(config.CPU_EXECUTOR_WORKERS, config.CPU_OFFLOAD_MIN_BYTES, config.CPU_OFFLOAD_MIN_NODES)
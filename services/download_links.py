@@ -0,0 +1,67 @@
+import time
+import secrets
+from collections import OrderedDict
+from typing import Optional
+from ..config import config
+
+
+class DownloadLink:
+    __slots__ = ("path", "media_type", "filename", "expires_at")
+
+    def __init__(self, path: str, media_type: str, filename: str, expires_at: float):
+        self.path = path
+        self.media_type = media_type
+        self.filename = filename
+        self.expires_at = expires_at
+
+
+class DownloadLinks:
+    """
+    Short-lived links to output files, served from disk by `GET /connect/downloads/{token}`.
+    Tokens are random: only the client the link was returned to can download the file.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._links: "OrderedDict[str, DownloadLink]" = OrderedDict()
+
+    def issue(self, path: str, media_type: str, filename: str, size: int) -> dict:
+        """
+        Creates a link to a file.
+
+        :return: The link description returned to the client: url, file name, media type, size and expiration.
+        """
+        now = time.time()
+        self._purge(now)
+        token = secrets.token_urlsafe(24)
+        link = DownloadLink(path, media_type, filename, now + self.ttl)
+        self._links[token] = link
+        while len(self._links) > self.max_entries:
+            self._links.popitem(last=False)
+        return {
+            "url": f"/connect/downloads/{token}",
+            "filename": filename,
+            "media_type": media_type,
+            "size": size,
+            "expires_at": link.expires_at,
+        }
+
+    def resolve(self, token: str) -> Optional[DownloadLink]:
+        """Returns the link of a token, None if it is unknown or expired"""
+        link = self._links.get(token)
+        if link is None or link.expires_at < time.time():
+            return None
+        return link
+
+    def _purge(self, now: float) -> None:
+        # Links are issued in expiration order
+        while self._links:
+            token, link = next(iter(self._links.items()))
+            if link.expires_at >= now:
+                break
+            del self._links[token]
+
+
+# Global links instance
+download_links = DownloadLinks(config.DOWNLOAD_TOKEN_TTL, config.DOWNLOAD_TOKEN_MAX_ENTRIES)
@@ -0,0 +1,26 @@
+class ExecutionCancelled(Exception):
+    """Raised when a workflow execution has been cancelled by its client"""
+
+
+class ValidationError(ValueError):
+    """Raised when the parameters of an execution request don't match the workflow inputs"""
+
+    def __init__(self, errors: list):
+        self.errors = errors
+        super().__init__("; ".join(errors))
+
+
+class IdempotencyConflict(ValueError):
+    """Raised when an idempotency key is reused for a different request"""
+
+
+class ExecutionConflict(ValueError):
+    """Raised when an execution is started with the id of an execution still running"""
+
+
+class VramExceeded(RuntimeError):
+    """Raised when a workflow is expected to allocate more memory than the GPU has"""
+
+
+class ResultSinkError(ConnectionError):
+    """Raised when the outputs of an execution could not be stored in their result sink"""
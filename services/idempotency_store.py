@@ -0,0 +1,112 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+from .cpu_executor import payload_size
+from .errors import IdempotencyConflict
+
+
+class IdempotencyEntry:
+    __slots__ = ("fingerprint", "task", "expires_at", "size")
+
+    def __init__(self, fingerprint: str, task: asyncio.Task):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.expires_at: Optional[float] = None  # set once the execution succeeded
+        self.size = 0  # length of the strings and bytes of the result
+
+
+class IdempotencyStore:
+    """
+    Deduplicates retried requests by idempotency key.
+
+    A request whose key is already known attaches to the running execution, or gets its result back
+    if it succeeded less than `ttl` seconds ago. Failed or cancelled executions are forgotten, so a retry
+    runs them again. Finished entries are dropped, oldest first, beyond `max_entries` or once their
+    results hold more than `max_bytes`: results may carry the raw outputs of the executions.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, IdempotencyEntry]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"executions": 0, "attached": 0, "replayed": 0, "conflicts": 0, "evicted": 0}
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry.expires_at and entry.expires_at < now]:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        self._bytes -= self._entries.pop(key).size
+
+    def _over_budget(self) -> bool:
+        return len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+
+    def _evict(self) -> None:
+        if not self._over_budget():
+            return
+        # Running executions are never dropped, their duplicates must keep attaching to them
+        for key in [key for key, entry in self._entries.items() if entry.expires_at is not None]:
+            if not self._over_budget():
+                break
+            self._remove(key)
+            self._stats["evicted"] += 1
+
+    def _on_done(self, key: str, entry: IdempotencyEntry, task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() is not None:
+            if self._entries.get(key) is entry:
+                self._remove(key)
+            return
+        entry.expires_at = time.monotonic() + self.ttl
+        if self._entries.get(key) is entry:
+            entry.size = payload_size(task.result())
+            self._bytes += entry.size
+        self._evict()
+
+    def is_running(self, key: str) -> bool:
+        """Returns True if an execution is in progress for the key"""
+        entry = self._entries.get(key)
+        return entry is not None and not entry.task.done()
+
+    async def run(self, key: str, fingerprint: str, factory: Callable[[], Awaitable]):
+        """
+        Runs an execution once per key.
+
+        :param key: The idempotency key of the request.
+        :param fingerprint: A digest of the request, a key can't be reused for a different request.
+        :param factory: Returns the coroutine executing the request, only called if the key is new.
+        :return: The result of the execution, shared by every request with the same key.
+        :raises IdempotencyConflict: If the key is known with a different fingerprint.
+        """
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                self._stats["conflicts"] += 1
+                raise IdempotencyConflict(f"Idempotency key '{key}' has already been used for a different request.")
+            self._stats["replayed" if entry.task.done() else "attached"] += 1
+            self._entries.move_to_end(key)
+        else:
+            self._stats["executions"] += 1
+            entry = IdempotencyEntry(fingerprint, asyncio.create_task(factory()))
+            self._entries[key] = entry
+            entry.task.add_done_callback(lambda task: self._on_done(key, entry, task))
+
+        # Shielded: a caller giving up doesn't cancel the execution other callers may wait for
+        return await asyncio.shield(entry.task)
+
+    def stats(self) -> dict:
+        """Returns the hit counters and the number of stored entries"""
+        self._expire()
+        requests = self._stats["executions"] + self._stats["attached"] + self._stats["replayed"]
+        hits = self._stats["attached"] + self._stats["replayed"]
+        return {
+            **self._stats,
+            "hit_ratio": round(hits / requests, 4) if requests else None,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "running": sum(1 for entry in self._entries.values() if not entry.task.done()),
+        }
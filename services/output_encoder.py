@@ -0,0 +1,193 @@
+import io
+import hashlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from ..config import config
+from .cpu_executor import cpu_executor
+from .errors import ValidationError
+from .result_sinks import result_sinks
+
+# Output format => Pillow format name
+FORMATS = {"png": "PNG", "jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP", "avif": "AVIF"}
+
+
+def get_available_formats() -> List[str]:
+    """Returns the output formats supported by the installed Pillow"""
+    try:
+        from PIL import features
+    except ImportError:
+        return []
+
+    available = ["png", "jpeg", "jpg"]
+    for name in ("webp", "avif"):
+        try:
+            if features.check(name):
+                available.append(name)
+        except ValueError:
+            # Feature unknown to this Pillow version
+            continue
+    return available
+
+
+def _encode_variants(data: bytes, variants: List[Tuple[Optional[str], int, int, int]]) -> List[bytes]:
+    """
+    Decodes an image once and encodes each variant (format, quality, max width, max height) of it.
+    Runs in the encoder processes, so it must stay a picklable module-level function.
+    """
+    from PIL import Image
+
+    results = []
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        for image_format, quality, max_width, max_height in variants:
+            image = source
+            if max_width or max_height:
+                image = source.copy()
+                image.thumbnail((max_width or source.width, max_height or source.height), Image.LANCZOS)
+
+            image_format = image_format or source.format or "PNG"
+            if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format, quality=quality)
+            results.append(buffer.getvalue())
+    return results
+
+
+class OutputOptions:
+    """Per-request output options, given as the `_output` parameter"""
+
+    __slots__ = ("format", "quality", "max_width", "max_height", "thumbnail", "sink")
+
+    def __init__(self, format=None, quality=None, max_width=None, max_height=None, thumbnail=None, sink=None):
+        self.format = format
+        self.quality = quality or config.OUTPUT_DEFAULT_QUALITY
+        self.max_width = max_width
+        self.max_height = max_height
+        self.thumbnail = thumbnail
+        self.sink = sink  # result sink name, False to return the outputs inline, None for the default
+
+    @staticmethod
+    def check(value) -> List[str]:
+        """Returns the problems of an `_output` parameter, an empty list if it is valid"""
+        if not isinstance(value, dict):
+            return ["_output: expected an object."]
+
+        errors = []
+        for key in value:
+            if key not in OutputOptions.__slots__:
+                errors.append(f"_output.{key}: unknown option, expected one of {list(OutputOptions.__slots__)}.")
+
+        image_format = value.get("format")
+        if image_format is not None and str(image_format).lower() not in get_available_formats():
+            errors.append(f"_output.format: '{image_format}' is not available, expected one of {get_available_formats()}.")
+
+        sink = value.get("sink")
+        if sink not in (None, False):
+            problem = result_sinks.check(sink)
+            if problem:
+                errors.append(f"_output.sink: {problem}")
+
+        bounds = {"quality": (1, 100), "max_width": (1, None), "max_height": (1, None), "thumbnail": (1, None)}
+        for key, (minimum, maximum) in bounds.items():
+            option = value.get(key)
+            if option is None:
+                continue
+            if not isinstance(option, int) or isinstance(option, bool):
+                errors.append(f"_output.{key}: expected integer, got {type(option).__name__}.")
+            elif option < minimum or (maximum is not None and option > maximum):
+                errors.append(f"_output.{key}: {option} is out of range.")
+        return errors
+
+    @classmethod
+    def from_value(cls, value) -> Optional["OutputOptions"]:
+        """
+        Parses an `_output` parameter.
+
+        :raises ValidationError: If the options are invalid.
+        """
+        if value is None:
+            return None
+        errors = cls.check(value)
+        if errors:
+            raise ValidationError(errors)
+        image_format = value.get("format")
+        return cls(
+            FORMATS[image_format.lower()] if image_format else None,
+            value.get("quality"),
+            value.get("max_width"),
+            value.get("max_height"),
+            value.get("thumbnail"),
+            value.get("sink"),
+        )
+
+    @property
+    def transcodes(self) -> bool:
+        return bool(self.format or self.max_width or self.max_height)
+
+    def variants(self) -> List[Tuple[Optional[str], int, int, int]]:
+        """The (format, quality, max width, max height) to encode, the main output then the thumbnail"""
+        variants = []
+        if self.transcodes:
+            variants.append((self.format, self.quality, self.max_width, self.max_height))
+        if self.thumbnail:
+            variants.append((self.format or "JPEG", self.quality, self.thumbnail, self.thumbnail))
+        return variants
+
+
+class OutputEncoder:
+    """
+    Transcodes and resizes the outputs in the pool of the CPU executor, keeping the event loop free
+    (Pillow releases the GIL while encoding).
+
+    Encoded outputs are kept in a LRU cache keyed by the output content and the options,
+    so repeated requests for the same output are served without encoding again.
+    """
+
+    def __init__(self, cache_max_bytes: int):
+        self.cache_max_bytes = cache_max_bytes
+        self._cache: "OrderedDict[tuple, List[bytes]]" = OrderedDict()
+        self._cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _cache_put(self, key: tuple, results: List[bytes]) -> None:
+        size = sum(len(result) for result in results)
+        if size > self.cache_max_bytes:
+            return
+        self._cache[key] = results
+        self._cache_bytes += size
+        while self._cache_bytes > self.cache_max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= sum(len(result) for result in evicted)
+
+    async def encode(self, data: bytes, options: OutputOptions) -> Tuple[bytes, Optional[bytes]]:
+        """
+        Applies the output options to an output.
+
+        :param data: The output file content, as written by ComfyUI.
+        :param options: The requested options.
+        :return: The output (unchanged if only a thumbnail is requested) and its thumbnail, or None.
+        """
+        variants = options.variants()
+        if not variants:
+            return data, None
+
+        key = (hashlib.sha1(data).digest(), tuple(variants))
+        results = self._cache.get(key)
+        if results is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+        else:
+            self.misses += 1
+            results = await cpu_executor.run(_encode_variants, data, variants)
+            self._cache_put(key, results)
+
+        if options.transcodes:
+            return results[0], results[1] if options.thumbnail else None
+        return data, results[0]
+
+
+# Global encoder instance
+output_encoder = OutputEncoder(config.OUTPUT_CACHE_MAX_BYTES)
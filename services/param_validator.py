@@ -0,0 +1,207 @@
+from collections.abc import Mapping
+from typing import Dict, Optional
+from ..entities.workflow import Workflow
+from ..utils.node_utils import get_node_class
+from .errors import ValidationError
+from .output_encoder import OutputOptions
+
+# ComfyUI widget types => JSON types accepted for them
+WIDGET_TYPES = {"INT": "integer", "FLOAT": "number", "STRING": "string", "BOOLEAN": "boolean"}
+
+# Types inferred from the values saved in the workflow, when the node class is unknown.
+# Integers and floats are mixed up by the UI (a cfg of 7 is saved as an int), both are accepted.
+VALUE_TYPES = {"int": "number", "float": "number", "str": "string", "bool": "boolean", "list": "array"}
+
+JSON_TYPES = {
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "string": lambda value: isinstance(value, str),
+    "boolean": lambda value: isinstance(value, bool),
+    "array": lambda value: isinstance(value, list),
+}
+
+
+def _get_input_types(class_type: str) -> dict:
+    """Returns the declared inputs of a ComfyUI node class, {} if unknown"""
+    node_class = get_node_class(class_type)
+    if node_class is None or not hasattr(node_class, "INPUT_TYPES"):
+        return {}
+    try:
+        input_types = node_class.INPUT_TYPES()
+    except Exception:
+        return {}
+
+    declared = {}
+    for section in ("required", "optional"):
+        for input_name, spec in (input_types.get(section) or {}).items():
+            if isinstance(spec, (list, tuple)) and spec:
+                declared[input_name] = spec
+    return declared
+
+
+def _compile_input(class_type: str, value, spec) -> dict:
+    """
+    Builds the JSON schema of a tagged input, from its ComfyUI declaration (type, min/max, choices)
+    or, when the node class is unknown, from the type of its current value.
+    """
+    schema = {"type": VALUE_TYPES.get(type(value).__name__, "string")}
+    if spec is None:
+        return schema
+
+    widget_type = spec[0]
+    options = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+
+    if isinstance(widget_type, (list, tuple)) or widget_type == "COMBO":
+        # Combo: old style (list of choices) or new style ("COMBO" with an "options" list)
+        choices = widget_type if isinstance(widget_type, (list, tuple)) else options.get("options", [])
+        schema = {"type": "string"}
+        if any(key == "upload" or key.endswith("_upload") for key in options):
+            # Files may be uploaded with the request, any file name is accepted
+            schema["x-upload"] = True
+        elif choices:
+            schema["enum"] = list(choices)
+            schema["x-class-type"] = class_type
+    elif widget_type in WIDGET_TYPES:
+        schema = {"type": WIDGET_TYPES[widget_type]}
+        for key in ("min", "max"):
+            if isinstance(options.get(key), (int, float)) and not isinstance(options.get(key), bool):
+                schema["minimum" if key == "min" else "maximum"] = options[key]
+
+    return schema
+
+
+class ParamValidator:
+    """
+    Validator of the execution parameters of one workflow, compiled once from its tagged inputs
+    and the ComfyUI declaration of the tagged nodes (types, ranges, choices).
+    Any `$` input or `#` output tag can be bypassed with false, only the inputs are checked further.
+    A request is checked as a whole, every problem being reported at once.
+    """
+
+    def __init__(self, workflow: dict):
+        self.schema: Dict[str, Dict[str, dict]] = {}  # tag => input => JSON schema
+
+        wrapper = Workflow(workflow)
+        self.bypassable = sorted(
+            {tag[1:] for tagged in wrapper.get_tagged_nodes() for tag in tagged["tags"] if tag[0] in "$#"}
+        )
+        tagged_inputs = wrapper.get_tagged_inputs()
+        declared_by_class = {}
+        for tag, inputs in tagged_inputs.items():
+            nodes = [tagged["node"] for tagged in wrapper.get_tagged_nodes("$" + tag)]
+            self.schema[tag] = {}
+            for input_name in inputs:
+                # The first node of the tag holding the input describes it
+                node = next(node for node in nodes if input_name in node.get("inputs", {}))
+                class_type = node.get("class_type")
+                if class_type not in declared_by_class:
+                    declared_by_class[class_type] = _get_input_types(class_type)
+                self.schema[tag][input_name] = _compile_input(
+                    class_type, node["inputs"][input_name], declared_by_class[class_type].get(input_name)
+                )
+
+    def _check_value(self, location: str, schema: dict, value) -> Optional[str]:
+        if isinstance(value, dict):
+            if value.get("type") != "file" or schema["type"] != "string":
+                return f"{location}: expected {schema['type']}, got an object."
+            if not value.get("url") and not (value.get("content") and value.get("name")):
+                return f"{location}: a file needs an 'url', or a 'content' and a 'name'."
+            return None
+
+        if not JSON_TYPES[schema["type"]](value):
+            return f"{location}: expected {schema['type']}, got {type(value).__name__}."
+        if "minimum" in schema and value < schema["minimum"]:
+            return f"{location}: {value} is lower than the minimum {schema['minimum']}."
+        if "maximum" in schema and value > schema["maximum"]:
+            return f"{location}: {value} is greater than the maximum {schema['maximum']}."
+        if "enum" in schema and value not in schema["enum"]:
+            # Choices such as model lists may have changed since the compilation, they are read again
+            declared = _get_input_types(schema["x-class-type"]).get(location.split(".", 1)[1])
+            choices = _compile_input(schema["x-class-type"], value, declared).get("enum") if declared else None
+            if choices is not None:
+                schema["enum"] = choices
+            if value not in schema["enum"]:
+                return f"{location}: '{value}' is not one of the available choices."
+        return None
+
+    def validate(self, params: dict) -> None:
+        """
+        Checks the parameters of an execution request.
+
+        :param params: Dictionary containing tags and payload data.
+        :raises ValidationError: With every problem found, if any.
+        """
+        errors = []
+        for tag, payload in (params or {}).items():
+            if tag == "_output":
+                errors.extend(OutputOptions.check(payload))
+                continue
+            if payload is False:
+                if tag not in self.bypassable:
+                    errors.append(f"{tag}: unknown tag, expected one of {self.bypassable}.")
+                continue
+            if tag not in self.schema:
+                errors.append(f"{tag}: unknown tag, expected one of {sorted(self.schema)}.")
+                continue
+            if not isinstance(payload, dict):
+                errors.append(f"{tag}: expected an object of inputs or false.")
+                continue
+
+            for input_name, value in payload.items():
+                schema = self.schema[tag].get(input_name)
+                if schema is None:
+                    errors.append(
+                        f"{tag}.{input_name}: unknown input, expected one of {sorted(self.schema[tag])}."
+                    )
+                    continue
+                error = self._check_value(f"{tag}.{input_name}", schema, value)
+                if error:
+                    errors.append(error)
+
+        if errors:
+            raise ValidationError(errors)
+
+    def validate_upload(self, tag: str, input_name: str) -> None:
+        """
+        Checks that a file can be uploaded to an input, before receiving it.
+
+        :raises ValidationError: If the input doesn't exist or doesn't accept a file name.
+        """
+        schema = self.schema.get(tag, {}).get(input_name)
+        if schema is None:
+            raise ValidationError([f"{tag}.{input_name}: unknown input."])
+        if schema["type"] != "string":
+            raise ValidationError([f"{tag}.{input_name}: expected {schema['type']}, not a file."])
+
+    def to_openapi(self) -> Dict[str, Dict[str, dict]]:
+        """Returns the OpenAPI schema of each input, keyed by tag then input name"""
+        return {
+            tag: {
+                input_name: {key: value for key, value in schema.items() if not key.startswith("x-")}
+                for input_name, schema in inputs.items()
+            }
+            for tag, inputs in self.schema.items()
+        }
+
+
+class ParamValidators:
+    """Compiled validators of the workflows, each one rebuilt only when its workflow changes"""
+
+    def __init__(self, workflows: Mapping):
+        self.workflows = workflows
+        self._validators: Dict[str, ParamValidator] = {}
+
+    def get(self, name: str) -> ParamValidator:
+        """
+        Returns the validator of a workflow, compiling it on first use.
+
+        :raises KeyError: If the workflow doesn't exist.
+        """
+        validator = self._validators.get(name)
+        if validator is None:
+            validator = self._validators[name] = ParamValidator(self.workflows[name])
+        return validator
+
+    def invalidate(self, name: str) -> None:
+        """Drops the validator of a workflow that changed"""
+        self._validators.pop(name, None)
@@ -0,0 +1,75 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+from ..entities.preview_frame import PreviewFrame
+from ..utils.helpers import connect_print
+
+
+class PreviewRelay:
+    """
+    Relays the preview frames of an execution to one client, at most one frame per interval.
+    A frame arriving while the previous one is still being sent, or before the interval has elapsed,
+    replaces the frame waiting to be sent: a slow client gets the latest frame instead of a backlog,
+    and never slows down the websocket listener nor the other clients.
+
+    :param send: Coroutine sending a frame to the client.
+    :param interval: Minimum seconds between two frames.
+    """
+
+    def __init__(self, send: Callable[[PreviewFrame], Awaitable], interval: float):
+        self._send = send
+        self.interval = interval
+        self._pending: Optional[PreviewFrame] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sending = False
+        self._closed = False
+        self._last_sent = None
+        self.stats = {"received": 0, "sent": 0, "dropped": 0}
+
+    def push(self, frame: PreviewFrame) -> None:
+        """Queues a frame, replacing the one not sent yet"""
+        if self._closed:
+            return
+        self.stats["received"] += 1
+        if self._pending is not None:
+            self.stats["dropped"] += 1
+        self._pending = frame
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending is not None:
+                if self._last_sent is not None:
+                    delay = self._last_sent + self.interval - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                frame, self._pending = self._pending, None
+                if frame is None:
+                    return
+                self._last_sent = loop.time()
+                self._sending = True
+                try:
+                    await self._send(frame)
+                    self.stats["sent"] += 1
+                except Exception as e:
+                    # The client went away, the execution goes on without previews
+                    connect_print(f"Could not send preview: {e}")
+                    self._closed = True
+                    self._pending = None
+                finally:
+                    self._sending = False
+        finally:
+            self._task = None
+
+    async def close(self) -> None:
+        """Stops relaying: the frame being sent is finished (not cut in the middle), the pending one dropped"""
+        self._closed = True
+        self._pending = None
+        task = self._task
+        if task is None:
+            return
+        if self._sending:
+            await asyncio.shield(task)
+        else:
+            task.cancel()
@@ -0,0 +1,146 @@
+import os
+import re
+import json
+import time
+import asyncio
+from typing import List
+from ..utils.helpers import connect_print
+
+BLOB_KEY = "$outbox_blob"
+
+
+class ResultOutbox:
+    """
+    Durable spool of the task results to deliver to the gateway.
+
+    Each result is written to the spool directory before being sent, and removed only once the gateway
+    acknowledged it, so a result finished during a disconnection is replayed instead of being recomputed.
+    Large values (base64 images, bytes) are stored as separate blob files next to the entry.
+    Entries are named after their creation time, which keeps the replay order across restarts.
+    When the spool exceeds its size cap, the oldest entries are dropped.
+    """
+
+    def __init__(self, path: str, max_bytes: int, inline_max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.inline_max_bytes = inline_max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entry_path(self, entry_id: str) -> str:
+        return os.path.join(self.path, f"{entry_id}.json")
+
+    def _blob_path(self, entry_id: str, index: int) -> str:
+        return os.path.join(self.path, f"{entry_id}.{index}.blob")
+
+    def _write_atomic(self, path: str, content: bytes) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+
+    def _extract_blobs(self, entry_id: str, value, blobs: list):
+        """Replaces large values by references to blob files, returns the JSON-serializable value"""
+        if isinstance(value, dict):
+            return {key: self._extract_blobs(entry_id, item, blobs) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._extract_blobs(entry_id, item, blobs) for item in value]
+        if isinstance(value, (str, bytes)) and len(value) > self.inline_max_bytes:
+            blob_path = self._blob_path(entry_id, len(blobs))
+            is_bytes = isinstance(value, bytes)
+            self._write_atomic(blob_path, value if is_bytes else value.encode("utf-8"))
+            blobs.append(blob_path)
+            return {BLOB_KEY: os.path.basename(blob_path), "type": "bytes" if is_bytes else "str"}
+        if isinstance(value, bytes):
+            return {BLOB_KEY: None, "type": "bytes", "hex": value.hex()}
+        return value
+
+    def _restore_blobs(self, value):
+        if isinstance(value, dict):
+            if BLOB_KEY in value:
+                if value[BLOB_KEY] is None:
+                    return bytes.fromhex(value["hex"])
+                with open(os.path.join(self.path, value[BLOB_KEY]), "rb") as file:
+                    content = file.read()
+                return content if value["type"] == "bytes" else content.decode("utf-8")
+            return {key: self._restore_blobs(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._restore_blobs(item) for item in value]
+        return value
+
+    def _entry_files(self, entry_id: str) -> List[str]:
+        prefix = f"{entry_id}."
+        return [
+            os.path.join(self.path, filename)
+            for filename in os.listdir(self.path)
+            if filename.startswith(prefix)
+        ]
+
+    def _put(self, message: dict) -> str:
+        task_id = re.sub(r"[^A-Za-z0-9_-]", "_", str(message.get("taskId")))[:64]
+        entry_id = f"{time.time_ns():020d}-{task_id}"
+        content = self._extract_blobs(entry_id, message, [])
+        self._write_atomic(self._entry_path(entry_id), json.dumps(content).encode("utf-8"))
+        return entry_id
+
+    def _enforce_cap(self, keep: str) -> None:
+        sizes = {}
+        for filename in os.listdir(self.path):
+            entry_id = filename.split(".", 1)[0]
+            try:
+                sizes[entry_id] = sizes.get(entry_id, 0) + os.path.getsize(os.path.join(self.path, filename))
+            except OSError:
+                continue
+
+        total = sum(sizes.values())
+        for entry_id in sorted(sizes):
+            if total <= self.max_bytes or entry_id >= keep:
+                # The entry just written (and the ones written after it) are never dropped for it
+                break
+            connect_print(f"Outbox full, dropping result {entry_id}")
+            self._remove(entry_id)
+            total -= sizes[entry_id]
+
+    def _remove(self, entry_id: str) -> None:
+        for file_path in self._entry_files(entry_id):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    def _load(self, entry_id: str) -> dict:
+        with open(self._entry_path(entry_id), "r", encoding="utf-8") as file:
+            return self._restore_blobs(json.load(file))
+
+    def entries(self) -> List[str]:
+        """Returns the ids of the pending entries, oldest first"""
+        return sorted(
+            filename[: -len(".json")]
+            for filename in os.listdir(self.path)
+            if filename.endswith(".json")
+        )
+
+    async def put(self, message: dict) -> str:
+        """
+        Persists a result message until it is acknowledged (the size cap is enforced by `enforce_cap`).
+
+        :param message: The message to deliver (must contain a taskId).
+        :return: The id of the created entry.
+        """
+        return await asyncio.to_thread(self._put, message)
+
+    async def enforce_cap(self, keep: str) -> None:
+        """
+        Drops the oldest entries while the spool exceeds its size cap.
+        Not to run while the entries are being delivered, which may be among the dropped ones.
+
+        :param keep: Id of the entry just written: only the entries strictly older than it are dropped.
+        """
+        await asyncio.to_thread(self._enforce_cap, keep)
+
+    async def load(self, entry_id: str) -> dict:
+        """Returns the message of an entry, with its large values restored"""
+        return await asyncio.to_thread(self._load, entry_id)
+
+    async def remove(self, entry_id: str) -> None:
+        """Removes an acknowledged entry and its blobs"""
+        await asyncio.to_thread(self._remove, entry_id)
@@ -0,0 +1,338 @@
+import os
+import abc
+import json
+import asyncio
+import hashlib
+import mimetypes
+from typing import Dict, Optional, Tuple
+from ..config import config
+from ..utils.helpers import connect_print
+from .errors import ResultSinkError
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _extension(media_type: str, filename: str = None) -> str:
+    extension = os.path.splitext(filename or "")[1]
+    if media_type != "application/octet-stream" or not extension:
+        extension = mimetypes.guess_extension(media_type or "") or extension
+    return extension
+
+
+class ResultSink(abc.ABC):
+    """
+    Destination of the outputs of the executions sent elsewhere than in the response (an object store,
+    a shared directory...): the response only has their keys and URLs.
+    Outputs are keyed by content hash, so an output already stored is not uploaded again.
+    """
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._stats = {"stored": 0, "deduplicated": 0, "bytes": 0}
+        # Outputs being stored, identical outputs of an execution are stored once
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    async def put(self, media_type: str, content: bytes = None, path: str = None, filename: str = None) -> dict:
+        """
+        Stores an output given as bytes or as a file path.
+
+        :return: The description returned to the client: key, url (None if the sink has no URL), media type and size.
+        :raises ResultSinkError: If the output could not be stored.
+        """
+        if content is not None:
+            digest = await asyncio.to_thread(lambda: hashlib.sha256(content).hexdigest())
+            size = len(content)
+        else:
+            digest, size = await asyncio.to_thread(lambda: (_sha256_file(path), os.path.getsize(path)))
+        key = f"{self.prefix}{digest}{_extension(media_type, filename)}"
+
+        task = self._pending.get(key)
+        joined = task is not None
+        if task is None:
+            task = self._pending[key] = asyncio.create_task(self._put(key, media_type, content, path, size))
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        try:
+            url, stored = await asyncio.shield(task)
+        except ResultSinkError:
+            raise
+        except Exception as e:
+            raise ResultSinkError(f"Could not store output {key}: {e}") from e
+        # Once per output not uploaded: already in the sink, or stored by an identical output meanwhile
+        if joined or not stored:
+            self._stats["deduplicated"] += 1
+        return {"key": key, "url": url, "media_type": media_type, "size": size}
+
+    async def _put(
+        self, key: str, media_type: str, content: Optional[bytes], path: Optional[str], size: int
+    ) -> Tuple[Optional[str], bool]:
+        """Stores an output unless its key already exists, returns its URL and whether it was stored"""
+        stored = not await self._exists(key)
+        if stored:
+            await self._store(key, media_type, content, path, size)
+            self._stats["stored"] += 1
+            self._stats["bytes"] += size
+        return await self._url(key), stored
+
+    @abc.abstractmethod
+    async def _exists(self, key: str) -> bool:
+        """Returns True if an output is already stored under the key"""
+
+    @abc.abstractmethod
+    async def _store(self, key: str, media_type: str, content: Optional[bytes], path: Optional[str], size: int) -> None:
+        """Stores an output, given as bytes or as a file path, under the key"""
+
+    @abc.abstractmethod
+    async def _url(self, key: str) -> Optional[str]:
+        """Returns the URL of a stored output, None if the sink has none"""
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+
+class LocalSink(ResultSink):
+    """
+    Stores the outputs in a directory (e.g. a shared volume), optionally served under a base URL.
+
+    :param path: The destination directory.
+    :param url: Optional base URL the directory is served under.
+    """
+
+    def __init__(self, path: str, url: str = None, prefix: str = ""):
+        super().__init__(prefix)
+        self.path = os.path.abspath(path)
+        self.url = url.rstrip("/") if url else None
+
+    async def _exists(self, key: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, os.path.join(self.path, key))
+
+    def _write(self, key: str, content: Optional[bytes], path: Optional[str]) -> None:
+        destination = os.path.join(self.path, key)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        # Written under a temporary name, so readers never see a partial file
+        tmp_path = f"{destination}.{os.getpid()}.part"
+        try:
+            with open(tmp_path, "wb") as file:
+                if content is not None:
+                    file.write(content)
+                else:
+                    with open(path, "rb") as source:
+                        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+                            file.write(chunk)
+            os.replace(tmp_path, destination)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def _store(self, key, media_type, content, path, size) -> None:
+        await asyncio.to_thread(self._write, key, content, path)
+
+    async def _url(self, key: str) -> Optional[str]:
+        return f"{self.url}/{key}" if self.url else None
+
+
+class S3Sink(ResultSink):
+    """
+    Stores the outputs in an S3-compatible object store (AWS S3, MinIO, R2...) with boto3, an optional
+    dependency imported on first use. Outputs larger than a part are sent as multipart uploads, their
+    parts being uploaded concurrently.
+
+    :param bucket: The destination bucket.
+    :param endpoint_url: The store URL, AWS S3 if not set.
+    :param public_url: Optional base URL the bucket is publicly served under, presigned URLs are returned otherwise.
+    :param url_expires: Validity of the presigned URLs, in seconds.
+    :param part_size: Size of the multipart upload parts, in bytes (5MiB at least).
+    :param concurrency: Parts uploaded at the same time per output.
+    :param addressing_style: "path" or "virtual", path-style by default with a custom endpoint (MinIO...).
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: str = None,
+        region: str = None,
+        access_key: str = None,
+        secret_key: str = None,
+        public_url: str = None,
+        url_expires: int = 3600,
+        part_size: int = 8 * 1024**2,
+        concurrency: int = 4,
+        addressing_style: str = None,
+    ):
+        super().__init__(prefix)
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.url_expires = url_expires
+        self.part_size = max(part_size, 5 * 1024**2)
+        self.concurrency = concurrency
+        self.addressing_style = addressing_style or ("path" if endpoint_url else "auto")
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            try:
+                import boto3
+                from botocore.config import Config as BotoConfig
+            except ImportError:
+                raise ResultSinkError("S3 result sinks require boto3 (pip install boto3).") from None
+
+            # Clients are thread-safe, the parts of several outputs share its connections
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+                config=BotoConfig(
+                    max_pool_connections=max(self.concurrency * 4, 10),
+                    s3={"addressing_style": self.addressing_style},
+                    # Checksums only where required, not every S3-compatible store supports the newer ones
+                    request_checksum_calculation="when_required",
+                    response_checksum_validation="when_required",
+                ),
+            )
+        return self._client
+
+    async def _exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        client = self._get_client()
+        try:
+            await asyncio.to_thread(client.head_object, Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def _read_part(self, content: Optional[bytes], path: Optional[str], offset: int) -> bytes:
+        if content is not None:
+            return content[offset:offset + self.part_size]
+        with open(path, "rb") as file:
+            file.seek(offset)
+            return file.read(self.part_size)
+
+    async def _store(self, key, media_type, content, path, size) -> None:
+        client = self._get_client()
+        if size <= self.part_size:
+            body = content if content is not None else await asyncio.to_thread(self._read_part, None, path, 0)
+            await asyncio.to_thread(
+                client.put_object, Bucket=self.bucket, Key=key, Body=body, ContentType=media_type
+            )
+            return
+
+        upload = await asyncio.to_thread(
+            client.create_multipart_upload, Bucket=self.bucket, Key=key, ContentType=media_type
+        )
+        upload_id = upload["UploadId"]
+        window = asyncio.Semaphore(self.concurrency)
+
+        async def upload_part(number: int, offset: int) -> dict:
+            async with window:
+                # Read when sent, so at most `concurrency` parts of a file are in memory
+                body = await asyncio.to_thread(self._read_part, content, path, offset)
+                part = await asyncio.to_thread(
+                    client.upload_part,
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=body,
+                )
+                return {"PartNumber": number, "ETag": part["ETag"]}
+
+        try:
+            parts = await asyncio.gather(
+                *(
+                    upload_part(number, offset)
+                    for number, offset in enumerate(range(0, size, self.part_size), start=1)
+                )
+            )
+            await asyncio.to_thread(
+                client.complete_multipart_upload,
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            try:
+                await asyncio.shield(
+                    asyncio.to_thread(client.abort_multipart_upload, Bucket=self.bucket, Key=key, UploadId=upload_id)
+                )
+            except Exception as e:
+                connect_print(f"Could not abort the upload of {key}: {e}")
+            raise
+
+    async def _url(self, key: str) -> Optional[str]:
+        if self.public_url:
+            return f"{self.public_url}/{key}"
+        return await asyncio.to_thread(
+            self._get_client().generate_presigned_url,
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=self.url_expires,
+        )
+
+
+SINK_TYPES = {"local": LocalSink, "s3": S3Sink}
+
+
+class ResultSinks:
+    """
+    The result sinks configured with the Connect.ResultSinks setting, keyed by name:
+    {"archive": {"type": "s3", "bucket": "outputs", "endpoint_url": "http://minio:9000", ...}}.
+    Sinks are created on first use, and again when their settings change.
+    """
+
+    def __init__(self):
+        self._sinks: Dict[str, tuple] = {}  # name => (settings, sink)
+
+    def check(self, name) -> Optional[str]:
+        """Returns the problem of a sink name, None if it is configured"""
+        sinks = config.result_sinks
+        if name not in sinks:
+            return f"unknown result sink '{name}', expected one of {sorted(sinks)}."
+        if not isinstance(sinks[name], dict) or sinks[name].get("type") not in SINK_TYPES:
+            return f"result sink '{name}' must have a type among {sorted(SINK_TYPES)}."
+        return None
+
+    def get(self, name: str) -> ResultSink:
+        """
+        Returns a configured sink.
+
+        :raises ResultSinkError: If the sink is not configured, or its settings are invalid.
+        """
+        problem = self.check(name)
+        if problem:
+            raise ResultSinkError(problem)
+        settings = config.result_sinks[name]
+        signature = json.dumps(settings, sort_keys=True)
+        cached = self._sinks.get(name)
+        if cached is None or cached[0] != signature:
+            options = {key: value for key, value in settings.items() if key != "type"}
+            try:
+                sink = SINK_TYPES[settings["type"]](**options)
+            except TypeError as e:
+                raise ResultSinkError(f"Invalid settings for result sink '{name}': {e}") from None
+            cached = self._sinks[name] = (signature, sink)
+        return cached[1]
+
+    def stats(self) -> dict:
+        return {name: sink.stats() for name, (_, sink) in self._sinks.items()}
+
+
+# Global sinks instance
+result_sinks = ResultSinks()
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+from typing import Optional, Set
+from ..config import config
+from ..utils.helpers import connect_print
+
+
+# Salted per process: the hashes tell identical files apart in a trace, not what their content or URL is
+_SALT = os.urandom(16)
+
+
+def _digest(value: bytes) -> str:
+    return hashlib.sha1(_SALT + value).hexdigest()[:16]
+
+
+def _shape(value):
+    if isinstance(value, dict):
+        if value.get("type") == "file":
+            shape = {"type": "file", "extension": os.path.splitext(str(value.get("name") or ""))[1][:16]}
+            if value.get("content"):
+                content = value["content"].encode("utf-8") if isinstance(value["content"], str) else value["content"]
+                # Decoded size of the base64 content, without decoding it
+                shape["size"] = len(content) * 3 // 4 - content[-2:].count(b"=")
+                shape["sha1"] = _digest(content)
+            if value.get("url"):
+                shape["url_sha1"] = _digest(value["url"].encode("utf-8"))
+            return shape
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_shape(item) for item in value]
+    if isinstance(value, str):
+        return {"type": "str", "length": len(value)}
+    if isinstance(value, bytes):
+        return {"type": "bytes", "size": len(value), "sha1": _digest(value)}
+    return value
+
+
+def params_shape(params: dict, schema: Optional[dict] = None) -> dict:
+    """
+    Returns a copy of execution parameters safe and compact enough to be recorded:
+    files are replaced by their size and salted hash, free strings (prompts, file names) by their length,
+    numbers and booleans are kept as they drive the execution time. The choices of the combo inputs
+    (samplers, models) and the `_output` options are kept too, a replay couldn't pass the validation
+    without them.
+
+    :param params: Parameters of the request.
+    :param schema: Compiled schema of the workflow inputs (ParamValidator.schema), None if unknown.
+    """
+    shape = {}
+    for tag, payload in params.items():
+        if tag == "_output":
+            shape[tag] = payload
+        elif isinstance(payload, dict) and schema and tag in schema:
+            inputs = schema[tag]
+            shape[tag] = {
+                name: value if isinstance(value, str) and "enum" in inputs.get(name, {}) else _shape(value)
+                for name, value in payload.items()
+            }
+        else:
+            shape[tag] = _shape(payload)
+    return shape
+
+
+class TrafficRecorder:
+    """
+    Opt-in recorder of the execution requests, for capacity planning replays (see benchmarks/replay.py).
+
+    A sampled fraction of the requests is appended to a JSON lines file: arrival time, source,
+    workflow name, parameter shapes (see `params_shape`), outcome and phase durations.
+    The file is rotated beyond TRAFFIC_MAX_BYTES, keeping TRAFFIC_BACKUPS older files.
+    """
+
+    FILENAME = "traffic.jsonl"
+
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = asyncio.Lock()
+        # Recordings started in the background, referenced until they are written
+        self._pending: Set[asyncio.Task] = set()
+
+    @property
+    def file_path(self) -> str:
+        return os.path.join(self.path, self.FILENAME)
+
+    def sample(self) -> bool:
+        """Decides, when a request arrives, whether it is recorded"""
+        return config.traffic_recording and random.random() < config.traffic_sample_rate
+
+    def _rotate(self) -> None:
+        for index in range(self.backups - 1, 0, -1):
+            source = os.path.join(self.path, f"traffic.{index}.jsonl")
+            if os.path.exists(source):
+                os.replace(source, os.path.join(self.path, f"traffic.{index + 1}.jsonl"))
+        if self.backups > 0:
+            os.replace(self.file_path, os.path.join(self.path, "traffic.1.jsonl"))
+        else:
+            os.remove(self.file_path)
+
+    def _append(self, line: str) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            if os.path.getsize(self.file_path) + len(line) > self.max_bytes:
+                self._rotate()
+        except FileNotFoundError:
+            pass
+        with open(self.file_path, "a", encoding="utf-8") as file:
+            file.write(line)
+
+    async def record(
+        self,
+        source: str,
+        arrival: float,
+        name: str,
+        params: dict,
+        status: str,
+        timings: Optional[dict] = None,
+        schema: Optional[dict] = None,
+    ) -> None:
+        """
+        Appends a request to the trace, errors are only logged.
+
+        :param source: "http" or "gateway".
+        :param arrival: Arrival time of the request (epoch seconds).
+        :param name: Name of the executed workflow.
+        :param params: Parameters of the request.
+        :param status: Outcome of the request (HTTP status code, "ok", "error", ...).
+        :param timings: The phase durations and counters of the execution (ExecutionTimer.as_dict()).
+        :param schema: Compiled schema of the workflow inputs, telling the combo inputs apart.
+        """
+        entry = {
+            "t": round(arrival, 3),
+            "src": source,
+            "wf": name,
+            "params": params_shape(params if isinstance(params, dict) else {}, schema),
+            "status": status,
+            "dur": round(time.time() - arrival, 3),
+        }
+        if timings:
+            entry["phases"] = timings.get("phases")
+            entry["counters"] = timings.get("counters")
+
+        try:
+            line = json.dumps(entry, separators=(",", ":"), default=str) + "\n"
+            async with self._lock:
+                await asyncio.to_thread(self._append, line)
+        except Exception as e:
+            connect_print(f"Could not record traffic: {e}")
+
+    def record_in_background(self, *args, **kwargs) -> None:
+        """Appends a request to the trace without waiting for it, see `record`"""
+        task = asyncio.create_task(self.record(*args, **kwargs))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+
+# Global recorder instance
+traffic_recorder = TrafficRecorder(config.TRAFFIC_PATH, config.TRAFFIC_MAX_BYTES, config.TRAFFIC_BACKUPS)
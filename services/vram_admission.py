@@ -0,0 +1,283 @@
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+from typing import Dict, List, Optional, Set
+from ..config import config
+from ..utils.helpers import connect_print
+from ..utils.gpu_utils import get_memory_usage
+from ..utils.deadline import Deadline
+from ..utils.timing import ExecutionTimer
+from .errors import VramExceeded
+
+
+class VramProfile:
+    """GPU memory observed during the recent runs of a workflow"""
+
+    __slots__ = ("peaks", "growths", "runs", "updated_at")
+
+    def __init__(self, runs: int):
+        self.peaks = deque(maxlen=runs)  # MB used at the peak of each run
+        self.growths = deque(maxlen=runs)  # MB the peak exceeded the memory used when the run started by
+        self.runs = 0
+        self.updated_at = None
+
+    @property
+    def expected(self) -> float:
+        """MB a run is expected to allocate: the largest growth of the recent runs (loading its models included)"""
+        return max(self.growths, default=0.0)
+
+    def record(self, baseline: float, peak: float) -> None:
+        self.peaks.append(peak)
+        self.growths.append(max(peak - baseline, 0.0))
+        self.runs += 1
+        self.updated_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "expected_mb": round(self.expected, 1),
+            "peak_mb": round(max(self.peaks, default=0.0), 1),
+            "last_peak_mb": round(self.peaks[-1], 1) if self.peaks else None,
+            "updated_at": self.updated_at,
+        }
+
+
+class VramReservation:
+    """
+    The GPU memory an admitted execution is expected to allocate, until it is released.
+    Its prompt reports when ComfyUI starts and finishes executing it, the memory sampled
+    in between being learned as the profile of the workflow.
+    """
+
+    __slots__ = ("name", "expected", "baseline", "peak", "running", "_admission")
+
+    def __init__(self, admission: "VramAdmission", name: str, expected: float):
+        self.name = name
+        self.expected = expected
+        self.baseline = None  # MB used when the prompt started
+        self.peak = None  # MB used at the peak of the prompt
+        self.running = False
+        self._admission = admission
+
+    @property
+    def remaining(self) -> float:
+        """MB the execution is still expected to allocate"""
+        if self.running and self.baseline is not None:
+            return max(self.expected - (self.peak - self.baseline), 0.0)
+        # Finished prompts hold nothing more than what is sampled
+        return 0.0 if self.baseline is not None else self.expected
+
+    def start(self) -> None:
+        """Called when ComfyUI starts executing the prompt"""
+        self.running = True
+        self._admission._on_start(self)
+
+    def finish(self) -> None:
+        """Called when ComfyUI has finished executing the prompt, whatever its outcome"""
+        if self.running:
+            self.running = False
+            self._admission._on_finish(self)
+
+
+class VramAdmission:
+    """
+    Learns the GPU memory each workflow allocates from NVML samples taken while its prompts run,
+    and, with the Connect.VramAdmission setting, holds executions back while the memory used plus
+    what the admitted executions are still expected to allocate would exceed the GPU memory minus
+    a headroom: heavy workflows queued back to back would otherwise make ComfyUI unload and reload
+    models, or run out of memory. Held executions are admitted in arrival order as memory frees.
+
+    An execution is always admitted when no other one is, so a workflow larger than the headroom
+    (or memory held by other processes) never blocks the queue. One expected to allocate more than
+    the whole GPU memory is rejected instead of being held. Without pynvml, nothing is held.
+    """
+
+    def __init__(self, interval: float, profile_runs: int):
+        self.interval = interval
+        self.profile_runs = profile_runs
+        self.profiles: Dict[str, VramProfile] = {}
+        self._memory = None  # Last sample: {"used", "total"} in MB
+        self._sampled_at = 0.0
+        self._available = None  # Whether NVML can be used, known after the first sample
+        self._reservations: List[VramReservation] = []
+        self._waiters = deque()  # (reservation, future), in arrival order
+        self._sampler: Optional[asyncio.Task] = None
+        # Samples taken when executions start, referenced until they are done
+        self._samples: Set[asyncio.Task] = set()
+        self._stats = {"admitted": 0, "held": 0, "forced": 0, "expired": 0, "rejected": 0}
+
+    @property
+    def waiting(self) -> int:
+        """Executions held until memory frees"""
+        return len(self._waiters)
+
+    async def _sample(self) -> None:
+        if self._available is False:
+            return
+        try:
+            memory = await asyncio.to_thread(get_memory_usage, config.VRAM_DEVICE_INDEX)
+        except Exception as e:
+            if self._available is None:
+                connect_print(f"GPU memory can't be sampled, VRAM profiles and admission disabled: {e}")
+                self._available = False
+            return
+        self._available = True
+        self._memory = memory
+        self._sampled_at = time.monotonic()
+        for reservation in self._reservations:
+            if reservation.running:
+                if reservation.baseline is None:
+                    reservation.baseline = reservation.peak = memory["used"]
+                reservation.peak = max(reservation.peak, memory["used"])
+
+    async def _run_sampler(self) -> None:
+        try:
+            while self._reservations or self._waiters:
+                await self._sample()
+                self._admit_waiters()
+                await asyncio.sleep(self.interval)
+        finally:
+            self._sampler = None
+
+    def _ensure_sampler(self) -> None:
+        if self._sampler is None and self._available is not False:
+            self._sampler = asyncio.create_task(self._run_sampler())
+
+    def _fits(self, reservation: VramReservation) -> bool:
+        if self._memory is None:
+            return True
+        if not self._reservations:
+            if self._projected(reservation) > self._limit():
+                self._stats["forced"] += 1
+            return True
+        return self._projected(reservation) <= self._limit()
+
+    def _projected(self, reservation: VramReservation) -> float:
+        reserved = sum(admitted.remaining for admitted in self._reservations)
+        return self._memory["used"] + reserved + reservation.expected
+
+    def _limit(self) -> float:
+        return self._memory["total"] * (1 - config.vram_headroom_percent / 100)
+
+    def _admit(self, reservation: VramReservation) -> None:
+        self._reservations.append(reservation)
+        self._stats["admitted"] += 1
+        self._ensure_sampler()
+
+    def _admit_waiters(self) -> None:
+        # In arrival order: a held heavy workflow is not overtaken indefinitely by lighter ones
+        while self._waiters:
+            reservation, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(reservation):
+                break
+            self._waiters.popleft()
+            self._admit(reservation)
+            future.set_result(None)
+
+    def _release(self, reservation: VramReservation) -> None:
+        reservation.finish()
+        if reservation in self._reservations:
+            self._reservations.remove(reservation)
+            self._admit_waiters()
+
+    def _on_start(self, reservation: VramReservation) -> None:
+        # Sampled right away, before ComfyUI loads the models of the prompt: the previous sample
+        # may predate the end of the previous prompt
+        if self._available is not False:
+            task = asyncio.create_task(self._sample())
+            self._samples.add(task)
+            task.add_done_callback(self._samples.discard)
+        self._ensure_sampler()
+
+    def _on_finish(self, reservation: VramReservation) -> None:
+        if reservation.baseline is None:
+            return
+        profile = self.profiles.get(reservation.name)
+        if profile is None:
+            profile = self.profiles[reservation.name] = VramProfile(self.profile_runs)
+        profile.record(reservation.baseline, reservation.peak)
+        self._admit_waiters()
+
+    @asynccontextmanager
+    async def admit(self, name: str, deadline: Deadline, timer: ExecutionTimer = None):
+        """
+        Waits until an execution of a workflow fits in the GPU memory, and reserves the memory
+        it is expected to allocate until the end of the block.
+
+        :param name: Name of the executed workflow.
+        :param deadline: Deadline of the request, bounding the wait.
+        :param timer: Optional timer of the execution, the time it is held is its "vram_wait" phase.
+        :return: The reservation, whose prompt is to report when it starts and finishes executing.
+        :raises DeadlineExceeded: If the deadline expired before the execution was admitted.
+        :raises VramExceeded: If the workflow is expected to allocate more than the GPU memory.
+        """
+        profile = self.profiles.get(name)
+        reservation = VramReservation(self, name, profile.expected if profile else 0.0)
+
+        if config.vram_admission and self._available is not False:
+            if time.monotonic() - self._sampled_at > self.interval:
+                await self._sample()
+            if self._memory is not None and reservation.expected > self._memory["total"]:
+                self._stats["rejected"] += 1
+                raise VramExceeded(
+                    f"Workflow '{name}' is expected to allocate {reservation.expected:.0f}MB, "
+                    f"more than the {self._memory['total']:.0f}MB of the GPU."
+                )
+            if not self._waiters and self._fits(reservation):
+                self._admit(reservation)
+            else:
+                future = asyncio.get_running_loop().create_future()
+                self._waiters.append((reservation, future))
+                self._stats["held"] += 1
+                self._ensure_sampler()
+                try:
+                    with timer.phase("vram_wait") if timer else nullcontext():
+                        await asyncio.wait_for(future, deadline.remaining())
+                except BaseException as e:
+                    if future.done() and not future.cancelled():
+                        # Admitted just as the caller gave up
+                        self._release(reservation)
+                    else:
+                        future.cancel()
+                        # Held executions behind this one may fit now
+                        self._admit_waiters()
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._stats["expired"] += 1
+                        deadline.check("VRAM admission")
+                    raise
+        else:
+            self._admit(reservation)
+
+        try:
+            yield reservation
+        finally:
+            self._release(reservation)
+
+    def stats(self, name: str = None) -> dict:
+        profiles = {
+            workflow: profile.to_dict()
+            for workflow, profile in self.profiles.items()
+            if name is None or workflow == name
+        }
+        memory = None
+        if self._memory is not None:
+            memory = {"used_mb": round(self._memory["used"], 1), "total_mb": round(self._memory["total"], 1)}
+        return {
+            "enabled": config.vram_admission,
+            "available": self._available,
+            "headroom_percent": config.vram_headroom_percent,
+            "memory": memory,
+            "admitted": len(self._reservations),
+            "reserved_mb": round(sum(reservation.remaining for reservation in self._reservations), 1),
+            "waiting": self.waiting,
+            "counts": dict(self._stats),
+            "profiles": profiles,
+        }
+
+
+# Global admission instance
+vram_admission = VramAdmission(config.VRAM_SAMPLE_INTERVAL, config.VRAM_PROFILE_RUNS)
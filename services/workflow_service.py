@@ -1,12 +1,40 @@
 import os
 import json
-import copy
-import aiofiles
-import base64
-import requests
+import hashlib
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
 from ..entities.workflow import Workflow
+from ..entities.output_file import OutputFile, guess_media_type
+from ..entities.preview_frame import PreviewFrame
 from ..config import config
+from ..utils.helpers import connect_print
+from ..utils.timing import ExecutionTimer
+from ..utils.node_utils import get_output_node_classes
+from ..utils.deadline import Deadline, DeadlineExceeded
+from .workflow_store import WorkflowStore
+from .cached_node_index import CachedNodeIndex
+from .cache_injection_policy import CacheInjectionPolicy
+from .param_validator import ParamValidators
+from .idempotency_store import IdempotencyStore
+from .output_encoder import OutputOptions, output_encoder
 from .comfyui_service import comfyui_service
+from .cpu_executor import cpu_executor
+from .download_links import download_links
+from .result_sinks import ResultSink, result_sinks
+from .vram_admission import vram_admission
+from .errors import ExecutionCancelled, ExecutionConflict
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _single_or_list(items):
+    """Returns the only element of a list, or the list itself"""
+    if isinstance(items, list) and len(items) == 1:
+        return items[0]
+    return items
 
 
 class WorkflowService:
@@ -17,70 +45,52 @@ class WorkflowService:
 
     def __init__(self):
         """
-        Initializes the WorkflowService by:
-        - Creating necessary directories if they don't exist.
-        - Loading JSON workflow files from disk into memory.
-        - Refreshing the cached nodes for all loaded workflows.
+        Initializes the WorkflowService without touching the disk, as it is created when ComfyUI imports
+        custom nodes: the workflows directory is indexed on first use (or on startup), and the workflows
+        are parsed on first use.
         """
-        self.workflows = {}  # Holds the loaded workflows, keyed by their name
-        self.workflows_cached_nodes = (
-            []
-        )  # Stores information about nodes tagged as cached
+        # Holds the workflows, keyed by their name, loaded lazily from disk
+        self.workflows = WorkflowStore(config.WORKFLOWS_PATH)
+        self.workflows.add_listener(self._on_workflow_changed)
 
-        # Ensure that the workflows directory and the input directory exist
-        os.makedirs(config.WORKFLOWS_PATH, exist_ok=True)
-        os.makedirs(config.INPUT_PATH, exist_ok=True)
+        # Indexes the nodes tagged as cached, per workflow, built on first use
+        self.cached_nodes = CachedNodeIndex(self.workflows)
+        self.cache_policy = CacheInjectionPolicy(self.cached_nodes)
 
-        # Load existing workflow JSON files into memory
-        for filename in os.listdir(config.WORKFLOWS_PATH):
-            if filename.endswith(".json"):
-                file_path = os.path.join(config.WORKFLOWS_PATH, filename)
-                try:
-                    with open(file_path, "r", encoding="utf-8") as file:
-                        data = json.load(file)
-                        name = os.path.splitext(filename)[
-                            0
-                        ]  # Extract the base filename
-                        self.workflows[name] = data
-                except Exception as e:
-                    # If a file cannot be loaded, print an error and continue
-                    print(f"Error loading file '{filename}': {e}")
-
-        # Update the list of cached nodes after loading all workflows
-        self.refresh_workflows_cached_nodes()
-
-    def refresh_workflows_cached_nodes(self):
-        """
-        Updates self.workflows_cached_nodes with all nodes tagged as "!cache"
-        from every workflow currently loaded.
-        """
-        workflows_cached_nodes = []
+        # Parameter validators, compiled per workflow on first use
+        self.validators = ParamValidators(self.workflows)
 
-        # Go through each workflow and check for cached nodes
-        for workflow_name, workflow_data in self.workflows.items():
-            wrapper = Workflow(workflow_data)
-            cached_nodes = wrapper.get_tagged_nodes("!cache")
+        self._output_node_classes = None
 
-            # Store each cached node with the workflow name for reference
-            for node in cached_nodes:
-                workflows_cached_nodes.append(
-                    {"workflow_name": workflow_name, "node": node["node"]}
-                )
+        # Executions shared by the retries of a request, keyed by idempotency key
+        self.idempotency = IdempotencyStore(
+            config.IDEMPOTENCY_TTL, config.IDEMPOTENCY_MAX_ENTRIES, config.IDEMPOTENCY_MAX_BYTES
+        )
 
-        self.workflows_cached_nodes = workflows_cached_nodes
+        # Running executions that can be cancelled, keyed by execution id
+        self._executions: Dict[str, asyncio.Task] = {}
+        self._cancel_requests = set()
+
+    async def start(self) -> None:
+        """Indexes the workflows directory and starts watching it for external changes"""
+        os.makedirs(config.INPUT_PATH, exist_ok=True)
+        await asyncio.to_thread(self.workflows.index)
+        self.workflows.start_watching()
+
+    def _on_workflow_changed(self, name: str) -> None:
+        # Only the workflow that changed is re-indexed
+        self.cached_nodes.update(name)
+        self.validators.invalidate(name)
 
     def get_cached_nodes_except(self, name: str) -> list:
         """
-        Returns a list of cached nodes for all workflows except the specified one.
+        Returns a list of cached nodes for all workflows except the specified one,
+        without duplicates and without the nodes the workflow already contains.
 
         :param name: Name of the workflow to exclude.
         :return: A list of cached node data.
         """
-        return [
-            item["node"]
-            for item in self.workflows_cached_nodes
-            if item["workflow_name"] != name
-        ]
+        return list(self.cached_nodes.get_injection(name).values())
 
     def get_workflows_cached_nodes(self):
         """
@@ -88,7 +98,7 @@ class WorkflowService:
 
         :return: A list of cached node information.
         """
-        return self.workflows_cached_nodes
+        return self.cached_nodes.list_nodes()
 
     async def save_workflow(self, name: str, workflow: dict) -> None:
         """
@@ -97,17 +107,8 @@ class WorkflowService:
         :param name: Name of the workflow.
         :param workflow: The workflow data (dictionary) to be saved.
         """
-        file_path = os.path.join(config.WORKFLOWS_PATH, f"{name}.json")
-
-        # Write the workflow to a file asynchronously
-        async with aiofiles.open(file_path, "w", encoding="utf-8") as file:
-            await file.write(json.dumps(workflow))
-
-        # Update the in-memory representation
-        self.workflows[name] = workflow
-
-        # Refresh the cached nodes since the workflow has changed
-        self.refresh_workflows_cached_nodes()
+        # The store writes the file and notifies the change (refreshing the cached nodes)
+        await self.workflows.save(name, workflow)
 
     async def delete_workflow(self, name: str) -> None:
         """
@@ -115,149 +116,449 @@ class WorkflowService:
 
         :param name: Name of the workflow to be deleted.
         """
-        file_path = os.path.join(config.WORKFLOWS_PATH, f"{name}.json")
+        await self.workflows.delete(name)
+
+    def _get_output_node_classes(self) -> frozenset:
+        # Custom nodes are all registered once ComfyUI runs workflows, so this is computed once
+        if self._output_node_classes is None:
+            self._output_node_classes = get_output_node_classes()
+        return self._output_node_classes
+
+    def validate_params(self, name: str, params: dict) -> None:
+        """
+        Checks the parameters of an execution request against the workflow inputs,
+        before anything is downloaded or queued.
+
+        :param name: Name of the workflow to execute.
+        :param params: Dictionary containing tags and payload data.
+        :raises FileNotFoundError: If the workflow is not found.
+        :raises ValidationError: With every problem found in the parameters.
+        """
+        if name not in self.workflows:
+            raise FileNotFoundError(f"Workflow '{name}' not found.")
+        self.validators.get(name).validate(params)
+
+    def param_schema(self, name: str) -> Optional[dict]:
+        """Returns the compiled schema of the inputs of a workflow (tag => input => JSON schema), None if unknown"""
+        if not isinstance(name, str):
+            return None
+        try:
+            return self.validators.get(name).schema
+        except KeyError:
+            return None
+
+    def validate_upload(self, name: str, tag: str, input_name: str) -> None:
+        """
+        Checks that a file can be uploaded to an input of a workflow, before receiving it.
+
+        :raises FileNotFoundError: If the workflow is not found.
+        :raises ValidationError: If the input doesn't accept a file.
+        """
+        if name not in self.workflows:
+            raise FileNotFoundError(f"Workflow '{name}' not found.")
+        self.validators.get(name).validate_upload(tag, input_name)
+
+    async def _ingest_file(self, tag: str, input_name: str, value: dict, deadline: Deadline) -> str:
+        """
+        Writes a file given by an execution request into the ComfyUI input directory.
+
+        :param tag: The tag of the node receiving the file.
+        :param input_name: The input of the node receiving the file.
+        :param value: The file payload, with either a base64 "content" or an "url", and an optional "name".
+        :param deadline: Deadline of the request, bounding the download time.
+        :return: The file name to set into the node input, or None if the payload has no content.
+        """
+        deadline.check("file ingestion")
+
+        # If "content" is present, treat it as a base64-encoded file
+        if "content" in value and value["content"]:
+            filename = value.get("name")
+            if not filename:
+                raise ValueError("File name is required with content.")
+            file_path = os.path.join(config.INPUT_PATH, filename)
+
+            # Check if file already exists
+            if os.path.exists(file_path):
+                print(
+                    f"File {filename} already exists in {config.INPUT_PATH}, using existing file for {tag}.{input_name}"
+                )
+            else:
+                file_content = await cpu_executor.b64decode(value["content"])
+                # Write the decoded file to the INPUT_PATH
+                with open(file_path, "wb") as f:
+                    f.write(file_content)
+
+                print(
+                    f"File {filename} written to {config.INPUT_PATH} and specified into {tag}.{input_name}"
+                )
+            return filename
+
+        # If "url" is present, download the file and store it
+        if "url" in value and value["url"]:
+            filename = value.get("name")
+            if not filename:
+                filename = value["url"].split("/")[-1]
+
+            file_path = os.path.join(config.INPUT_PATH, filename)
+
+            # Check if file already exists
+            if os.path.exists(file_path):
+                print(
+                    f"File {filename} already exists in {config.INPUT_PATH}, using existing file for {tag}.{input_name}"
+                )
+            else:
+                # Imported on first download, it is slow to import and rarely needed
+                import requests
+
+                # Downloaded off the event loop, within the time left to the request
+                try:
+                    response = await asyncio.to_thread(
+                        requests.get, value["url"], timeout=deadline.remaining()
+                    )
+                except requests.Timeout:
+                    deadline.check("file ingestion")
+                    raise
+                response.raise_for_status()
+                with open(file_path, "wb") as f:
+                    f.write(response.content)
+
+                print(
+                    f"File {filename} downloaded from {value['url']} and written to {config.INPUT_PATH} and specified into {tag}.{input_name}"
+                )
+            return filename
+
+        # If there's no valid content or URL, skip
+        print(f"No valid content/url for {value.get('name', 'unknown file')}")
+        return None
+
+    async def ingest_upload(
+        self, tag: str, input_name: str, filename: str, chunks: AsyncIterator[bytes], deadline: Deadline
+    ) -> str:
+        """
+        Streams a file uploaded with an execution request into the ComfyUI input directory,
+        one chunk at a time, so memory usage doesn't depend on the file size.
+
+        :param tag: The tag of the node receiving the file.
+        :param input_name: The input of the node receiving the file.
+        :param filename: Name of the uploaded file, only its base name is kept.
+        :param chunks: Asynchronous iterator over the file content.
+        :param deadline: Deadline of the request, bounding the upload time.
+        :return: The file name to set into the node input.
+        """
+        filename = os.path.basename(filename.replace("\\", "/"))
+        if not filename or filename in (".", ".."):
+            raise ValueError(f"Invalid file name for {tag}.{input_name}.")
+        file_path = os.path.join(config.INPUT_PATH, filename)
 
-        # Remove the file if it exists
+        # Check if file already exists, the upload is then only drained
         if os.path.exists(file_path):
-            os.remove(file_path)
+            async for _ in chunks:
+                deadline.check("file upload")
+            print(
+                f"File {filename} already exists in {config.INPUT_PATH}, using existing file for {tag}.{input_name}"
+            )
+            return filename
+
+        import aiofiles
+
+        # Written under a temporary name, so ComfyUI never reads a partial file
+        tmp_path = f"{file_path}.{os.getpid()}.{id(chunks)}.part"
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    deadline.check("file upload")
+                    await f.write(chunk)
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
-        # Remove from in-memory dictionary if present
-        self.workflows.pop(name, None)
+        print(
+            f"File {filename} uploaded to {config.INPUT_PATH} and specified into {tag}.{input_name}"
+        )
+        return filename
 
-        # Refresh the cached nodes after deletion
-        self.refresh_workflows_cached_nodes()
+    async def _apply_params(self, workflow: Workflow, params: dict, deadline: Deadline) -> None:
+        """
+        Alters a workflow with the parameters of an execution request.
 
-    async def execute_workflow(self, name: str, params: dict, override_token: str = None) -> dict:
+        :param workflow: The workflow (a copy, it is modified in place).
+        :param params: Dictionary containing tags and payload data to alter or bypass certain nodes.
+        :param deadline: Deadline of the request, bounding the file ingestion.
+        """
+        # Process each tag in the provided parameters
+        for tag, payload in (params or {}).items():
+            # If the payload is simply False, bypass all nodes with this tag
+            if payload is False:
+                workflow.bypass_nodes("$" + tag)
+                workflow.bypass_nodes("#" + tag)
+
+            elif isinstance(payload, dict):
+                # Otherwise, iterate through the input data for the tag
+                for input_name, value in payload.items():
+                    if isinstance(value, dict):
+                        # Handle file uploads and URLs
+                        if value.get("type") == "file":
+                            try:
+                                filename = await self._ingest_file(tag, input_name, value, deadline)
+                                if filename is None:
+                                    continue
+
+                                # Update the workflow with the file name for this tag
+                                workflow.update_tagged_nodes_input(
+                                    tag, input_name, filename
+                                )
+
+                            except DeadlineExceeded:
+                                raise
+                            except Exception as e:
+                                print(
+                                    f"Error writing file {value.get('name', 'unknown file')} : {e}"
+                                )
+                        else:
+                            # TODO: Handling for other dict-based types, if needed
+                            pass
+                    else:
+                        # Update the workflow with the value
+                        workflow.update_tagged_nodes_input(tag, input_name, value)
+
+    async def execute_workflow(
+        self,
+        name: str,
+        params: dict,
+        override_token: str = None,
+        binary: bool = False,
+        execution_id: str = None,
+        deadline: Deadline = None,
+        idempotency_key: str = None,
+        timer: ExecutionTimer = None,
+        on_output: Callable[[str, object, object, object], Awaitable] = None,
+        media_links: bool = False,
+        on_preview: Callable[[PreviewFrame], None] = None,
+    ) -> dict:
         """
         Executes a specified workflow with given parameters.
 
         :param name: Name of the workflow to execute.
         :param params: Dictionary containing tags and payload data to alter or bypass certain nodes.
         :param override_token: Optional token to override the configured ComfyUI token for this execution.
+        :param binary: Return the files as raw bytes instead of base64 strings.
+        :param execution_id: Optional id allowing to cancel the execution with `cancel_execution`.
+        :param deadline: Optional deadline for the whole execution, the workflow default timeout otherwise.
+        :param idempotency_key: Optional key identifying retries of the same request: a retry attaches to the
+                                running execution or gets its result back instead of queuing a new prompt.
+        :param timer: Optional timer collecting the phase durations of the execution.
+        :param on_output: Optional coroutine called with each tag, its result, its thumbnails (or None) and its
+                          media types as soon as the node is executed, before the aggregated result is returned.
+                          Retries attached to a running execution only get the aggregated result.
+        :param media_links: Return the large media files (videos, audio...) as download links instead of their
+                            content, when ComfyUI runs on this machine.
+        :param on_preview: Optional function called with each preview frame ComfyUI sends while the prompt runs.
+                           Retries attached to a running execution don't get the previews.
         :return: A dictionary of results keyed by their tags, usually images generated by each node.
+                 Media types are listed under "_media" when some outputs are not images.
         :raises FileNotFoundError: If the requested workflow is not found.
+        :raises ExecutionCancelled: If the execution has been cancelled with `cancel_execution`.
+        :raises DeadlineExceeded: If the deadline expired before the end of the execution.
+        :raises IdempotencyConflict: If the idempotency key has been used for a different request.
+        :raises ExecutionConflict: If an execution with the same id is still running.
+        """
+        if idempotency_key is not None:
+            fingerprint = hashlib.sha1(
+                json.dumps([name, params, binary, media_links], sort_keys=True, default=str).encode("utf-8")
+            ).hexdigest()
+            return await self.idempotency.run(
+                idempotency_key,
+                fingerprint,
+                lambda: self.execute_workflow(
+                    name,
+                    params,
+                    override_token,
+                    binary,
+                    execution_id,
+                    deadline,
+                    timer=timer,
+                    on_output=on_output,
+                    media_links=media_links,
+                    on_preview=on_preview,
+                ),
+            )
+
+        if deadline is None or deadline.expires_at is None:
+            deadline = Deadline.from_value(config.get_workflow_timeout(name))
+
+        if execution_id is None:
+            return await self._execute_workflow(
+                name, params, override_token, binary, deadline, timer, on_output, media_links, on_preview
+            )
+
+        if execution_id in self._executions:
+            raise ExecutionConflict(f"An execution with id '{execution_id}' is already running.")
+
+        # Run in a dedicated task, so cancelling it never cancels the caller
+        task = asyncio.create_task(
+            self._execute_workflow(
+                name, params, override_token, binary, deadline, timer, on_output, media_links, on_preview
+            )
+        )
+        self._executions[execution_id] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if execution_id in self._cancel_requests:
+                raise ExecutionCancelled(f"Execution '{execution_id}' has been cancelled.") from None
+            raise
+        finally:
+            self._executions.pop(execution_id, None)
+            self._cancel_requests.discard(execution_id)
+
+    def cancel_execution(self, execution_id: str) -> bool:
         """
+        Cancels a running execution: its prompt is removed from the ComfyUI queue or interrupted.
+
+        :param execution_id: The id given to `execute_workflow`.
+        :return: True if the execution was running and has been cancelled.
+        """
+        task = self._executions.get(execution_id)
+        if task is None or task.done():
+            return False
+
+        connect_print(f"Cancelling execution '{execution_id}'")
+        self._cancel_requests.add(execution_id)
+        task.cancel()
+        return True
+
+    async def _execute_workflow(
+        self,
+        name: str,
+        params: dict,
+        override_token: str,
+        binary: bool,
+        deadline: Deadline,
+        timer: ExecutionTimer = None,
+        on_output: Callable[[str, object, object, object], Awaitable] = None,
+        media_links: bool = False,
+        on_preview: Callable[[PreviewFrame], None] = None,
+    ) -> dict:
         # Temporarily override the comfy token if provided
         if override_token:
             config.set_temp_token(override_token)
             
+        timer = timer or ExecutionTimer(name)
         try:
-            if name not in self.workflows:
-                raise FileNotFoundError(f"Workflow '{name}' not found.")
-
-            # Wrap the workflow in a Workflow object for convenience
-            workflow = Workflow(copy.deepcopy(self.workflows[name]))
-
-            # Bypass any nodes tagged with "!bypass" if present
-            workflow.bypass_nodes("!bypass")
-
-            # Merge cached nodes from other workflows into this workflow,
-            # using a unique key to avoid collisions
-            key = config.CACHED_NODE_KEY_START
-            for node in self.get_cached_nodes_except(name):
-                key += 1
-                workflow[key] = node
-
-            # Process each tag in the provided parameters
-            for tag, payload in (params or {}).items():
-                # If the payload is simply False, bypass all nodes with this tag
-                if payload is False:
-                    workflow.bypass_nodes("$" + tag)
-                    workflow.bypass_nodes("#" + tag)
-
-                elif isinstance(payload, dict):
-                    # Otherwise, iterate through the input data for the tag
-                    for input_name, value in payload.items():
-                        if isinstance(value, dict):
-                            # Handle file uploads and URLs
-                            if value.get("type") == "file":
-                                try:
-                                    filename = None
-                                    file_path = None
-                                    
-                                    # If "content" is present, treat it as a base64-encoded file
-                                    if "content" in value and value["content"]:
-                                        filename = value.get("name")
-                                        if not filename:
-                                            raise ValueError(
-                                                "File name is required with content."
-                                            )
-                                        file_path = os.path.join(config.INPUT_PATH, filename)
-                                        
-                                        # Check if file already exists
-                                        if os.path.exists(file_path):
-                                            print(
-                                                f"File {filename} already exists in {config.INPUT_PATH}, using existing file for {tag}.{input_name}"
-                                            )
-                                        else:
-                                            file_content = base64.b64decode(value["content"])
-                                            # Write the decoded file to the INPUT_PATH
-                                            with open(file_path, "wb") as f:
-                                                f.write(file_content)
-
-                                            print(
-                                                f"File {filename} written to {config.INPUT_PATH} and specified into {tag}.{input_name}"
-                                            )
-
-                                    # If "url" is present, download the file and store it
-                                    elif "url" in value and value["url"]:
-                                        filename = value.get("name")
-                                        if not filename:
-                                            filename = value["url"].split("/")[-1]
-                                        
-                                        file_path = os.path.join(config.INPUT_PATH, filename)
-                                        
-                                        # Check if file already exists
-                                        if os.path.exists(file_path):
-                                            print(
-                                                f"File {filename} already exists in {config.INPUT_PATH}, using existing file for {tag}.{input_name}"
-                                            )
-                                        else:
-                                            response = requests.get(value["url"])
-                                            response.raise_for_status()
-                                            with open(file_path, "wb") as f:
-                                                f.write(response.content)
-
-                                            print(
-                                                f"File {filename} downloaded from {value['url']} and written to {config.INPUT_PATH} and specified into {tag}.{input_name}"
-                                            )
-                                    else:
-                                        # If there's no valid content or URL, skip
-                                        print(
-                                            f"No valid content/url for {value.get('name', 'unknown file')}"
-                                        )
-                                        continue
-
-                                    # Update the workflow with the file name for this tag
-                                    workflow.update_tagged_nodes_input(
-                                        tag, input_name, filename
-                                    )
-
-                                except Exception as e:
-                                    print(
-                                        f"Error writing file {value.get('name', 'unknown file')} : {e}"
-                                    )
-                            else:
-                                # TODO: Handling for other dict-based types, if needed
-                                pass
-                        else:
-                            # Update the workflow with the value
-                            workflow.update_tagged_nodes_input(tag, input_name, value)
+            with timer.phase("validate"):
+                # Parsed off the event loop on first use, like every workflow for the cached nodes index
+                if name in self.workflows:
+                    await self.workflows.load(name)
+                if not self.cached_nodes.built:
+                    await self.workflows.load_all()
+                self.validate_params(name, params)
+                params = dict(params or {})
+                output_options = OutputOptions.from_value(params.pop("_output", None))
+                # Outputs sent to a result sink are returned as keys and URLs
+                sink_name = config.default_result_sink
+                if output_options is not None and output_options.sink is not None:
+                    sink_name = output_options.sink
+                sink = result_sinks.get(sink_name) if sink_name else None
+
+            with timer.phase("prepare"):
+                # Wrap the workflow in a Workflow object for convenience
+                workflow = Workflow(await cpu_executor.deepcopy(self.workflows[name]))
+
+                # Bypass any nodes tagged with "!bypass" if present
+                workflow.bypass_nodes("!bypass")
+
+                # Process each tag in the provided parameters
+                await self._apply_params(workflow, params, deadline)
+
+                # Merge the cached nodes from other workflows worth keeping in memory, once the
+                # parameters are applied so they are never altered, using a unique key to avoid collisions
+                injected = self.cache_policy.select(name)
+                key = config.CACHED_NODE_KEY_START
+                injected_ids = []
+                for node in injected.values():
+                    key += 1
+                    while str(key) in workflow:
+                        key += 1
+                    workflow[str(key)] = node
+                    injected_ids.append(str(key))
+                timer.set("injected_nodes", f"{len(injected)}/{len(self.cached_nodes.get_injection(name))}")
+
+                # Drop the nodes left orphaned by bypasses, keeping everything feeding an output
+                # and the cached nodes, the workflow's own and the injected ones
+                node_count = len(workflow)
+                own_cached_ids = [tagged["id"] for tagged in workflow.get_tagged_nodes("!cache")]
+                workflow.remove_unreachable_nodes(
+                    workflow.get_output_node_ids(self._get_output_node_classes()) + own_cached_ids + injected_ids
+                )
+                timer.set("nodes", f"{len(workflow)}/{node_count}")
 
-            # Run the workflow asynchronously using the ComfyUI service
-            images = await comfyui_service.run_workflow(workflow)
-            response = {}
+            # Outputs being processed, by node ID, with the files they are processed from
+            processed: Dict[str, tuple] = {}
+
+            def process_output(node_id: str, outputs: List[OutputFile]) -> asyncio.Task:
+                if node_id not in processed or processed[node_id][0] is not outputs:
+                    task = asyncio.create_task(
+                        self._process_output(outputs, output_options, binary, media_links, sink)
+                    )
+                    processed[node_id] = (outputs, task)
+                return processed[node_id][1]
 
-            # Collect and group the resulting images by each node's tags
-            for node_id, node_images in images.items():
+            async def deliver_output(node_id: str, outputs: List[OutputFile]) -> None:
+                # Processed as soon as retrieved, only the tagged nodes are part of the result
                 tags = workflow.get_node_tags(node_id)
+                if not tags:
+                    return
+                values, thumbnails, media_types = await process_output(node_id, outputs)
+                if on_output is None:
+                    return
                 for tag in tags:
-                    # If there's only one element in the array, return it directly
-                    if isinstance(node_images, list) and len(node_images) == 1:
-                        response[tag[1:]] = node_images[0]
-                    else:
-                        response[tag[1:]] = node_images
+                    try:
+                        await on_output(
+                            tag[1:], _single_or_list(values), _single_or_list(thumbnails), _single_or_list(media_types)
+                        )
+                    except Exception as e:
+                        # The consumer of the early outputs went away, the execution goes on
+                        connect_print(f"Could not deliver output '{tag[1:]}' of {name}: {e}")
+
+            # Run the workflow asynchronously using the ComfyUI service
+            # Images sent untouched to a sink are read from disk, they don't need to be retrieved
+            fetch_images = sink is None or (
+                output_options is not None and (output_options.transcodes or bool(output_options.thumbnail))
+            )
+            # Queued once the GPU memory this workflow is expected to allocate is free (Connect.VramAdmission)
+            async with vram_admission.admit(name, deadline, timer) as reservation:
+                node_outputs = await comfyui_service.run_workflow(
+                    workflow, timer, name, deadline, deliver_output, fetch_images, reservation, on_preview
+                )
+            response = {}
 
+            # The models of this workflow and of the injected nodes are now resident
+            self.cache_policy.mark_used(self.cached_nodes.get_workflow_hashes(name))
+            self.cache_policy.mark_used(injected.keys())
+
+            # Collect and group the results by each node's tags, most of them are processed already
+            media = {}
+            with timer.phase("encode"):
+                for node_id, outputs in node_outputs.items():
+                    tags = workflow.get_node_tags(node_id)
+                    if not tags:
+                        continue
+                    values, thumbnails, media_types = await process_output(node_id, outputs)
+                    for tag in tags:
+                        # If there's only one element in the array, return it directly
+                        response[tag[1:]] = _single_or_list(values)
+                        media[tag[1:]] = _single_or_list(media_types)
+
+                        # Thumbnails are grouped the same way, under "_thumbnails"
+                        if thumbnails:
+                            response.setdefault("_thumbnails", {})[tag[1:]] = _single_or_list(thumbnails)
+
+                    # Image only results keep their usual shape, the others are labeled
+                    if any(not output.is_image for output in outputs):
+                        response["_media"] = media
+
+            connect_print(timer.summary())
             return response
             
         finally:
@@ -265,6 +566,57 @@ class WorkflowService:
             if override_token:
                 config.clear_temp_token()
 
+    async def _process_output(
+        self,
+        outputs: List[OutputFile],
+        output_options: OutputOptions,
+        binary: bool,
+        media_links: bool,
+        sink: ResultSink = None,
+    ) -> tuple:
+        """
+        Transcodes, resizes and makes thumbnails of the images of an output node, as requested,
+        then stores its files in the result sink if any, or encodes them in base64 unless they are
+        returned as raw bytes. Large media files on this machine are returned as download links if
+        `media_links` is set, read from disk otherwise. Texts are returned as is.
+
+        :return: The values, the thumbnails of the images (None without thumbnails) and the media types.
+        """
+        contents = [output.data for output in outputs]
+        media_types = [output.media_type for output in outputs]
+        thumbnails = None
+        images = [index for index, output in enumerate(outputs) if output.is_image and output.data is not None]
+        if output_options is not None and images:
+            encoded = await asyncio.gather(
+                *(output_encoder.encode(outputs[index].data, output_options) for index in images)
+            )
+            for index, (image, _) in zip(images, encoded):
+                contents[index] = image
+                if output_options.format:
+                    media_types[index] = guess_media_type(f"output.{output_options.format.lower()}")
+            if output_options.thumbnail:
+                thumbnails = [thumbnail for _, thumbnail in encoded]
+
+        async def get_value(output: OutputFile, content, media_type: str):
+            if output.is_text:
+                return content
+            if sink is not None:
+                # Stored from disk when only located
+                return await sink.put(media_type, content, output.path if content is None else None, output.filename)
+            if content is None:
+                if media_links:
+                    return download_links.issue(output.path, output.media_type, output.filename, output.size)
+                content = await asyncio.to_thread(_read_file, output.path)
+            return content if binary else await cpu_executor.b64encode(content)
+
+        values = await asyncio.gather(*(get_value(*item) for item in zip(outputs, contents, media_types)))
+        if thumbnails and sink is not None:
+            thumbnail_type = guess_media_type(f"thumbnail.{(output_options.format or 'jpeg').lower()}")
+            thumbnails = await asyncio.gather(*(sink.put(thumbnail_type, image) for image in thumbnails))
+        elif thumbnails and not binary:
+            thumbnails = await asyncio.gather(*(cpu_executor.b64encode(image) for image in thumbnails))
+        return list(values), thumbnails and list(thumbnails), media_types
+
     async def list_workflows(self) -> list:
         """
         Returns a list of the names of all loaded workflows.
@@ -278,11 +630,12 @@ class WorkflowService:
         Retrieves the inputs and outputs from a specified workflow.
 
         :param name: The name of the workflow to retrieve information from.
-        :return: A dictionary containing the workflow's name, its tagged inputs, and outputs.
+        :return: A dictionary containing the workflow's name, its tagged inputs, outputs and inputs schema.
         """
-        wrapper = Workflow(self.workflows[name])
+        wrapper = Workflow(await self.workflows.load(name))
         return {
             "name": name,
             "inputs": wrapper.get_tagged_inputs(),
             "outputs": wrapper.get_tagged_outputs(),
+            "schema": self.validators.get(name).to_openapi(),
         }
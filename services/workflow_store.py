@@ -0,0 +1,287 @@
+import os
+import json
+import asyncio
+from collections.abc import Mapping
+from typing import Callable, Dict, List, Optional
+from ..config import config
+from ..utils.helpers import connect_print
+from .cpu_executor import cpu_executor
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # Optional, falls back to stat polling
+    INotify = None
+
+
+class WorkflowEntry:
+    """
+    Index entry of a workflow file: its stat signature and, once loaded, its parsed content.
+    Entries are never mutated after being published, a reload creates a new entry.
+    """
+
+    __slots__ = ("name", "path", "mtime_ns", "size", "data")
+
+    def __init__(self, name: str, path: str, mtime_ns: int, size: int, data: dict = None):
+        self.name = name
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.data = data
+
+    def same_file(self, stat: os.stat_result) -> bool:
+        return self.mtime_ns == stat.st_mtime_ns and self.size == stat.st_size
+
+
+class WorkflowStore(Mapping):
+    """
+    Read-only mapping of workflow name => workflow data backed by the JSON files of a directory.
+
+    Only file names and modification times are indexed, on first access or with `index()`,
+    and each workflow is parsed on first access.
+    External changes (files edited, copied or removed by other tools) are detected by `refresh()`,
+    which is triggered by inotify when available or by cheap stat polling otherwise.
+    Only the changed workflows are reloaded, and the index is swapped atomically: a reader always sees
+    either the old or the new version of a workflow, never a partially written one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._index: Optional[Dict[str, WorkflowEntry]] = None  # built on first access
+        self._listeners: List[Callable[[str], None]] = []
+        self._refresh_lock = asyncio.Lock()
+        self._watch_task = None
+
+    @property
+    def _entries(self) -> Dict[str, WorkflowEntry]:
+        if self._index is None:
+            self.index()
+        return self._index
+
+    @_entries.setter
+    def _entries(self, entries: Dict[str, WorkflowEntry]) -> None:
+        self._index = entries
+
+    def index(self) -> None:
+        """Indexes the workflow files of the directory (creating it if needed), if not done yet"""
+        if self._index is not None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        self._index = {
+            name: WorkflowEntry(name, self._file_path(name), stat.st_mtime_ns, stat.st_size)
+            for name, stat in self._scan().items()
+        }
+
+    def _file_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.json")
+
+    def _scan(self) -> Dict[str, os.stat_result]:
+        """Returns the stat of every workflow file in the directory, keyed by workflow name"""
+        stats = {}
+        with os.scandir(self.path) as it:
+            for dir_entry in it:
+                if dir_entry.name.endswith(".json") and dir_entry.is_file():
+                    stats[os.path.splitext(dir_entry.name)[0]] = dir_entry.stat()
+        return stats
+
+    def _load(self, entry: WorkflowEntry) -> WorkflowEntry:
+        """Parses the file of an entry and returns the loaded entry (the given one is left untouched)"""
+        with open(entry.path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        return WorkflowEntry(entry.name, entry.path, entry.mtime_ns, entry.size, data)
+
+    def _publish(self, name: str, entry: Optional[WorkflowEntry]) -> None:
+        """Swaps the entry of a workflow by replacing the whole index (copy on write)"""
+        entries = dict(self._entries)
+        if entry is None:
+            entries.pop(name, None)
+        else:
+            entries[name] = entry
+        self._entries = entries
+
+    def _notify(self, name: str) -> None:
+        for listener in self._listeners:
+            try:
+                listener(name)
+            except Exception as e:
+                connect_print(f"Workflow store listener error for '{name}': {e}")
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """
+        Registers a callback called with the workflow name each time a workflow is added, changed or removed.
+        """
+        self._listeners.append(listener)
+
+    def is_loaded(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.data is not None
+
+    def __getitem__(self, name: str) -> dict:
+        indexed = self._entries[name]
+        if indexed.data is not None:
+            return indexed.data
+
+        try:
+            entry = self._load(indexed)
+        except (OSError, json.JSONDecodeError) as e:
+            raise KeyError(name) from e
+        # Only publish if nobody swapped the entry meanwhile
+        if self._entries.get(name) is indexed:
+            self._publish(name, entry)
+        return entry.data
+
+    async def load(self, name: str) -> dict:
+        """
+        Returns a workflow like `store[name]`, parsing it off the event loop if not loaded yet.
+
+        :raises KeyError: If the workflow doesn't exist or its file can't be parsed.
+        """
+        indexed = self._entries[name]
+        if indexed.data is not None:
+            return indexed.data
+
+        try:
+            entry = await asyncio.to_thread(self._load, indexed)
+        except (OSError, json.JSONDecodeError) as e:
+            raise KeyError(name) from e
+        # Only publish if nobody swapped the entry meanwhile
+        if self._entries.get(name) is indexed:
+            self._publish(name, entry)
+        return entry.data
+
+    async def load_all(self) -> None:
+        """Parses every workflow not loaded yet off the event loop, unreadable files are skipped"""
+        for name in list(self._entries):
+            if not self.is_loaded(name):
+                try:
+                    await self.load(name)
+                except KeyError:
+                    continue
+
+    def __contains__(self, name) -> bool:
+        return name in self._entries
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def save(self, name: str, workflow: dict) -> None:
+        """
+        Writes a workflow to disk and publishes it. The file is written next to its destination
+        then renamed, so concurrent readers (and other processes) never see a partial file.
+
+        :param name: Name of the workflow.
+        :param workflow: The workflow data (dictionary) to be saved.
+        """
+        import aiofiles
+
+        self.index()
+        file_path = self._file_path(name)
+        tmp_path = f"{file_path}.tmp"
+
+        # Under the refresh lock, so a refresh running meanwhile can't publish a stale index over it
+        async with self._refresh_lock:
+            async with aiofiles.open(tmp_path, "w", encoding="utf-8") as file:
+                await file.write((await cpu_executor.dumps(workflow, len(workflow))).decode("utf-8"))
+            os.replace(tmp_path, file_path)
+
+            stat = os.stat(file_path)
+            self._publish(name, WorkflowEntry(name, file_path, stat.st_mtime_ns, stat.st_size, workflow))
+            self._notify(name)
+
+    async def delete(self, name: str) -> None:
+        """
+        Removes a workflow file from disk and from the index.
+
+        :param name: Name of the workflow to be deleted.
+        """
+        file_path = self._file_path(name)
+        async with self._refresh_lock:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+            if name in self._entries:
+                self._publish(name, None)
+                self._notify(name)
+
+    async def refresh(self) -> List[str]:
+        """
+        Compares the directory against the index and applies external changes.
+        Workflows already loaded are re-parsed off the event loop, the others only get their new stat.
+
+        :return: The names of the workflows that have been added, changed or removed.
+        """
+        async with self._refresh_lock:
+            stats = await asyncio.to_thread(self._scan)
+            changed = []
+
+            for name in list(self._entries):
+                if name not in stats:
+                    self._publish(name, None)
+                    self._notify(name)
+                    changed.append(name)
+
+            for name, stat in stats.items():
+                current = self._entries.get(name)
+                if current is not None and current.same_file(stat):
+                    continue
+
+                entry = WorkflowEntry(name, self._file_path(name), stat.st_mtime_ns, stat.st_size)
+                if current is not None and current.data is not None:
+                    try:
+                        entry = await asyncio.to_thread(self._load, entry)
+                    except (OSError, json.JSONDecodeError) as e:
+                        # Keep serving the previous version, the next write will trigger a new attempt
+                        connect_print(f"Could not reload workflow '{name}', keeping previous version: {e}")
+                        self._publish(name, WorkflowEntry(
+                            name, entry.path, entry.mtime_ns, entry.size, current.data
+                        ))
+                        continue
+
+                self._publish(name, entry)
+                self._notify(name)
+                changed.append(name)
+
+            if changed:
+                connect_print(f"Workflows reloaded from disk: {', '.join(sorted(changed))}")
+            return changed
+
+    async def _watch(self):
+        """Background task refreshing the store on filesystem events or at a fixed interval"""
+        inotify = None
+        if INotify is not None:
+            try:
+                inotify = INotify()
+                inotify.add_watch(
+                    self.path,
+                    inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO
+                    | inotify_flags.MOVED_FROM | inotify_flags.DELETE | inotify_flags.CREATE,
+                )
+            except OSError:
+                inotify = None
+
+        try:
+            while True:
+                if inotify is not None:
+                    timeout_ms = int(config.WORKFLOWS_POLL_INTERVAL * 1000)
+                    events = await asyncio.to_thread(inotify.read, timeout_ms)
+                    if not events:
+                        continue
+                    # Let the writer finish a burst of events before reading the files
+                    await asyncio.sleep(config.WORKFLOWS_WATCH_DEBOUNCE)
+                else:
+                    await asyncio.sleep(config.WORKFLOWS_POLL_INTERVAL)
+
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    connect_print(f"Workflow store refresh error: {e}")
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def start_watching(self) -> None:
+        """Starts detecting external changes of the workflows directory"""
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch())
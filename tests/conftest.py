@@ -0,0 +1,199 @@
+"""
+Fixtures running ComfyUI-Connect against the fake ComfyUI of the benchmarks (see benchmarks/host.py).
+
+The connector can only be imported once per process: it is served for the whole session, in one event
+loop the tests run their coroutines in with `run`.
+"""
+import os
+import sys
+import socket
+import asyncio
+import tempfile
+import pytest
+from aiohttp import web
+
+BENCHMARKS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+sys.path.insert(0, BENCHMARKS_PATH)
+
+from fake_comfyui import FakeComfyUI, start_fake_comfyui  # noqa: E402
+from host import start_connector  # noqa: E402
+
+
+class RepositoryRoot:
+    """
+    Collects the repository root as a plain directory: it is the custom node package,
+    whose __init__.py can only be imported within ComfyUI (or by benchmarks/host.py).
+    Registered as a plugin, the hooks of this conftest only apply to the tests directory.
+    """
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_collect_directory(self, path, parent):
+        if path == parent.config.rootpath:
+            return pytest.Dir.from_parent(parent, path=path)
+
+
+def pytest_configure(config):
+    config.pluginmanager.register(RepositoryRoot(), "repository-root")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    # The background tasks of the connector (listener, watchers, monitors) are left running
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def run(loop):
+    """Runs a coroutine in the event loop of the connector"""
+    return loop.run_until_complete
+
+
+class FakeGateway:
+    """
+    Socket.IO gateway the connector connects to, sending it `run` events and recording what it sends back:
+    acknowledged results, binary chunks and heartbeats.
+    """
+
+    def __init__(self, port: int):
+        import socketio
+
+        self.port = port
+        self.sio = socketio.AsyncServer(async_mode="aiohttp", max_http_buffer_size=1024**3)
+        self.app = web.Application()
+        self.sio.attach(self.app)
+        self.runner = None
+        self.sid = None
+        self.connections = 0
+        self.connected = asyncio.Event()
+        self.results = {}  # taskId => acknowledged `return` events
+        self.manifests = {}  # taskId => `return_manifest` event
+        self.chunks = {}  # (taskId, tag, index) => {seq: data}
+        # Disconnects the connector instead of acknowledging the next `return` events
+        self.drop_returns = 0
+        self._results = {}  # taskId => future of its first acknowledged `return`
+
+        @self.sio.event
+        async def connect(sid, environ):
+            self.sid = sid
+            self.connections += 1
+            self.connected.set()
+
+        @self.sio.event
+        async def disconnect(sid, *args):
+            if sid == self.sid:
+                self.connected.clear()
+
+        @self.sio.on("return_manifest")
+        async def on_manifest(sid, data):
+            self.manifests[data["taskId"]] = data
+            return True
+
+        @self.sio.on("return_chunk")
+        async def on_chunk(sid, data):
+            self.chunks.setdefault((data["taskId"], data["tag"], data["index"]), {})[data["seq"]] = data["data"]
+            return True
+
+        @self.sio.on("return")
+        async def on_return(sid, data):
+            if self.drop_returns:
+                self.drop_returns -= 1
+                await self.sio.disconnect(sid)
+                return None
+            self.results.setdefault(data.get("taskId"), []).append(data)
+            future = self._future(data.get("taskId"))
+            if not future.done():
+                future.set_result(data)
+            return True
+
+    def _future(self, task_id) -> asyncio.Future:
+        if task_id not in self._results:
+            self._results[task_id] = asyncio.get_running_loop().create_future()
+        return self._results[task_id]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, shutdown_timeout=0.5)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", self.port).start()
+
+    async def run(self, task: dict) -> dict:
+        """Sends a task, returns its acknowledgement (accepted or rejected)"""
+        await asyncio.wait_for(self.connected.wait(), 10)
+        return await self.sio.call("run", task, to=self.sid, timeout=10)
+
+    async def result(self, task_id, timeout: float = 30) -> dict:
+        """Waits for the first acknowledged result of a task"""
+        return await asyncio.wait_for(asyncio.shield(self._future(task_id)), timeout)
+
+    def reassemble(self, task_id, tag: str, index: int = 0) -> bytes:
+        chunks = self.chunks[(task_id, tag, index)]
+        return b"".join(chunks[seq] for seq in range(len(chunks)))
+
+
+@pytest.fixture(scope="session")
+def hosted(run):
+    """The fake ComfyUI, the fake gateway, the imported package and the base URL of its routes"""
+    fake = FakeComfyUI(exec_time=0.2, output_size=1024, seed=0)
+    gateway = FakeGateway(_free_port())
+    comfy_port, port = _free_port(), _free_port()
+    fake_runner = run(start_fake_comfyui(fake, port=comfy_port))
+    run(gateway.start())
+    runner, package = run(
+        start_connector(
+            tempfile.mkdtemp(prefix="connect-tests-"), comfy_port, port=port, gateway_url=gateway.url
+        )
+    )
+    yield fake, package, f"http://127.0.0.1:{port}", gateway
+    run(package.websocket_controller.sio.disconnect())
+    run(sys.modules[f"{package.__name__}.services.comfyui_service"].comfyui_service.close())
+    run(runner.cleanup())
+    run(gateway.runner.cleanup())
+    run(fake_runner.cleanup())
+
+
+@pytest.fixture
+def comfy(hosted):
+    """The fake ComfyUI, its failure injections reset after each test"""
+    fake = hosted[0]
+    yield fake
+    fake.drop_rate = 0.0
+    fake.failure_rate = 0.0
+
+
+@pytest.fixture
+def package(hosted):
+    return hosted[1]
+
+
+@pytest.fixture
+def base_url(hosted):
+    return hosted[2]
+
+
+@pytest.fixture
+def gateway(hosted, run):
+    """The fake gateway, once the connector is connected to it"""
+    gateway = hosted[3]
+    run(asyncio.wait_for(gateway.connected.wait(), 10))
+    yield gateway
+    gateway.drop_returns = 0
+
+
+@pytest.fixture
+def websocket_controller(package):
+    return package.websocket_controller
@@ -0,0 +1,52 @@
+"""
+Gateway results with binary outputs: sent as chunked attachments described by a manifest,
+or embedded in base64 for the gateways not supporting them.
+"""
+import sys
+import uuid
+import base64
+import asyncio
+import pytest
+
+
+@pytest.fixture
+def config(package):
+    return sys.modules[f"{package.__name__}.config"].config
+
+
+def test_chunked_outputs_reassembled(gateway, comfy, config, monkeypatch, run):
+    monkeypatch.setattr(config, "GATEWAY_CHUNK_SIZE", 100)
+    monkeypatch.setattr(comfy, "outputs_per_node", 2)
+    task_id = uuid.uuid4().hex
+
+    async def scenario():
+        await gateway.run({"taskId": task_id, "name": "txt2img", "params": {}})
+        return await gateway.result(task_id)
+
+    result = run(asyncio.wait_for(scenario(), 30))
+
+    assert result["chunked"] and "image" not in result["result"]
+    chunks = -(-len(comfy.output) // 100)
+    assert gateway.manifests[task_id]["outputs"] == {
+        "image": {
+            "multiple": True,
+            "items": [{"index": index, "size": len(comfy.output), "chunks": chunks} for index in range(2)],
+        }
+    }
+    for index in range(2):
+        assert len(gateway.chunks[(task_id, "image", index)]) == chunks
+        assert gateway.reassemble(task_id, "image", index) == comfy.output
+
+
+def test_base64_outputs_without_binary_transfer(gateway, comfy, config, monkeypatch, run):
+    monkeypatch.setitem(config.user_settings, "Connect.GatewayBinaryTransfer", False)
+    task_id = uuid.uuid4().hex
+
+    async def scenario():
+        await gateway.run({"taskId": task_id, "name": "txt2img", "params": {}})
+        return await gateway.result(task_id)
+
+    result = run(asyncio.wait_for(scenario(), 30))
+
+    assert not result.get("chunked") and task_id not in gateway.manifests
+    assert base64.b64decode(result["result"]["image"]) == comfy.output
@@ -0,0 +1,119 @@
+"""
+The pool of workers running the gateway tasks: bounded concurrency, bounded queue and cancellation
+of queued tasks. Executions are replaced by a stub, only the scheduling is under test.
+"""
+import sys
+import uuid
+import asyncio
+import pytest
+
+
+@pytest.fixture
+def config(package):
+    return sys.modules[f"{package.__name__}.config"].config
+
+
+@pytest.fixture
+def executions(package, monkeypatch):
+    """Stubs the executions: records them, and holds them until `release` is set"""
+
+    class Executions:
+        def __init__(self):
+            self.started = []
+            self.active = 0
+            self.max_active = 0
+            self.release = asyncio.Event()
+
+        async def execute_workflow(self, name, params, *args, execution_id=None, **kwargs):
+            self.started.append(execution_id)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            try:
+                await self.release.wait()
+                return {"text": f"done {execution_id}"}
+            finally:
+                self.active -= 1
+
+    executions = Executions()
+    monkeypatch.setattr(package.manager, "execute_workflow", executions.execute_workflow)
+    return executions
+
+
+def _task(task_id=None) -> dict:
+    return {"taskId": task_id or uuid.uuid4().hex, "name": "txt2img", "params": {}}
+
+
+def test_concurrency_bounded_by_workers(gateway, executions, config, run):
+    tasks = [_task() for _ in range(6)]
+
+    async def scenario():
+        acks = [await gateway.run(task) for task in tasks]
+        await asyncio.sleep(0.2)
+        running = executions.active
+        executions.release.set()
+        results = [await gateway.result(task["taskId"]) for task in tasks]
+        return acks, running, results
+
+    acks, running, results = run(scenario())
+
+    assert all(ack["accepted"] for ack in acks)
+    assert running == executions.max_active == config.gateway_workers
+    assert [result["result"] for result in results] == [{"text": f"done {task['taskId']}"} for task in tasks]
+
+
+def test_full_queue_rejects_tasks(gateway, executions, config, websocket_controller, run):
+    accepted = config.gateway_workers + config.GATEWAY_QUEUE_SIZE
+    tasks = [_task() for _ in range(accepted + 2)]
+
+    async def scenario():
+        acks = []
+        for task in tasks:
+            acks.append(await gateway.run(task))
+            # Let the idle workers pick the task up
+            await asyncio.sleep(0.01)
+        executions.release.set()
+        await asyncio.gather(*(gateway.result(task["taskId"]) for task in tasks[:accepted]))
+        return acks
+
+    acks = run(scenario())
+
+    assert [ack["accepted"] for ack in acks] == [True] * accepted + [False] * 2
+    assert {ack["reason"] for ack in acks[accepted:]} == {"busy"}
+    assert acks[accepted]["queue_depth"] == config.GATEWAY_QUEUE_SIZE
+    assert websocket_controller.capacity["queue_depth"] == 0
+
+
+def test_cancelled_queued_task_not_run(gateway, executions, config, run):
+    tasks = [_task() for _ in range(config.gateway_workers + 1)]
+    queued = tasks[-1]["taskId"]
+
+    async def scenario():
+        for task in tasks:
+            await gateway.run(task)
+        await asyncio.sleep(0.1)
+        cancelled = await gateway.sio.call("cancel", {"taskId": queued}, to=gateway.sid, timeout=10)
+        executions.release.set()
+        await asyncio.gather(*(gateway.result(task["taskId"]) for task in tasks[:-1]))
+        await asyncio.sleep(0.1)
+        return cancelled
+
+    assert run(scenario()) == {"taskId": queued, "cancelled": True}
+    assert queued not in executions.started and queued not in gateway.results
+
+
+def test_tasks_without_id_run_separately(gateway, executions, run):
+    async def scenario():
+        for _ in range(2):
+            await gateway.run({"name": "txt2img", "params": {}})
+        await asyncio.sleep(0.1)
+        executions.release.set()
+        await gateway.result(None)
+        for _ in range(50):
+            if len(gateway.results.get(None, [])) == 2:
+                break
+            await asyncio.sleep(0.05)
+
+    run(scenario())
+
+    assert executions.started == [None, None]
+    assert [result.get("error") for result in gateway.results.pop(None)] == [None, None]
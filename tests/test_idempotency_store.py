@@ -0,0 +1,39 @@
+import sys
+import asyncio
+import pytest
+
+
+@pytest.fixture
+def store(package):
+    module = sys.modules[f"{package.__name__}.services.idempotency_store"]
+    return module.IdempotencyStore(ttl=600, max_entries=10, max_bytes=2500)
+
+
+async def _result(size: int) -> dict:
+    return {"image": [b"x" * size]}
+
+
+def test_oldest_results_evicted_beyond_byte_budget(store, run):
+    async def scenario():
+        for key in ("first", "second", "third"):
+            await store.run(key, key, lambda: _result(1000))
+            await asyncio.sleep(0)
+
+    run(scenario())
+
+    stats = store.stats()
+    assert stats["entries"] == 2 and stats["bytes"] == 2000 and stats["evicted"] == 1
+    # The evicted result is executed again, the kept ones are replayed
+    run(store.run("second", "second", lambda: _result(1000)))
+    run(store.run("first", "first", lambda: _result(1000)))
+    assert store.stats()["replayed"] == 1 and store.stats()["executions"] == 4
+
+
+def test_result_larger_than_budget_not_kept(store, run):
+    async def scenario():
+        result = await store.run("large", "large", lambda: _result(5000))
+        await asyncio.sleep(0)
+        return result
+
+    assert run(scenario()) == {"image": [b"x" * 5000]}
+    assert store.stats()["entries"] == 0 and store.stats()["bytes"] == 0
@@ -0,0 +1,38 @@
+import io
+import sys
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def encoding(package):
+    return sys.modules[f"{package.__name__}.services.output_encoder"]
+
+
+@pytest.fixture
+def cpu_executor(package):
+    return sys.modules[f"{package.__name__}.services.cpu_executor"].cpu_executor
+
+
+def _png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["thread", "process"])
+def test_outputs_encoded_in_the_cpu_executor_pool(encoding, cpu_executor, package, monkeypatch, run, mode):
+    config = sys.modules[f"{package.__name__}.config"].config
+    monkeypatch.setitem(config.user_settings, "Connect.CpuExecutor", mode)
+    encoder = encoding.OutputEncoder(cache_max_bytes=1024**2)
+    options = encoding.OutputOptions.from_value({"format": "jpeg", "max_width": 32, "thumbnail": 8})
+    calls = dict(cpu_executor.stats()["calls"])
+
+    output, thumbnail = run(encoder.encode(_png(64, 48), options))
+
+    assert Image.open(io.BytesIO(output)).format == "JPEG" and Image.open(io.BytesIO(output)).size == (32, 24)
+    assert max(Image.open(io.BytesIO(thumbnail)).size) == 8
+    assert cpu_executor.stats()["calls"][mode] == calls[mode] + 1
+    # Served from the cache the second time
+    assert run(encoder.encode(_png(64, 48), options)) == (output, thumbnail)
+    assert cpu_executor.stats()["calls"] == dict(calls, **{mode: calls[mode] + 1})
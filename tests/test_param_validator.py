@@ -0,0 +1,52 @@
+import sys
+import pytest
+from host import load_workflows
+
+
+@pytest.fixture
+def validator(package):
+    module = sys.modules[f"{package.__name__}.services.param_validator"]
+    return module.ParamValidator(load_workflows()["txt2img"])
+
+
+@pytest.fixture
+def validation_error(package):
+    return sys.modules[f"{package.__name__}.services.errors"].ValidationError
+
+
+@pytest.mark.parametrize("tag", ["image", "latent", "sampler"])
+def test_any_tag_can_be_bypassed(validator, tag):
+    validator.validate({tag: False})
+
+
+def test_unknown_tag_bypass_rejected(validator, validation_error):
+    with pytest.raises(validation_error) as error:
+        validator.validate({"upscale": False})
+    assert error.value.errors == [
+        "upscale: unknown tag, expected one of ['image', 'latent', 'negative', 'positive', 'sampler']."
+    ]
+
+
+def test_only_input_tags_take_inputs(validator, validation_error):
+    with pytest.raises(validation_error) as error:
+        validator.validate({"image": {"filename_prefix": "out"}, "sampler": {"steps": "20"}})
+    assert error.value.errors == [
+        "image: unknown tag, expected one of ['latent', 'negative', 'positive', 'sampler'].",
+        "sampler.steps: expected number, got str.",
+    ]
+
+
+def test_openapi_output_sinks_match_configuration(package, monkeypatch, run):
+    config = sys.modules[f"{package.__name__}.config"].config
+    generator = sys.modules[f"{package.__name__}.utils.openapi_utils"].OpenAPISpecGenerator
+    workflow = run(package.manager.get_workflow("txt2img"))
+
+    def sink_schema():
+        spec = generator([workflow]).generate()
+        request = spec["paths"]["/api/connect/workflows/txt2img"]["post"]["requestBody"]
+        return request["content"]["application/json"]["schema"]["properties"]["_output"]["properties"]["sink"]
+
+    monkeypatch.setitem(config.user_settings, "Connect.ResultSinks", {})
+    assert sink_schema() == {"type": "boolean", "enum": [False]}
+    monkeypatch.setitem(config.user_settings, "Connect.ResultSinks", {"s3": {"type": "s3"}, "archive": {"type": "local"}})
+    assert sink_schema() == {"oneOf": [{"type": "string", "enum": ["archive", "s3"]}, {"type": "boolean", "enum": [False]}]}
@@ -0,0 +1,64 @@
+"""
+The outbox of the gateway results: spooled until acknowledged, replayed after a reconnection,
+and capped in size without ever dropping the result just written.
+"""
+import sys
+import uuid
+import asyncio
+import pytest
+
+
+@pytest.fixture
+def result_outbox(package):
+    return sys.modules[f"{package.__name__}.services.result_outbox"].ResultOutbox
+
+
+def test_result_replayed_after_reconnection(gateway, comfy, package, websocket_controller, monkeypatch, run):
+    config = sys.modules[f"{package.__name__}.config"].config
+    monkeypatch.setattr(config, "GATEWAY_ACK_TIMEOUT", 1.0)
+    outbox = websocket_controller._outbox
+    connections = gateway.connections
+    # The gateway goes away instead of acknowledging the result
+    gateway.drop_returns = 1
+    task_id = uuid.uuid4().hex
+
+    async def scenario():
+        await gateway.run({"taskId": task_id, "name": "txt2img", "params": {}})
+        while gateway.connected.is_set():
+            await asyncio.sleep(0.01)
+        spooled = outbox.entries()
+        result = await gateway.result(task_id)
+        # Removed once the acknowledgement is received
+        while outbox.entries():
+            await asyncio.sleep(0.01)
+        return spooled, result
+
+    spooled, result = run(asyncio.wait_for(scenario(), 30))
+
+    assert len(spooled) == 1 and spooled[0].endswith(task_id)
+    assert result["chunked"] and gateway.reassemble(task_id, "image") == comfy.output
+    assert gateway.connections == connections + 1
+    assert len(gateway.results[task_id]) == 1
+
+
+def test_cap_keeps_the_entry_just_written(result_outbox, tmp_path, run):
+    outbox = result_outbox(str(tmp_path), max_bytes=3000, inline_max_bytes=100)
+
+    async def put(task_id, size):
+        entry_id = await outbox.put({"taskId": task_id, "result": "x" * size})
+        await outbox.enforce_cap(keep=entry_id)
+        return entry_id
+
+    async def scenario():
+        first = await put(1, 1200)
+        second = await put(2, 1200)
+        assert outbox.entries() == [first, second]
+        third = await put(3, 1200)
+        assert outbox.entries() == [second, third]
+        # Larger than the cap on its own: the older entries are dropped, not this one
+        fourth = await put(4, 5000)
+        assert outbox.entries() == [fourth]
+        return fourth
+
+    fourth = run(scenario())
+    assert run(outbox.load(fourth)) == {"taskId": 4, "result": "x" * 5000}
@@ -0,0 +1,149 @@
+import os
+import sys
+import asyncio
+import pytest
+from urllib.parse import urlsplit, parse_qs
+from aiohttp import web
+from fake_s3 import FakeS3, start_fake_s3
+
+MIB = 1024**2
+
+
+@pytest.fixture
+def local_sink(package, tmp_path):
+    module = sys.modules[f"{package.__name__}.services.result_sinks"]
+    return lambda: module.LocalSink(str(tmp_path), url="http://outputs")
+
+
+def test_deduplications_counted_once(local_sink, run):
+    sink = local_sink()
+
+    async def scenario():
+        # Identical outputs of one execution, stored concurrently
+        await asyncio.gather(*(sink.put("image/png", b"same image") for _ in range(3)))
+        await sink.put("image/png", b"same image")
+        return await sink.put("image/png", b"other image")
+
+    stored = run(scenario())
+
+    assert sink.stats() == {"stored": 2, "deduplicated": 3, "bytes": 21}
+    assert stored["url"] == f"http://outputs/{stored['key']}" and stored["key"].endswith(".png")
+
+
+def test_output_already_in_sink_not_stored_again(local_sink, run):
+    run(local_sink().put("image/png", b"same image"))
+    sink = local_sink()
+
+    async def scenario():
+        await asyncio.gather(*(sink.put("image/png", b"same image") for _ in range(2)))
+
+    run(scenario())
+
+    assert sink.stats() == {"stored": 0, "deduplicated": 2, "bytes": 0}
+
+
+class SlowPartsS3(FakeS3):
+    """Fake store taking its time for each part, recording how many were uploaded at once"""
+
+    def __init__(self):
+        super().__init__()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle(self, request):
+        if "partNumber" not in request.query:
+            return await super().handle(request)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.05)
+            return await super().handle(request)
+        finally:
+            self.in_flight -= 1
+
+
+class FailingS3(FakeS3):
+    """Fake store refusing the second part of the multipart uploads"""
+
+    async def handle(self, request):
+        if request.method == "PUT" and request.query.get("partNumber") == "2":
+            await request.read()
+            return web.Response(status=400, text="<Error><Code>InvalidPart</Code></Error>")
+        return await super().handle(request)
+
+
+@pytest.fixture
+def s3_store(request, run):
+    """Starts a fake S3 store (FakeS3 or the class given as parameter), yields it and its URL"""
+    fake = getattr(request, "param", FakeS3)()
+    runner = run(start_fake_s3(fake, port=0))
+    yield fake, f"http://127.0.0.1:{runner.addresses[0][1]}"
+    run(runner.cleanup())
+
+
+@pytest.fixture
+def s3_sink(package, s3_store):
+    pytest.importorskip("boto3")
+    module = sys.modules[f"{package.__name__}.services.result_sinks"]
+    return lambda **options: module.S3Sink(
+        "outputs", endpoint_url=s3_store[1], region="us-east-1", access_key="fake", secret_key="fake", **options
+    )
+
+
+def test_s3_small_output_put_once(s3_store, s3_sink, run):
+    fake = s3_store[0]
+    sink = s3_sink(prefix="runs/", public_url="http://cdn/outputs/")
+
+    stored = run(sink.put("image/png", b"small image"))
+
+    assert fake.stats["puts"] == 1 and fake.stats["multipart"] == 0
+    assert fake.objects[("outputs", stored["key"])] == ("image/png", b"small image")
+    assert stored["key"].startswith("runs/") and stored["url"] == f"http://cdn/outputs/{stored['key']}"
+
+
+@pytest.mark.parametrize("s3_store", [SlowPartsS3], indirect=True)
+def test_s3_large_output_uploaded_in_parts(s3_store, s3_sink, tmp_path, run):
+    fake = s3_store[0]
+    content = os.urandom(17 * MIB)
+    path = tmp_path / "video.mp4"
+    path.write_bytes(content)
+    sink = s3_sink(part_size=5 * MIB, concurrency=2)
+
+    stored = run(sink.put("video/mp4", path=str(path)))
+
+    assert fake.stats["multipart"] == 1 and fake.stats["parts"] == 4 and fake.stats["puts"] == 0
+    assert fake.max_in_flight == 2
+    assert fake.objects[("outputs", stored["key"])] == ("video/mp4", content)
+    assert fake.uploads == {}
+    # Presigned without a public URL
+    url = urlsplit(stored["url"])
+    assert url.path == f"/outputs/{stored['key']}" and {"Signature", "X-Amz-Signature"} & set(parse_qs(url.query))
+
+
+def test_s3_stored_outputs_deduplicated(s3_store, s3_sink, run):
+    fake = s3_store[0]
+    run(s3_sink().put("image/png", b"same image"))
+    sink = s3_sink()
+
+    async def scenario():
+        await asyncio.gather(*(sink.put("image/png", b"same image") for _ in range(2)))
+        await sink.put("image/png", b"other image")
+
+    run(scenario())
+
+    assert fake.stats["puts"] == 2
+    assert sink.stats() == {"stored": 1, "deduplicated": 2, "bytes": 11}
+
+
+@pytest.mark.parametrize("s3_store", [FailingS3], indirect=True)
+def test_s3_failed_multipart_upload_aborted(package, s3_store, s3_sink, run):
+    fake = s3_store[0]
+    result_sink_error = sys.modules[f"{package.__name__}.services.errors"].ResultSinkError
+    sink = s3_sink(part_size=5 * MIB, concurrency=1)
+
+    with pytest.raises(result_sink_error):
+        run(sink.put("video/mp4", os.urandom(11 * MIB)))
+
+    assert fake.stats["multipart"] == 1 and fake.stats["aborted"] == 1
+    assert fake.uploads == {} and fake.objects == {}
+    assert sink.stats()["stored"] == 0
@@ -0,0 +1,105 @@
+import sys
+import types
+import base64
+import asyncio
+import aiohttp
+import pytest
+from replay import load_trace, materialize
+
+
+@pytest.fixture
+def params_shape(package):
+    return sys.modules[f"{package.__name__}.services.traffic_recorder"].params_shape
+
+
+class KSampler:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "seed": ("INT", {"min": 0}),
+                "sampler_name": (["euler", "dpmpp_2m"],),
+                "scheduler": ("COMBO", {"options": ["normal", "karras"]}),
+            }
+        }
+
+
+@pytest.fixture
+def node_classes(package, monkeypatch):
+    """Registers the sampler node class, so its combo inputs are validated against their choices"""
+    monkeypatch.setitem(sys.modules, "nodes", types.SimpleNamespace(NODE_CLASS_MAPPINGS={"KSampler": KSampler}))
+    package.manager.validators.invalidate("txt2img")
+    yield
+    package.manager.validators.invalidate("txt2img")
+
+
+def test_strings_recorded_by_length_only(params_shape):
+    params = {
+        "positive": {"text": "a photo of my neighbour"},
+        "sampler": {"seed": 42, "cfg": 7.5, "sampler_name": "euler", "denoise": True},
+        "image": {"type": "file", "name": "holidays.png", "content": base64.b64encode(b"\x89PNG" * 8).decode()},
+    }
+
+    shape = params_shape(params)
+
+    assert shape["positive"] == {"text": {"type": "str", "length": 23}}
+    assert shape["sampler"] == {
+        "seed": 42,
+        "cfg": 7.5,
+        "sampler_name": {"type": "str", "length": 5},
+        "denoise": True,
+    }
+    assert shape["image"]["size"] == 32 and shape["image"]["extension"] == ".png"
+    assert "holidays" not in repr(shape)
+
+
+def test_replay_regenerates_by_size(params_shape):
+    shape = params_shape({"positive": {"text": "a cat"}, "image": {"type": "file", "content": "AAAA", "name": "a.jpg"}})
+
+    params = materialize(shape, {})
+
+    assert params["positive"] == {"text": "xxxxx"}
+    assert len(base64.b64decode(params["image"]["content"])) == 3
+    assert params["image"]["name"].endswith(".jpg")
+
+
+def test_choices_and_output_options_kept(params_shape):
+    schema = {"sampler": {"seed": {"type": "integer"}, "sampler_name": {"type": "string", "enum": ["euler"]}}}
+    params = {"sampler": {"seed": 42, "sampler_name": "euler"}, "_output": {"format": "webp", "sink": "archive"}}
+
+    shape = params_shape(params, schema)
+
+    assert shape == params
+    assert materialize(shape, {}) == params
+
+
+def test_recorded_request_replayed(package, base_url, node_classes, monkeypatch, tmp_path, run):
+    config = sys.modules[f"{package.__name__}.config"].config
+    recorder = sys.modules[f"{package.__name__}.services.traffic_recorder"].traffic_recorder
+    monkeypatch.setitem(config.user_settings, "Connect.TrafficRecording", True)
+    monkeypatch.setitem(config.user_settings, "Connect.TrafficSampleRate", 1)
+    monkeypatch.setattr(recorder, "path", str(tmp_path))
+    params = {
+        "positive": {"text": "a photo of my neighbour"},
+        "sampler": {"seed": 7, "sampler_name": "dpmpp_2m", "scheduler": "karras"},
+        "_output": {"sink": False, "quality": 90},
+    }
+
+    async def execute(session, payload):
+        async with session.post(f"{base_url}/connect/workflows/txt2img", json=payload) as response:
+            return response.status
+
+    async def scenario():
+        async with aiohttp.ClientSession() as session:
+            assert await execute(session, params) == 200
+            while recorder._pending:
+                await asyncio.sleep(0.01)
+            monkeypatch.setitem(config.user_settings, "Connect.TrafficRecording", False)
+            replayed = materialize(load_trace([str(tmp_path)])[0]["params"], {})
+            return replayed, await execute(session, replayed)
+
+    replayed, status = run(asyncio.wait_for(scenario(), 30))
+
+    assert status == 200
+    assert replayed["sampler"] == params["sampler"] and replayed["_output"] == params["_output"]
+    assert replayed["positive"] == {"text": "x" * len(params["positive"]["text"])}
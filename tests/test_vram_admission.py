@@ -0,0 +1,134 @@
+"""
+VRAM admission against a fake GPU (benchmarks/fake_nvml.py), the expected allocations of the workflows
+being recorded as their profiles instead of learned from prompts.
+"""
+import sys
+import asyncio
+import pytest
+import fake_nvml
+
+TOTAL_MB = 10000
+IDLE_MB = 1000
+
+
+@pytest.fixture
+def gpu(package, monkeypatch):
+    gpu = fake_nvml.FakeGpu(total_mb=TOTAL_MB, used_mb=IDLE_MB)
+    monkeypatch.setitem(sys.modules, "pynvml", fake_nvml)
+    monkeypatch.setattr(fake_nvml, "gpus", [gpu])
+    monkeypatch.setattr(sys.modules[f"{package.__name__}.utils.gpu_utils"], "_nvml_initialized", False)
+    return gpu
+
+
+@pytest.fixture
+def admission(package, gpu, monkeypatch):
+    config = sys.modules[f"{package.__name__}.config"].config
+    monkeypatch.setitem(config.user_settings, "Connect.VramAdmission", True)
+    monkeypatch.setitem(config.user_settings, "Connect.VramHeadroomPercent", 0)
+
+    module = sys.modules[f"{package.__name__}.services.vram_admission"]
+    admission = module.VramAdmission(interval=0.01, profile_runs=3)
+    for name, expected in {"light": 2000, "heavy": 6000, "huge": 9500, "giant": 12000}.items():
+        admission.profiles[name] = module.VramProfile(3)
+        admission.profiles[name].record(IDLE_MB, IDLE_MB + expected)
+    return admission
+
+
+@pytest.fixture
+def deadline(package):
+    return sys.modules[f"{package.__name__}.utils.deadline"].Deadline
+
+
+async def _hold(admission, deadline, name: str, events: list, release: asyncio.Event):
+    async with admission.admit(name, deadline(30)):
+        events.append(f"admitted {name}")
+        await release.wait()
+    events.append(f"released {name}")
+
+
+def test_held_executions_admitted_in_arrival_order(admission, deadline, run):
+    events = []
+
+    async def scenario():
+        releases = {name: asyncio.Event() for name in ("heavy", "heavy-2", "light")}
+        first = asyncio.create_task(_hold(admission, deadline, "heavy", events, releases["heavy"]))
+        await asyncio.sleep(0.05)
+        # Doesn't fit next to the first one, and the light one doesn't overtake it
+        second = asyncio.create_task(_hold(admission, deadline, "heavy", events, releases["heavy-2"]))
+        await asyncio.sleep(0.05)
+        third = asyncio.create_task(_hold(admission, deadline, "light", events, releases["light"]))
+        await asyncio.sleep(0.05)
+        assert events == ["admitted heavy"] and admission.waiting == 2
+
+        releases["heavy"].set()
+        await asyncio.sleep(0.05)
+        for release in releases.values():
+            release.set()
+        await asyncio.gather(first, second, third)
+
+    run(asyncio.wait_for(scenario(), 10))
+
+    assert events[:4] == ["admitted heavy", "released heavy", "admitted heavy", "admitted light"]
+    assert admission.waiting == 0 and admission.stats()["admitted"] == 0
+    assert admission.stats()["counts"]["held"] == 2
+    # The samples taken when the executions started are done and released
+    assert not admission._samples
+
+
+def test_estimate_larger_than_gpu_rejected(package, admission, deadline, run):
+    vram_exceeded = sys.modules[f"{package.__name__}.services.errors"].VramExceeded
+
+    async def scenario():
+        async with admission.admit("giant", deadline(30)):
+            pass
+
+    with pytest.raises(vram_exceeded):
+        run(asyncio.wait_for(scenario(), 1))
+    assert admission.waiting == 0 and admission.stats()["counts"]["rejected"] == 1
+
+
+def test_estimate_larger_than_free_memory_admitted_alone(admission, deadline, run):
+    events = []
+
+    async def scenario():
+        release = asyncio.Event()
+        light = asyncio.create_task(_hold(admission, deadline, "light", events, release))
+        await asyncio.sleep(0.05)
+        # Fits in the GPU, not next to the other one: held until it is alone, not forever
+        huge = asyncio.create_task(_hold(admission, deadline, "huge", events, asyncio.Event()))
+        await asyncio.sleep(0.05)
+        assert events == ["admitted light"]
+        release.set()
+        await asyncio.sleep(0.05)
+        assert events == ["admitted light", "released light", "admitted huge"]
+        huge.cancel()
+
+    run(asyncio.wait_for(scenario(), 10))
+    assert admission.stats()["counts"]["forced"] == 1
+    assert admission.stats()["admitted"] == 0
+
+
+def test_cancelled_waiter_releases_its_slot(admission, deadline, run):
+    events = []
+
+    async def scenario():
+        release = asyncio.Event()
+        first = asyncio.create_task(_hold(admission, deadline, "heavy", events, release))
+        await asyncio.sleep(0.05)
+        cancelled = asyncio.create_task(_hold(admission, deadline, "heavy", events, asyncio.Event()))
+        await asyncio.sleep(0.05)
+        # Held behind the cancelled one, it must not wait for it
+        light = asyncio.create_task(_hold(admission, deadline, "light", events, release))
+        await asyncio.sleep(0.05)
+        assert admission.waiting == 2
+
+        cancelled.cancel()
+        await asyncio.sleep(0.05)
+        assert events == ["admitted heavy", "admitted light"]
+        assert admission.waiting == 0
+
+        release.set()
+        await asyncio.gather(first, light)
+
+    run(asyncio.wait_for(scenario(), 10))
+    assert admission.stats()["admitted"] == 0
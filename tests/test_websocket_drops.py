@@ -0,0 +1,81 @@
+"""
+The websocket to ComfyUI dropping while prompts execute: every prompt must still resolve, exactly once,
+from the reconnection reconciliation or /history when its messages were lost.
+"""
+import sys
+import asyncio
+import aiohttp
+import pytest
+
+REQUESTS = 12
+CONCURRENCY = 4
+
+
+def _comfyui_service(package):
+    return sys.modules[f"{package.__name__}.services.comfyui_service"].comfyui_service
+
+
+async def _run_concurrently(calls: list, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(call):
+        async with semaphore:
+            return await call()
+
+    return await asyncio.gather(*(limited(call) for call in calls))
+
+
+@pytest.mark.parametrize("drop_rate", [0.5, 1.0])
+def test_http_executions_resolve_once(comfy, package, base_url, run, drop_rate):
+    comfy.drop_rate = drop_rate
+    prompts = comfy.stats["prompts"]
+    drops = comfy.stats["drops"]
+
+    async def execute(session, index):
+        async with session.post(
+            f"{base_url}/connect/workflows/txt2img",
+            json={"sampler": {"seed": index}},
+            headers={"X-Request-Id": f"drop-{drop_rate}-{index}"},
+        ) as response:
+            return response.status, await response.json()
+
+    async def scenario():
+        async with aiohttp.ClientSession() as session:
+            calls = [lambda index=index: execute(session, index) for index in range(REQUESTS)]
+            return await _run_concurrently(calls, CONCURRENCY)
+
+    responses = run(asyncio.wait_for(scenario(), 60))
+
+    assert [status for status, _ in responses] == [200] * REQUESTS
+    assert all(body["status"] == "success" and body["result"]["image"] for _, body in responses)
+    # Each execution queued one prompt, never requeued after a drop
+    assert comfy.stats["prompts"] - prompts == REQUESTS
+    assert comfy.stats["drops"] > drops
+
+    service = _comfyui_service(package)
+    assert service._prompt_events == {}
+    assert service._prompt_outputs == {}
+
+
+def test_outputs_delivered_once(comfy, package, run):
+    comfy.drop_rate = 1.0
+    delivered = {}
+
+    def on_output(index):
+        async def deliver(tag, value, thumbnail, media_type):
+            delivered.setdefault(index, []).append(tag)
+
+        return deliver
+
+    calls = [
+        lambda index=index: package.manager.execute_workflow(
+            "txt2img", {"sampler": {"seed": index}}, on_output=on_output(index)
+        )
+        for index in range(REQUESTS)
+    ]
+    results = run(asyncio.wait_for(_run_concurrently(calls, CONCURRENCY), 60))
+
+    assert all(result["image"] for result in results)
+    # The `executed` message and the history both tell the outputs, they are handed over only once
+    assert delivered == {index: ["image"] for index in range(REQUESTS)}
+    assert not _comfyui_service(package)._reconcile_tasks
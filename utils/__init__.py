@@ -1,6 +1,6 @@
 # Utils package for ComfyUI-Connect
 # Contains utility functions and helpers
 
-from .helpers import connect_print
+from .helpers import connect_print, content_disposition
 from .gpu_utils import get_gpu_info, log_gpu_info
 from .openapi_utils import OpenAPISpecGenerator 
\ No newline at end of file
@@ -0,0 +1,47 @@
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request deadline expires before its execution is finished"""
+
+
+class Deadline:
+    """
+    Absolute deadline of a request, shared by every phase of its execution
+    (file ingestion, ComfyUI queue wait and execution).
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout if timeout else None
+
+    @classmethod
+    def from_value(cls, value) -> "Deadline":
+        """
+        Builds a deadline from a number of seconds given by a client (header, payload field or setting).
+        Empty values mean no deadline.
+
+        :raises ValueError: If the value is not a positive number.
+        """
+        if value is None or value == "":
+            return cls()
+        timeout = float(value)
+        if timeout <= 0:
+            raise ValueError(f"Timeout must be a positive number of seconds, got {value}.")
+        return cls(timeout)
+
+    def remaining(self) -> Optional[float]:
+        """Returns the seconds left before the deadline (0 if expired), or None without deadline"""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self, phase: str) -> None:
+        """Raises DeadlineExceeded if the deadline has expired"""
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline of {self.timeout}s exceeded during {phase}.")
@@ -1,4 +1,3 @@
-import pynvml
 import time
 from .helpers import connect_print
 from ..config import config
@@ -6,6 +5,9 @@ from ..config import config
 def get_gpu_info():
     """Retrieves detailed information about installed NVIDIA GPUs"""
     try:
+        # Imported on first use, so loading the plugin doesn't pay for it
+        import pynvml
+
         # Initialize NVML
         pynvml.nvmlInit()
         
@@ -138,6 +140,29 @@ def get_gpu_info():
         connect_print(f"Error retrieving GPU info: {str(e)}")
         return {"error": str(e), "timestamp": time.time()}
 
+_nvml_initialized = False
+
+
+def get_memory_usage(index: int = 0) -> dict:
+    """
+    Samples the memory of a GPU, cheap enough to be called several times per second:
+    NVML stays initialized between calls, and only the memory is queried.
+
+    :param index: The NVML index of the GPU.
+    :return: The used and total memory, in MB.
+    :raises ImportError: If pynvml is not installed.
+    """
+    global _nvml_initialized
+    import pynvml
+
+    if not _nvml_initialized:
+        # NVML initializations are reference counted, get_gpu_info's shutdowns don't close this one
+        pynvml.nvmlInit()
+        _nvml_initialized = True
+    memory = pynvml.nvmlDeviceGetMemoryInfo(pynvml.nvmlDeviceGetHandleByIndex(index))
+    return {"used": memory.used / 1024**2, "total": memory.total / 1024**2}
+
+
 def log_gpu_info(gpu_info):
     """Displays the most important GPU information in a condensed format"""
     if "error" in gpu_info:
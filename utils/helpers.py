@@ -1,4 +1,16 @@
+from urllib.parse import quote
+
+
 def connect_print(message):
     """Print with standardized format for ComfyUI-Connect logs"""
     plugin_name = "ComfyUI-Connect"
-    print(f"⚡ {plugin_name} | {message}") 
\ No newline at end of file
+    print(f"⚡ {plugin_name} | {message}") 
+
+
+def content_disposition(disposition: str, filename: str) -> str:
+    """
+    Builds a Content-Disposition header (RFC 6266): the exact file name UTF-8 encoded in `filename*`,
+    an ASCII fallback without quotes, backslashes or control characters in `filename`.
+    """
+    fallback = "".join(char if " " <= char <= "~" and char not in '"\\' else "_" for char in filename)
+    return f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
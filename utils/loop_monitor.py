@@ -0,0 +1,50 @@
+import asyncio
+from collections import deque
+from typing import Optional
+from ..config import config
+
+
+class LoopLagMonitor:
+    """
+    Measures the event loop lag: how late a task sleeping for a fixed interval is woken up.
+    Anything blocking the loop shared with the ComfyUI server (CPU-bound work, blocking I/O) shows up here.
+    """
+
+    def __init__(self, interval: float, window: float):
+        self.interval = interval
+        self.window = window
+        self._samples = deque(maxlen=max(int(window / interval), 1))
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self._samples.append(max(loop.time() - start - self.interval, 0.0))
+
+    def start(self) -> None:
+        """Starts sampling in the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stats(self) -> dict:
+        """Lag percentiles (in milliseconds) over the last window"""
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0, "window": self.window}
+
+        def percentile(percent: float) -> float:
+            return round(samples[min(int(round(percent / 100 * (len(samples) - 1))), len(samples) - 1)] * 1000, 3)
+
+        return {
+            "samples": len(samples),
+            "window": round(len(samples) * self.interval, 1),
+            "p50": percentile(50),
+            "p99": percentile(99),
+            "max": round(samples[-1] * 1000, 3),
+        }
+
+
+# Global monitor instance, started with the server
+loop_monitor = LoopLagMonitor(config.LOOP_LAG_INTERVAL, config.LOOP_LAG_WINDOW)
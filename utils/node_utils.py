@@ -0,0 +1,27 @@
+from ..config import config
+
+
+def get_node_class(class_type: str):
+    """Returns the ComfyUI node class registered for a class_type, or None if unknown"""
+    try:
+        import nodes
+    except ImportError:
+        return None
+    return nodes.NODE_CLASS_MAPPINGS.get(class_type)
+
+
+def get_output_node_classes() -> frozenset:
+    """
+    Returns the class_type of every node ComfyUI considers as an output (OUTPUT_NODE = True),
+    falling back to the configured list when the node registry is not available.
+    """
+    try:
+        import nodes
+    except ImportError:
+        return frozenset(config.OUTPUT_NODE_CLASSES)
+
+    return frozenset(
+        class_type
+        for class_type, node_class in nodes.NODE_CLASS_MAPPINGS.items()
+        if getattr(node_class, "OUTPUT_NODE", False)
+    ) | frozenset(config.OUTPUT_NODE_CLASSES)
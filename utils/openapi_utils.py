@@ -33,6 +33,11 @@ class OpenAPISpecGenerator:
             "paths": {},
         }
 
+        # Result sink of the outputs: a configured sink, or false to return them inline
+        sink_schema = {"type": "boolean", "enum": [False]}
+        if config.result_sinks:
+            sink_schema = {"oneOf": [{"type": "string", "enum": sorted(config.result_sinks)}, sink_schema]}
+
         # For each workflow, create a route (POST) and describe its inputs/outputs
         for workflow in self.workflows:
             workflow_name = workflow["name"]
@@ -42,13 +47,16 @@ class OpenAPISpecGenerator:
             required_inputs = []
 
             # Each key in "inputs" is a group (e.g. sampler, checkpoint, etc.)
+            schemas = workflow.get("schema", {})
             for group_name, fields in workflow["inputs"].items():
                 group_properties = {}
                 group_required = []
 
                 # fields is a dict (e.g. {"seed": "int", "steps": "int", "cfg": "int"})
                 for field_name, field_type in fields.items():
-                    group_properties[field_name] = self.map_type_to_openapi(field_type)
+                    # The validator schema (ranges, choices) when available, the raw type otherwise
+                    field_schema = schemas.get(group_name, {}).get(field_name)
+                    group_properties[field_name] = field_schema or self.map_type_to_openapi(field_type)
                     group_required.append(field_name)
 
                 # Schéma de l'objet (group) classique
@@ -64,6 +72,19 @@ class OpenAPISpecGenerator:
                 request_properties[group_name] = group_schema
                 required_inputs.append(group_name)
 
+            # Output options, common to every workflow
+            request_properties["_output"] = {
+                "type": "object",
+                "properties": {
+                    "format": {"type": "string", "enum": ["png", "jpeg", "webp", "avif"]},
+                    "quality": {"type": "integer", "minimum": 1, "maximum": 100},
+                    "max_width": {"type": "integer", "minimum": 1},
+                    "max_height": {"type": "integer", "minimum": 1},
+                    "thumbnail": {"type": "integer", "minimum": 1},
+                    "sink": sink_schema,
+                },
+            }
+
             request_schema = {"type": "object", "properties": request_properties}
             if required_inputs:
                 request_schema["required"] = required_inputs
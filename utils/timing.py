@@ -0,0 +1,41 @@
+import time
+from contextlib import contextmanager
+
+
+class ExecutionTimer:
+    """
+    Collects the phase durations and counters of a workflow execution,
+    printed as a single line at the end of the execution.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.phases = {}  # phase name => duration in seconds
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Measures the duration of a phase, durations of a phase entered several times are summed"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def set(self, key: str, value) -> None:
+        self.counters[key] = value
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "phases": {name: round(duration * 1000, 3) for name, duration in self.phases.items()},
+            "counters": dict(self.counters),
+        }
+
+    def format_phases(self) -> str:
+        parts = [f"{name} {duration * 1000:.1f}ms" for name, duration in self.phases.items()]
+        parts += [f"{key}={value}" for key, value in self.counters.items()]
+        return " | ".join(parts)
+
+    def summary(self) -> str:
+        return f"Workflow '{self.name}' | {self.format_phases()}"